@@ -1,6 +1,67 @@
-from django.contrib import admin
+import datetime
 
-from boating.models import HirePoint, OpeningTimes, Boat, Booking
+from django.conf.urls import url
+from django.contrib import admin, messages
+from django.core.urlresolvers import reverse
+from django.http import HttpResponseRedirect, QueryDict
+from django.template.response import TemplateResponse
+from django.utils.six.moves.urllib.parse import urlencode
+
+from boating import analytics, routers
+from boating.forms import UtilizationForm
+from boating.models import HirePoint, OpeningTimes, Boat, Booking, BookingSeries, ArchivedBooking
+
+HIRE_POINT_REQUIRED = 'Filter the list by hire point to open its %s, the ids are only unique inside every shard'
+
+
+class ShardedAdminMixin(object):
+    """
+    The forms and lists read the rows from the shard of the hire point the changelist is filtered by,
+    or from the default database when it is not filtered. With shards an object is only opened from a
+    filtered changelist, which gives its hire point to the links, otherwise another one with the same id
+    could be shown
+    """
+
+    def get_hire_point_id(self, request, object_id=None):
+        filters = request.GET
+        if '_changelist_filters' in request.GET:
+            filters = QueryDict(request.GET['_changelist_filters'])
+        return filters.get('hire_point__id__exact')
+
+    def _is_shard_unknown(self, hire_point_id, object_id):
+        return object_id is not None and hire_point_id is None and len(routers.get_shards()) > 1
+
+    def _redirect_to_changelist(self, request):
+        opts = self.model._meta
+        self.message_user(request, HIRE_POINT_REQUIRED % opts.verbose_name, messages.WARNING)
+        return HttpResponseRedirect(reverse('admin:%s_%s_changelist' % (opts.app_label, opts.model_name)))
+
+    def changelist_view(self, request, extra_context=None):
+        with routers.use_shard(self.get_hire_point_id(request)):
+            return routers.render(super(ShardedAdminMixin, self).changelist_view(request, extra_context))
+
+    def changeform_view(self, request, object_id=None, form_url='', extra_context=None):
+        hire_point_id = self.get_hire_point_id(request, object_id)
+        if self._is_shard_unknown(hire_point_id, object_id):
+            return self._redirect_to_changelist(request)
+        with routers.use_shard(hire_point_id):
+            return routers.render(
+                super(ShardedAdminMixin, self).changeform_view(request, object_id, form_url, extra_context)
+            )
+
+    def delete_view(self, request, object_id, extra_context=None):
+        hire_point_id = self.get_hire_point_id(request, object_id)
+        if self._is_shard_unknown(hire_point_id, object_id):
+            return self._redirect_to_changelist(request)
+        with routers.use_shard(hire_point_id):
+            return routers.render(super(ShardedAdminMixin, self).delete_view(request, object_id, extra_context))
+
+    def history_view(self, request, object_id, extra_context=None):
+        hire_point_id = self.get_hire_point_id(request, object_id)
+        if self._is_shard_unknown(hire_point_id, object_id):
+            return self._redirect_to_changelist(request)
+        with routers.use_shard(hire_point_id):
+            return routers.render(super(ShardedAdminMixin, self).history_view(request, object_id, extra_context))
 
 
 class OpeningTimesInline(admin.TabularInline):
@@ -13,17 +74,69 @@ class HirePointBoatInline(admin.TabularInline):
     extra = 0
 
 
-class HirePointAdmin(admin.ModelAdmin):
+class HirePointAdmin(ShardedAdminMixin, admin.ModelAdmin):
     model = HirePoint
     inlines = [HirePointBoatInline, OpeningTimesInline]
+    actions = ['utilization_report']
+
+    def get_hire_point_id(self, request, object_id=None):
+        return object_id
+
+    def get_urls(self):
+        return [
+            url(r'^utilization/$', self.admin_site.admin_view(self.utilization_view),
+                name='boating_hirepoint_utilization'),
+        ] + super(HirePointAdmin, self).get_urls()
+
+    def utilization_report(self, request, queryset):
+        today = datetime.date.today()
+        parameters = [('start', (today - datetime.timedelta(days=30)).isoformat()), ('end', today.isoformat())]
+        parameters.extend(('hire_point', _pk) for _pk in queryset.values_list('pk', flat=True))
+        return HttpResponseRedirect('%s?%s' % (reverse('admin:boating_hirepoint_utilization'), urlencode(parameters)))
+    utilization_report.short_description = 'Utilization report of the selected hire points'
+
+    def utilization_view(self, request):
+        """
+        Utilization of the hire points and their boats between two dates
+        """
+        form = UtilizationForm(request.GET or None)
+        report = None
+        if form.is_valid():
+            report = analytics.get_utilization(
+                form.cleaned_data['start'], form.cleaned_data['end'],
+                hire_point_ids=form.cleaned_data['hire_point'] or None,
+                include_archived=form.cleaned_data['include_archived']
+            )
+        context = dict(
+            self.admin_site.each_context(request), title='Utilization', opts=self.model._meta, form=form, report=report
+        )
+        return TemplateResponse(request, 'admin/boating/hirepoint/utilization.html', context)
 
 
 admin.site.register(HirePoint, HirePointAdmin)
 
 
-class BookingAdmin(admin.ModelAdmin):
+class BookingAdmin(ShardedAdminMixin, admin.ModelAdmin):
     model = Booking
     list_filter = ('hire_point',)
 
 
 admin.site.register(Booking, BookingAdmin)
+
+
+class BookingSeriesAdmin(ShardedAdminMixin, admin.ModelAdmin):
+    model = BookingSeries
+    list_filter = ('hire_point',)
+    list_display = ('name', 'hire_point', 'start_time', 'duration', 'occurrences', 'every')
+
+
+admin.site.register(BookingSeries, BookingSeriesAdmin)
+
+
+class ArchivedBookingAdmin(ShardedAdminMixin, admin.ModelAdmin):
+    model = ArchivedBooking
+    list_filter = ('hire_point',)
+    list_display = ('name', 'hire_point', 'start_time', 'end_time')
+
+
+admin.site.register(ArchivedBooking, ArchivedBookingAdmin)
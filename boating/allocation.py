@@ -0,0 +1,79 @@
+"""
+Strategies to select the boats a party would use, BOATING_ALLOCATION_STRATEGY chooses one of them.
+A strategy receives the boats not in use, sorted by seats, and the number of people and
+returns a list of boats or None if there is not enough space
+"""
+MEMO_SIZE = 10000
+
+_memo = {}
+
+
+def greedy(free_boats, people):
+    """
+    Takes the smallest boats until everybody fits, unless a boat has the exact number of seats
+    """
+    selected_boats = []
+    boats_allocations = 0
+    for free_boat in free_boats:
+        if free_boat.seats == people:  # perfect match
+            return [free_boat]
+        elif people > boats_allocations:  # if the space is still not enough
+            boats_allocations += free_boat.seats
+            selected_boats.append(free_boat)
+        elif free_boat.seats > people:  # it's not necessary keep looking
+            break
+
+    if people <= boats_allocations:
+        return selected_boats
+    else:
+        return None
+
+
+def _solve(seats, people):
+    """
+    Finds the boats with the fewest seats left empty and then the fewest boats
+    :param seats: seats of every boat
+    :param people:
+    :return: A tuple with the seats of the boats selected or None
+    """
+    if not seats or sum(seats) < people:
+        return None
+    # a selection wasting a whole boat is never the best one, so no total beyond this limit is needed
+    limit = people + max(seats) - 1
+    # fewest boats reaching every total, as the seats of those boats
+    selections = [()] + [None] * limit
+    for boat_seats in seats:
+        for total in range(limit, boat_seats - 1, -1):
+            previous = selections[total - boat_seats]
+            if previous is not None and (selections[total] is None or len(previous) + 1 < len(selections[total])):
+                selections[total] = previous + (boat_seats,)
+
+    for total in range(people, limit + 1):
+        if selections[total] is not None:
+            return selections[total]
+    return None
+
+
+def optimal(free_boats, people):
+    """
+    Exact solution with the fewest seats left empty and then the fewest boats.
+    Solutions are remembered by the seats of the free boats, so every slot with the same free boats
+    is solved once
+    """
+    free_boats = list(free_boats)
+    key = (tuple(_boat.seats for _boat in free_boats), people)
+    if key not in _memo:
+        if len(_memo) >= MEMO_SIZE:
+            _memo.clear()
+        _memo[key] = _solve(key[0], people)
+    selection = _memo[key]
+    if selection is None:
+        return None
+
+    selected_boats = []
+    pending = list(selection)
+    for free_boat in free_boats:
+        if free_boat.seats in pending:
+            pending.remove(free_boat.seats)
+            selected_boats.append(free_boat)
+    return selected_boats
@@ -0,0 +1,224 @@
+"""
+Utilization of the boats and hire points over a date range.
+
+The bookings are read with iterator() in chunks and marked on a grid with one row per boat and day and one
+column per slot of SLOT_TIME minutes, every figure is then computed with NumPy over the whole grid
+"""
+import datetime
+import itertools
+
+import numpy
+from django.conf import settings
+from django.utils import timezone
+
+from boating import reference, routers
+from boating.models import ArchivedBooking, BoatOccupancy, SLOT_TIME
+
+SLOTS_PER_HOUR = 60 // SLOT_TIME
+SLOTS_PER_DAY = 24 * SLOTS_PER_HOUR
+CHUNK_SIZE = 5000  # rows converted to arrays at once
+PEAK_HOURS = 3
+
+
+def _iter_chunks(rows, chunk_size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class _Clock(object):
+    """
+    Converts the times read from the database to local slots counted from an origin. The aware times
+    are taken to UTC and the offset of the local time zone is looked up once per hour instead of once per time
+    """
+    epoch = datetime.datetime(1970, 1, 1)
+
+    def __init__(self, origin, number_of_slots):
+        self.origin = self._to_minutes(numpy.array([origin], dtype='datetime64[m]'))[0]
+        self.number_of_slots = number_of_slots
+        self.offsets = {}  # minutes by hour since the epoch in UTC
+
+    def _to_minutes(self, times):
+        return (times - numpy.datetime64(self.epoch, 'm')).astype(numpy.int64)
+
+    def _get_offset(self, hour):
+        if hour not in self.offsets:
+            utc_time = timezone.make_aware(self.epoch + datetime.timedelta(hours=int(hour)), timezone.utc)
+            self.offsets[hour] = int(timezone.localtime(utc_time).utcoffset().total_seconds()) // 60
+        return self.offsets[hour]
+
+    def get_slots(self, times, round_up=False):
+        """
+        :param times: sequence of datetimes
+        :param round_up: a time inside a slot gives the next slot instead of the one containing it
+        :return: An array with the slot of every time, clipped between 0 and the number of slots
+        """
+        if not settings.USE_TZ:
+            minutes = self._to_minutes(numpy.array(times, dtype='datetime64[m]'))
+        else:
+            minutes = self._to_minutes(numpy.array(
+                [_time.replace(tzinfo=None) - _time.utcoffset() for _time in times], dtype='datetime64[m]'
+            ))
+            hours, indexes = numpy.unique(minutes // 60, return_inverse=True)
+            minutes += numpy.array([self._get_offset(_hour) for _hour in hours], dtype=numpy.int64)[indexes]
+        minutes -= self.origin
+        if round_up:
+            minutes += SLOT_TIME - 1
+        return numpy.clip(minutes // SLOT_TIME, 0, self.number_of_slots)
+
+
+def get_open_grid(config, start_date, days):
+    """
+    :param config: HirePointConfig
+    :param start_date:
+    :param days:
+    :return: A boolean array with one row per day and one column per slot, true when the hire point is open
+    """
+    slot_minutes = numpy.arange(SLOTS_PER_DAY) * SLOT_TIME
+    week = numpy.zeros((8, SLOTS_PER_DAY), dtype=bool)  # by isoweekday
+    for day, opening_time in config.opening_times.items():
+        from_minutes = opening_time.from_hour.hour * 60 + opening_time.from_hour.minute
+        to_minutes = opening_time.to_hour.hour * 60 + opening_time.to_hour.minute
+        week[day] = (slot_minutes >= from_minutes) & (slot_minutes + SLOT_TIME <= to_minutes)
+    weekdays = (numpy.arange(days) + start_date.isoweekday() - 1) % 7 + 1
+    return week[weekdays]
+
+
+def _get_boat_intervals(hire_point_id, start_time, end_time, include_archived):
+    """
+    :return: An iterator of (boat id, start time, end time, booking id, number of people) tuples
+    """
+    database = routers.get_shard(hire_point_id)
+    intervals = BoatOccupancy.objects.using(database).filter(
+        hire_point_id=hire_point_id, start_time__lt=end_time, end_time__gt=start_time
+    ).values_list('boat_id', 'start_time', 'end_time', 'booking_id', 'booking__number_of_people').iterator()
+    if not include_archived:
+        return intervals
+    archived = ArchivedBooking.boats.through.objects.using(database).filter(
+        archivedbooking__hire_point_id=hire_point_id, archivedbooking__start_time__lt=end_time,
+        archivedbooking__end_time__gt=start_time
+    ).values_list(
+        'boat_id', 'archivedbooking__start_time', 'archivedbooking__end_time', 'archivedbooking_id',
+        'archivedbooking__number_of_people'
+    ).iterator()
+    return itertools.chain(intervals, archived)
+
+
+def get_busy_grid(config, start_date, days, include_archived=False, chunk_size=CHUNK_SIZE):
+    """
+    :param config: HirePointConfig
+    :param start_date:
+    :param days:
+    :param include_archived: take into account the archived bookings too
+    :param chunk_size: rows converted to arrays at once
+    :return: A boolean array with one row per boat, sorted as in the config, and day and one column per slot,
+    true when the boat is in use, and a dictionary with the slots booked inside the date range by people
+    of every booking id
+    """
+    origin = datetime.datetime.combine(start_date, datetime.time.min)
+    clock = _Clock(origin, days * SLOTS_PER_DAY)
+    boat_indexes = dict((_boat.id, _index) for _index, _boat in enumerate(config.boats))
+    # +1 where a booking starts and -1 where it ends, the running sum is the number of bookings of the boat
+    changes = numpy.zeros((len(config.boats), clock.number_of_slots + 1), dtype=numpy.int32)
+    people_slots = {}
+    intervals = _get_boat_intervals(
+        config.hire_point.pk, origin, origin + datetime.timedelta(days=days), include_archived
+    )
+    for chunk in _iter_chunks(intervals, chunk_size):
+        boat_ids, start_times, end_times, booking_ids, people = zip(*chunk)
+        boats = numpy.array([boat_indexes.get(_boat_id, -1) for _boat_id in boat_ids], dtype=numpy.int64)
+        known = boats >= 0  # the boat may have been moved to another hire point
+        start_slots = clock.get_slots(start_times)
+        end_slots = clock.get_slots(end_times, round_up=True)
+        numpy.add.at(changes, (boats[known], start_slots[known]), 1)
+        numpy.add.at(changes, (boats[known], end_slots[known]), -1)
+        # every boat of a booking gives the same value
+        people_slots.update(zip(booking_ids, (end_slots - start_slots) * numpy.array(people, dtype=numpy.int64)))
+    busy = numpy.cumsum(changes[:, :-1], axis=1) > 0
+    return busy.reshape(len(config.boats), days, SLOTS_PER_DAY), people_slots
+
+
+def _ratio(numerator, denominator):
+    return round(float(numerator) / denominator, 4) if denominator else None
+
+
+def _to_hours(slots):
+    return round(float(slots) / SLOTS_PER_HOUR, 2)
+
+
+def get_hire_point_utilization(config, start_date, end_date, include_archived=False):
+    """
+    :param config: HirePointConfig
+    :param start_date: first day included
+    :param end_date: last day included
+    :param include_archived: take into account the archived bookings too
+    :return: A dictionary with the figures of the hire point and of every boat, the hours are boat hours
+    and the seat hours are seats by hours
+    """
+    days = (end_date - start_date).days + 1
+    open_grid = get_open_grid(config, start_date, days)
+    booked, people_slots = get_busy_grid(config, start_date, days, include_archived)
+    busy = booked & open_grid
+    number_of_boats = len(config.boats)
+    open_slots = int(open_grid.sum())
+
+    boats_in_use = busy.sum(axis=0)  # by day and slot
+    hour_in_use = boats_in_use.reshape(days, 24, SLOTS_PER_HOUR).sum(axis=(0, 2))
+    hour_open = open_grid.reshape(days, 24, SLOTS_PER_HOUR).sum(axis=(0, 2)) * number_of_boats
+    hourly_utilization = [_ratio(_in_use, _open) for _in_use, _open in zip(hour_in_use, hour_open)]
+    peak_hours = sorted(
+        (_hour for _hour in range(24) if hourly_utilization[_hour]), key=lambda _hour: -hourly_utilization[_hour]
+    )[:PEAK_HOURS]
+    sold_out = open_grid & (boats_in_use >= number_of_boats) if number_of_boats else numpy.zeros_like(open_grid)
+
+    boat_slots = busy.sum(axis=(1, 2))
+    seats = numpy.array([_boat.seats for _boat in config.boats], dtype=numpy.int64)
+    seat_hours = int(numpy.dot(booked.sum(axis=(1, 2)), seats)) / float(SLOTS_PER_HOUR)
+    people_hours = sum(people_slots.values()) / float(SLOTS_PER_HOUR)
+    return {
+        'hire_point': config.hire_point.pk,
+        'name': config.hire_point.name,
+        'start': start_date.isoformat(),
+        'end': end_date.isoformat(),
+        'bookings': len(people_slots),
+        'open_hours': _to_hours(open_slots * number_of_boats),
+        'busy_hours': _to_hours(boat_slots.sum()),
+        'utilization': _ratio(boat_slots.sum(), open_slots * number_of_boats),
+        'hourly_utilization': hourly_utilization,
+        'peak_hours': peak_hours,
+        # hours, not boat hours, when every boat was in use and any other booking was turned away
+        'sold_out_hours': _to_hours(sold_out.sum()),
+        'people_hours': round(people_hours, 2),
+        'seat_hours': round(seat_hours, 2),
+        'seat_waste_hours': round(seat_hours - people_hours, 2),
+        'seat_utilization': _ratio(people_hours, seat_hours),
+        'boats': [
+            {
+                'id': _boat.id,
+                'seats': _boat.seats,
+                'busy_hours': _to_hours(_slots),
+                'utilization': _ratio(_slots, open_slots),
+            }
+            for _boat, _slots in zip(config.boats, boat_slots)
+        ],
+    }
+
+
+def get_utilization(start_date, end_date, hire_point_ids=None, include_archived=False):
+    """
+    :param start_date: first day included
+    :param end_date: last day included
+    :param hire_point_ids: by default every hire point
+    :param include_archived: take into account the archived bookings too
+    :return: A list with the figures of every hire point, sorted by name
+    """
+    return [
+        get_hire_point_utilization(_config, start_date, end_date, include_archived)
+        for _pk, _config in reference.get_hire_points().items()
+        if hire_point_ids is None or _pk in hire_point_ids
+    ]
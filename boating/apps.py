@@ -0,0 +1,8 @@
+from django.apps import AppConfig
+
+
+class BoatingConfig(AppConfig):
+    name = 'boating'
+
+    def ready(self):
+        from boating import checks, signals  # noqa
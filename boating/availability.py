@@ -0,0 +1,252 @@
+"""
+Availability computations that work on data already loaded from the database,
+so a whole day can be evaluated without querying once per slot
+"""
+import datetime
+import heapq
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+DEFAULT_ALLOCATION_STRATEGY = 'boating.allocation.greedy'
+
+_strategies = {}
+
+
+def to_naive(value):
+    """
+    The hire points work with naive local times, the database may return aware ones
+    """
+    if timezone.is_aware(value):
+        return timezone.make_naive(value)
+    return value
+
+
+def floor_time(time, step):
+    """
+    Start of the slot containing a time, slots are aligned to midnight
+    """
+    midnight = datetime.datetime.combine(time.date(), datetime.time.min)
+    step = int(step.total_seconds())
+    seconds = int((time - midnight).total_seconds())
+    return midnight + datetime.timedelta(seconds=seconds - seconds % step)
+
+
+def iter_times(start_time, end_time, step):
+    """
+    Every time from start_time, not included end_time
+    """
+    time = start_time
+    while time < end_time:
+        yield time
+        time += step
+
+
+def get_grid_slots(start_time, end_time, step):
+    """
+    Start of every slot touched by a period, at least one even if the period is empty
+    """
+    start_time, end_time = min(start_time, end_time), max(start_time, end_time)
+    slots = [floor_time(start_time, step)]
+    while slots[-1] + step < end_time:
+        slots.append(slots[-1] + step)
+    return slots
+
+
+def allocate_boats(free_boats, people):
+    """
+    Select the boats that a party would use with the strategy in BOATING_ALLOCATION_STRATEGY
+    :param free_boats: boats not in use, sorted by seats
+    :param people:
+    :return: A list of boats or None if there is not enough space
+    """
+    path = getattr(settings, 'BOATING_ALLOCATION_STRATEGY', DEFAULT_ALLOCATION_STRATEGY)
+    if path not in _strategies:
+        _strategies[path] = import_string(path)
+    return _strategies[path](free_boats, people)
+
+
+def overlaps(booking_start, booking_end, start_time, end_time):
+    """
+    Same predicate used by Booking.get_bookings_between
+    """
+    return (
+        (booking_start < end_time and booking_end > start_time) or
+        (booking_start == end_time and booking_end == start_time)
+    )
+
+
+def sweep_boats_in_use(times, duration, bookings):
+    """
+    Walks the slots once keeping only the bookings that may collide with the current one
+    :param times: start of every slot, in order
+    :param duration:
+    :param bookings: iterable of (start_time, end_time, boat ids) tuples
+    :return: A generator of (slot, ids of the boats in use) tuples
+    """
+    intervals = sorted(bookings, key=lambda _interval: _interval[0])
+    active = []  # heap of (end_time, index in intervals)
+    pending = 0
+
+    for time in times:
+        end_time = time + duration
+        while pending < len(intervals) and intervals[pending][0] <= end_time:
+            heapq.heappush(active, (intervals[pending][1], pending))
+            pending += 1
+        while active and active[0][0] < time:
+            heapq.heappop(active)
+
+        yield time, frozenset(
+            _boat_id
+            for _end, _index in active
+            if overlaps(intervals[_index][0], intervals[_index][1], time, end_time)
+            for _boat_id in intervals[_index][2]
+        )
+
+
+def select_boats(boats, boats_in_use, people, allocations):
+    """
+    Same as allocate_boats taking the boats not in use
+    :param allocations: dictionary used to remember the selection for every set of boats in use
+    """
+    if boats_in_use not in allocations:
+        allocations[boats_in_use] = allocate_boats(
+            [_boat for _boat in boats if _boat.id not in boats_in_use], people
+        )
+    return allocations[boats_in_use]
+
+
+def sweep_available_slots(times, duration, people, boats, bookings):
+    """
+    Computes the available slots walking the bookings once
+    :param times: start of every slot, in order
+    :param duration:
+    :param people:
+    :param boats: all the boats in the hire point, sorted by seats
+    :param bookings: iterable of (start_time, end_time, boat ids) tuples
+    :return: Two list with the same length, the first one contains the available slots
+    and the second the boats to be used
+    """
+    slots = []
+    selections = []
+    allocations = {}
+    for time, boats_in_use in sweep_boats_in_use(times, duration, bookings):
+        selected_boats = select_boats(boats, boats_in_use, people, allocations)
+        if selected_boats:
+            slots.append(time)
+            selections.append(list(selected_boats))
+    return slots, selections
+
+
+def available_slots_by_duration(start_time, closing_time, step, durations, people, boats, bookings):
+    """
+    Computes the available slots for several durations at once. The boats in use are found once for
+    every step long slot, a longer duration just joins the boats in use of its consecutive steps
+    :param start_time: first slot
+    :param closing_time: no slot starts at or after this time
+    :param step: time between slots
+    :param durations: multiples of step
+    :param people:
+    :param boats: all the boats in the hire point, sorted by seats
+    :param bookings: iterable of (start_time, end_time, boat ids) tuples
+    :return: A dictionary with the durations as keys and the same values returned by sweep_available_slots
+    """
+    lengths = {}
+    for duration in durations:
+        length, remainder = divmod(int(duration.total_seconds()), int(step.total_seconds()))
+        if remainder or length < 1:
+            raise ValueError('Durations must be multiples of the step')
+        lengths[length] = duration
+
+    starts = list(iter_times(start_time, closing_time, step))
+    boats_in_use_per_step = [
+        _boats_in_use for _time, _boats_in_use in sweep_boats_in_use(
+            iter_times(start_time, closing_time + step * (max(lengths) - 1), step), step, bookings
+        )
+    ]
+
+    availability = {}
+    allocations = {}
+    window = boats_in_use_per_step[:len(starts)]
+    for length in range(1, max(lengths) + 1):
+        if length > 1:
+            window = [
+                _boats_in_use | boats_in_use_per_step[_index + length - 1]
+                for _index, _boats_in_use in enumerate(window)
+            ]
+        if length not in lengths:
+            continue
+        slots = []
+        selections = []
+        for time, boats_in_use in zip(starts, window):
+            selected_boats = select_boats(boats, boats_in_use, people, allocations)
+            if selected_boats:
+                slots.append(time)
+                selections.append(list(selected_boats))
+        availability[lengths[length]] = (slots, selections)
+    return availability
+
+
+class Occupancy(object):
+    """
+    Occupancy of every boat in a hire point during a period, stored as a bitmap per boat where the
+    bit n is set when the boat is in use during the nth slot of the period.
+    Slots are aligned to midnight, bookings not aligned to them take the whole slots they touch
+    """
+
+    def __init__(self, start_time, end_time, step, boats, bookings):
+        """
+        :param start_time: beginning of the period
+        :param end_time: end of the period
+        :param step: slot size
+        :param boats: all the boats in the hire point, sorted by seats
+        :param bookings: iterable of (start_time, end_time, boat ids) tuples
+        """
+        self.step = int(step.total_seconds())
+        self.origin = floor_time(start_time, step)
+        self.end_time = end_time
+        self.boats = boats
+        self.bitmaps = dict((_boat.id, 0) for _boat in boats)
+        for booking_start, booking_end, boat_ids in bookings:
+            mask = self.get_mask(min(booking_start, booking_end), max(booking_start, booking_end))
+            for boat_id in boat_ids:
+                if boat_id in self.bitmaps:
+                    self.bitmaps[boat_id] |= mask
+
+    def _index(self, time):
+        return int((time - self.origin).total_seconds()) // self.step
+
+    def get_mask(self, start_time, end_time):
+        """
+        Bits of the slots touched by a period, clipped to the period covered by this occupancy
+        """
+        first = self._index(start_time)
+        last = max(-(-int((end_time - self.origin).total_seconds()) // self.step), first + 1)
+        first = max(first, 0)
+        if last <= first:
+            return 0
+        return ((1 << (last - first)) - 1) << first
+
+    def covers(self, start_time, end_time):
+        return self.origin <= start_time and end_time <= self.end_time
+
+    def is_free(self, boat, start_time, end_time):
+        return not self.bitmaps[boat.id] & self.get_mask(start_time, end_time)
+
+    def get_free_boats(self, start_time, end_time):
+        """
+        :return: boats not in use during the period, sorted by seats
+        """
+        if not self.covers(start_time, end_time):
+            raise ValueError('Period out of the occupancy range')
+        mask = self.get_mask(start_time, end_time)
+        return [_boat for _boat in self.boats if not self.bitmaps[_boat.id] & mask]
+
+    def add(self, boats, start_time, end_time):
+        """
+        Mark boats as in use
+        """
+        mask = self.get_mask(start_time, end_time)
+        for boat in boats:
+            self.bitmaps[boat.id] |= mask
@@ -0,0 +1,217 @@
+"""
+Measures the availability and booking hot paths against synthetic hire points
+"""
+import datetime
+import gc
+import os
+import platform
+import resource
+import timeit
+
+try:
+    import tracemalloc
+except ImportError:  # Python 2
+    tracemalloc = None
+
+import django
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from boating import cache as availability_cache, loadtest, reference
+from boating.models import Booking, HirePoint
+from boating.views import get_slots, place_booking
+
+BOOKING_NAME = 'Benchmark'
+DURATION = 60  # minutes
+PEOPLE = 4
+MIN_TIME_REGRESSION = 2  # milliseconds, smaller differences are noise
+# cleared before every run, the cache shared by the running processes is left alone
+CACHE_SETTINGS = {
+    'CACHES': {
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'boating-benchmark'}
+    },
+    'BOATING_CACHE': 'default',
+}
+
+
+def get_environment():
+    return {
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        # tracemalloc gives the peak of every operation, without it only the growth of the process is known
+        'memory': 'tracemalloc' if tracemalloc else 'maxrss',
+    }
+
+
+def get_case_name(case):
+    return 'boats=%(boats)s,bookings_per_day=%(bookings_per_day)s,opening_hours=%(opening_hours)s' % case
+
+
+def _run(operation, setup, teardown):
+    if setup:
+        setup()
+    availability_cache.get_cache().clear()
+    reference.get_hire_points()  # the configuration stays loaded between requests
+    gc.collect()
+    try:
+        with CaptureQueriesContext(connection) as queries:
+            start = timeit.default_timer()
+            operation()
+            elapsed = timeit.default_timer() - start
+    finally:
+        if teardown:
+            teardown()
+    return elapsed * 1000, len(queries)
+
+
+def _get_peak_memory(operation, setup, teardown):
+    """
+    Memory in kilobytes used by one more run, measured apart because tracing slows the operation down
+    """
+    if tracemalloc:
+        tracemalloc.start()
+        try:
+            _run(operation, setup, teardown)
+            return tracemalloc.get_traced_memory()[1] // 1024
+        finally:
+            tracemalloc.stop()
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # kilobytes on Linux
+    _run(operation, setup, teardown)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before
+
+
+def measure(operation, repeat, setup=None, teardown=None):
+    """
+    Runs an operation several times, always with the availability cache empty
+    :param operation: callable without arguments
+    :param repeat: number of timed runs
+    :param setup: callable run before every run, not timed
+    :param teardown: callable run after every run, not timed
+    :return: A dictionary with the median, min and max wall time in milliseconds, the most queries made
+    in a run and the peak memory in kilobytes
+    """
+    times = []
+    queries = 0
+    for _run_number in range(repeat):
+        elapsed, run_queries = _run(operation, setup, teardown)
+        times.append(elapsed)
+        queries = max(queries, run_queries)
+    times.sort()
+    return {
+        'time_ms': round(times[len(times) // 2], 3),
+        'min_time_ms': round(times[0], 3),
+        'max_time_ms': round(times[-1], 3),
+        'queries': queries,
+        'peak_memory_kb': _get_peak_memory(operation, setup, teardown),
+    }
+
+
+def post_booking(client, hire_point, start_time):
+    """
+    Books through the booking view
+    :raises: RuntimeError if the booking has not been placed, failures must not be measured as bookings
+    """
+    response = client.post(reverse('booking', args=[hire_point.pk]), {
+        'name': BOOKING_NAME, 'duration': DURATION, 'number_of_people': PEOPLE, 'hire_point': hire_point.pk,
+        'start_time': start_time.strftime('%Y-%m-%d %H:%M:%S'),
+    })
+    outcome = loadtest.get_outcome(response.status_code, response.get('Location', ''))
+    if outcome != 'booked':
+        raise RuntimeError('The booking could not be placed: %s' % outcome)
+
+
+def run_case(case, days=7, repeat=5, seed=0):
+    """
+    Creates a synthetic hire point and measures every hot path on its last day of bookings
+    :param case: dictionary with the number of boats, the bookings tried every day and the hours open
+    :param days: days of booking history
+    :param repeat: number of timed runs of every operation
+    :param seed:
+    :return: A list of results, one per operation
+    """
+    with open(os.devnull, 'w') as devnull:
+        call_command(
+            'create_example_data', hire_points=1, boats_per_point=case['boats'], days=days,
+            bookings_per_day=case['bookings_per_day'], opening_hours=case['opening_hours'], seed=seed,
+            stdout=devnull
+        )
+    hire_point = HirePoint.objects.order_by('-id')[0]
+    date = datetime.date.today()
+    duration = datetime.timedelta(minutes=DURATION)
+    start_time = hire_point.get_start_time(date)
+    middle_time = start_time + (hire_point.get_closing_time(date) - start_time) // 2
+
+    # the booking operations need a free slot, the day after the history is empty
+    booking_time = None
+    for booking_date in (date, date + datetime.timedelta(days=1)):
+        closing_time = hire_point.get_closing_time(booking_date)
+        booking_times, _boats = hire_point.get_available_slots(date=booking_date, people=PEOPLE, duration=duration)
+        booking_times = [_time for _time in booking_times if _time + duration <= closing_time]
+        if booking_times:
+            booking_time = booking_times[0]
+            break
+
+    client = Client()
+    url = reverse('booking', args=[hire_point.pk])
+
+    def delete_bookings():
+        for booking in Booking.objects.filter(name=BOOKING_NAME):
+            booking.delete()
+
+    def get_booking_view():
+        client.get(url, {
+            'date': date.strftime('%Y-%m-%d'), 'duration': DURATION, 'name': BOOKING_NAME, 'number_of_people': PEOPLE
+        })
+
+    def post_booking_view():
+        post_booking(client, hire_point, booking_time)
+
+    operations = [
+        ('is_available', lambda: hire_point.is_available(middle_time, PEOPLE, duration), None),
+        ('get_available_slots', lambda: hire_point.get_available_slots(date, PEOPLE, duration), None),
+        ('get_slots', lambda: get_slots(hire_point, date, PEOPLE, duration), None),
+        ('place_booking', lambda: place_booking(hire_point, BOOKING_NAME, booking_time, duration, PEOPLE),
+         delete_bookings),
+        ('BookingView GET', get_booking_view, None),
+        ('BookingView POST', post_booking_view, delete_bookings),
+    ]
+    results = []
+    for name, operation, teardown in operations:
+        result = {'case': dict(case), 'operation': name}
+        result.update(measure(operation, repeat, teardown=teardown))
+        results.append(result)
+    return results
+
+
+def compare(report, baseline, tolerance=0.5):
+    """
+    Finds the measures that got worse than in a baseline, cases not in the baseline are ignored
+    :param report: dictionary with the environment and the results
+    :param baseline: a previous report
+    :param tolerance: fraction that the time and the memory may grow, queries may never grow
+    :return: A list of (case name, operation, metric, baseline value, value) tuples
+    """
+    previous = dict(
+        ((get_case_name(_result['case']), _result['operation']), _result) for _result in baseline['results']
+    )
+    same_memory = report['environment']['memory'] == baseline['environment']['memory']
+    regressions = []
+    for result in report['results']:
+        key = (get_case_name(result['case']), result['operation'])
+        if key not in previous:
+            continue
+        before = previous[key]
+        if result['queries'] > before['queries']:
+            regressions.append(key + ('queries', before['queries'], result['queries']))
+        # the fastest run is the one less disturbed by the rest of the machine
+        if (result['min_time_ms'] > before['min_time_ms'] * (1 + tolerance) and
+                result['min_time_ms'] - before['min_time_ms'] > MIN_TIME_REGRESSION):
+            regressions.append(key + ('min_time_ms', before['min_time_ms'], result['min_time_ms']))
+        if (same_memory and before['peak_memory_kb'] > 0 and
+                result['peak_memory_kb'] > before['peak_memory_kb'] * (1 + tolerance)):
+            regressions.append(key + ('peak_memory_kb', before['peak_memory_kb'], result['peak_memory_kb']))
+    return regressions
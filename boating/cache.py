@@ -0,0 +1,124 @@
+"""
+Cache of the availability shown in the booking page.
+
+Every entry key contains the version of its hire point and the version of its date, bookings bump the
+version of the dates they touch and changes in boats or opening times bump the version of the hire point,
+so outdated entries are never read again and expire on their own.
+"""
+import datetime
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from boating.availability import to_naive
+
+HITS_KEY = 'boating:slots:hits'
+MISSES_KEY = 'boating:slots:misses'
+
+
+def get_cache():
+    return caches[getattr(settings, 'BOATING_CACHE', 'default')]
+
+
+def _new_version():
+    # A version that was evicted must not start again from a number already used
+    return int(time.time() * 1000)
+
+
+def _get_version_key(hire_point_id, date=None):
+    if date is None:
+        return 'boating:version:%s' % hire_point_id
+    return 'boating:version:%s:%s' % (hire_point_id, date.isoformat())
+
+
+def _bump(key):
+    cache = get_cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _new_version(), None)
+
+
+def _increment(key):
+    cache = get_cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, None)
+        cache.incr(key)
+
+
+def get_version(hire_point_id, date):
+    """
+    :return: A string that changes whenever the availability of the hire point in that date may change
+    """
+    cache = get_cache()
+    keys = [_get_version_key(hire_point_id), _get_version_key(hire_point_id, date)]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, _new_version(), None)
+            versions[key] = cache.get(key)
+    return '%s.%s' % tuple(versions[_key] for _key in keys)
+
+
+def invalidate_hire_point(hire_point_id):
+    _bump(_get_version_key(hire_point_id))
+
+
+def invalidate_booking(hire_point_id, start_time, end_time, max_duration):
+    """
+    Invalidates every date whose slots may collide with a booking
+    :param max_duration: the longest duration a slot can have, in minutes
+    """
+    date = (to_naive(start_time) - datetime.timedelta(days=1, minutes=max_duration)).date()
+    while date <= to_naive(end_time).date():
+        _bump(_get_version_key(hire_point_id, date))
+        date += datetime.timedelta(days=1)
+
+
+def get_slots_key(hire_point, date, number_of_people, duration):
+    return 'boating:slots:%s:%s:%s:%s:%s' % (
+        hire_point.pk, date.isoformat(), number_of_people, int(duration.total_seconds() // 60),
+        get_version(hire_point.pk, date)
+    )
+
+
+def get_slots(key):
+    """
+    :param key: generated by get_slots_key before computing the slots, so a change made meanwhile
+    leaves them under an outdated version
+    :return: The slots cached or None
+    """
+    slots = get_cache().get(key)
+    _increment(MISSES_KEY if slots is None else HITS_KEY)
+    return slots
+
+
+def set_slots(key, slots, timeout=None):
+    """
+    :param timeout: seconds the slots are kept, BOATING_CACHE_TIMEOUT by default
+    """
+    if timeout is None:
+        timeout = getattr(settings, 'BOATING_CACHE_TIMEOUT', 60 * 60)
+    get_cache().set(key, slots, timeout)
+
+
+def get_stats():
+    """
+    :return: A dictionary with the hits, misses and hit rate of the slots cache
+    """
+    counters = get_cache().get_many([HITS_KEY, MISSES_KEY])
+    hits = counters.get(HITS_KEY, 0)
+    misses = counters.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': float(hits) / total if total else 0.0,
+    }
+
+
+def reset_stats():
+    get_cache().delete_many([HITS_KEY, MISSES_KEY])
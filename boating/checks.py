@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core import checks
+
+PROCESS_CACHES = ('django.core.cache.backends.locmem.LocMemCache', 'django.core.cache.backends.dummy.DummyCache')
+
+
+@checks.register(checks.Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    The versions of the availability and of the hire points must be seen by every process
+    """
+    alias = getattr(settings, 'BOATING_CACHE', 'default')
+    backend = settings.CACHES.get(alias, {}).get('BACKEND')
+    if backend in PROCESS_CACHES:
+        return [checks.Warning(
+            'The cache %s is not shared between processes' % alias,
+            hint='Use a memcached, database or file based cache in BOATING_CACHE, otherwise the changes made '
+                 'in one process are not seen by the others',
+            obj=backend,
+            id='boating.W001',
+        )]
+    return []
@@ -15,3 +15,15 @@ DAYS = [
     (SATURDAY, "Saturday"),
     (SUNDAY, "Sunday"),
 ]
+
+CREATED = 'created'
+UPDATED = 'updated'
+DELETED = 'deleted'
+ARCHIVED = 'archived'
+
+CHANGE_ACTIONS = [
+    (CREATED, "Created"),
+    (UPDATED, "Updated"),
+    (DELETED, "Deleted"),
+    (ARCHIVED, "Archived"),
+]
@@ -0,0 +1,179 @@
+"""
+Bookings export as CSV, JSON lines or iCalendar, generated line by line so the memory used does not
+depend on the number of bookings
+"""
+import csv
+import datetime
+import heapq
+import json
+
+from django.db.models import Q
+from django.utils import six, timezone
+
+from boating import routers
+from boating.models import ArchivedBooking, Booking
+
+CHUNK_SIZE = 500  # bookings read per query, SQLite does not take more than 999 parameters in a query
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+    'ics': 'text/calendar; charset=utf-8',
+}
+CSV_HEADER = ['id', 'name', 'number_of_people', 'hire_point', 'start_time', 'end_time', 'boats', 'archived']
+
+
+def _iter_chunks(queryset, chunk_size):
+    """
+    Reads a queryset sorted by start time and id in chunks, every chunk starts after the last
+    booking of the previous one so every query uses the index and the rows are never all loaded
+    """
+    last_booking = None
+    while True:
+        chunk = queryset
+        if last_booking is not None:
+            chunk = chunk.filter(
+                Q(start_time__gt=last_booking.start_time) |
+                Q(start_time=last_booking.start_time, id__gt=last_booking.id)
+            )
+        chunk = list(chunk[:chunk_size])
+        if not chunk:
+            return
+        yield chunk
+        last_booking = chunk[-1]
+
+
+def _iter_with_boats(model, hire_point, start_time, end_time, chunk_size):
+    through = model.boats.through
+    booking_field = model._meta.get_field('boats').m2m_field_name() + '_id'
+    database = routers.get_shard(hire_point.pk)
+    queryset = model.objects.using(database).filter(
+        hire_point=hire_point, start_time__gte=start_time, start_time__lt=end_time
+    ).order_by('start_time', 'id')
+    for chunk in _iter_chunks(queryset, chunk_size):
+        boats = dict((_booking.id, []) for _booking in chunk)
+        for booking_id, boat_id, seats in through.objects.using(database).filter(
+            **{booking_field + '__in': list(boats)}
+        ).order_by('boat__seats', 'boat_id').values_list(booking_field, 'boat_id', 'boat__seats'):
+            boats[booking_id].append((boat_id, seats))
+        for booking in chunk:
+            yield (booking.start_time, booking.id, booking, boats[booking.id])
+
+
+def iter_bookings(hire_point, start_date, end_date, include_archived=False, chunk_size=CHUNK_SIZE):
+    """
+    Bookings of a hire point starting between two dates, sorted by start time
+    :param hire_point:
+    :param start_date: first day included
+    :param end_date: last day included
+    :param include_archived: include the archived bookings too
+    :param chunk_size: bookings read at once
+    :return: A generator of (booking, list of (boat id, seats) tuples) tuples
+    """
+    start_time = datetime.datetime.combine(start_date, datetime.time.min)
+    end_time = datetime.datetime.combine(end_date + datetime.timedelta(days=1), datetime.time.min)
+    bookings = _iter_with_boats(Booking, hire_point, start_time, end_time, chunk_size)
+    if include_archived:
+        bookings = heapq.merge(
+            _iter_with_boats(ArchivedBooking, hire_point, start_time, end_time, chunk_size), bookings
+        )
+    for _start_time, _id, booking, boats in bookings:
+        yield booking, boats
+
+
+def to_utc(value):
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return value.astimezone(timezone.utc)
+
+
+def get_row(booking, boats):
+    return {
+        'id': booking.id,
+        'name': booking.name,
+        'number_of_people': booking.number_of_people,
+        'hire_point': booking.hire_point_id,
+        'start_time': to_utc(booking.start_time).isoformat(),
+        'end_time': to_utc(booking.end_time).isoformat(),
+        'boats': [{'id': _boat_id, 'seats': _seats} for _boat_id, _seats in boats],
+        'archived': isinstance(booking, ArchivedBooking),
+    }
+
+
+class _Echo(object):
+    """
+    File like object that gives back what is written, so the csv writer returns the lines
+    """
+
+    def write(self, value):
+        return value
+
+
+def _write_csv(writer, values):
+    # the csv module of Python 2 only works with bytes
+    if six.PY2:
+        values = [_value.encode('utf-8') if isinstance(_value, six.text_type) else _value for _value in values]
+        return writer.writerow(values).decode('utf-8')
+    return writer.writerow(values)
+
+
+def iter_csv(bookings):
+    writer = csv.writer(_Echo())
+    yield _write_csv(writer, CSV_HEADER)
+    for booking, boats in bookings:
+        row = get_row(booking, boats)
+        row['boats'] = ' '.join('%s:%s' % (_boat['id'], _boat['seats']) for _boat in row['boats'])
+        yield _write_csv(writer, [row[_column] for _column in CSV_HEADER])
+
+
+def iter_jsonl(bookings):
+    for booking, boats in bookings:
+        yield six.text_type(json.dumps(get_row(booking, boats), sort_keys=True)) + '\n'
+
+
+def _escape_ical(value):
+    return value.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+
+
+def _fold_ical(line):
+    """
+    Lines are at most 75 octets long, the following ones start with a space
+    """
+    line = line.encode('utf-8')
+    parts = []
+    while len(line) > 75:
+        cut = 75 if not parts else 74
+        while cut and (six.indexbytes(line, cut) & 0xC0) == 0x80:  # do not split a character
+            cut -= 1
+        parts.append(line[:cut])
+        line = line[cut:]
+    parts.append(line)
+    return b'\r\n '.join(parts).decode('utf-8') + '\r\n'
+
+
+def iter_ical(bookings):
+    yield 'BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//pedal-boating//bookings//EN\r\n'
+    stamp = timezone.now().astimezone(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    for booking, boats in bookings:
+        lines = [
+            'BEGIN:VEVENT',
+            'UID:booking-%s@pedal-boating' % booking.id,
+            'DTSTAMP:%s' % stamp,
+            'DTSTART:%s' % to_utc(booking.start_time).strftime('%Y%m%dT%H%M%SZ'),
+            'DTEND:%s' % to_utc(booking.end_time).strftime('%Y%m%dT%H%M%SZ'),
+            'SUMMARY:%s' % _escape_ical('%s (%s)' % (booking.name, booking.number_of_people)),
+            'DESCRIPTION:%s' % _escape_ical(
+                'Boats: %s' % ', '.join('%s seats' % _seats for _boat_id, _seats in boats)
+            ),
+            'END:VEVENT',
+        ]
+        yield ''.join(_fold_ical(_line) for _line in lines)
+    yield 'END:VCALENDAR\r\n'
+
+
+def export(bookings, export_format):
+    """
+    :param bookings: generator returned by iter_bookings
+    :param export_format: a key of FORMATS
+    :return: A generator of unicode text
+    """
+    return {'csv': iter_csv, 'jsonl': iter_jsonl, 'ics': iter_ical}[export_format](bookings)
@@ -0,0 +1,96 @@
+"""
+Feed of the bookings created, updated, deleted and archived, read in pages after an opaque cursor.
+
+A client keeps the cursor of the last page it read and asks for the changes after it, so it can stop
+and resume at any moment without missing or repeating a change
+"""
+import base64
+import binascii
+import datetime
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.utils import timezone
+
+from boating import routers
+from boating.export import get_row, to_utc
+from boating.models import Booking, BookingChange
+
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+INVALID_CURSOR = 'Invalid cursor'
+
+
+def get_cursor(change_id):
+    """
+    :param change_id: id of the last change read, 0 before the first one
+    """
+    return base64.urlsafe_b64encode(('%d' % change_id).encode('ascii')).decode('ascii').rstrip('=')
+
+
+def parse_cursor(cursor):
+    """
+    :param cursor: a cursor given by the feed, empty to start from the beginning
+    :return: The id of the last change read
+    :raises: ValueError if the cursor has not been given by the feed
+    """
+    if not cursor:
+        return 0
+    try:
+        change_id = int(base64.urlsafe_b64decode((cursor + '=' * (-len(cursor) % 4)).encode('ascii')))
+    except (TypeError, ValueError, UnicodeError, binascii.Error):
+        raise ValueError(INVALID_CURSOR)
+    if change_id < 0:
+        raise ValueError(INVALID_CURSOR)
+    return change_id
+
+
+def _get_bookings(booking_ids, database):
+    rows = {}
+    for booking in Booking.objects.using(database).filter(id__in=booking_ids).prefetch_related('boats'):
+        boats = sorted(booking.boats.all(), key=lambda _boat: (_boat.seats, _boat.id))
+        rows[booking.id] = get_row(booking, [(_boat.id, _boat.seats) for _boat in boats])
+    return rows
+
+
+def get_changes(cursor=None, hire_point_id=None, limit=PAGE_SIZE, delay=None):
+    """
+    A page of changes after a cursor, with the current state of the bookings that still exist
+    :param cursor: cursor returned by the previous page, None to start from the beginning
+    :param hire_point_id: only the changes of this hire point, read from its shard. Without it
+    the changes of the hire points in the default database are given
+    :param limit: maximum changes
+    :param delay: seconds a change waits before it is given, so the transactions that took an earlier id
+    have time to commit, BOATING_CHANGES_DELAY by default
+    :return: A dictionary with the changes, the cursor of the next page and whether there are more changes
+    :raises: ValueError if the cursor is invalid
+    """
+    last_id = parse_cursor(cursor)
+    if delay is None:
+        delay = getattr(settings, 'BOATING_CHANGES_DELAY', 0)
+    database = routers.get_shard(hire_point_id) if hire_point_id is not None else DEFAULT_DB_ALIAS
+    changes = BookingChange.objects.using(database).filter(id__gt=last_id).order_by('id')
+    if hire_point_id is not None:
+        changes = changes.filter(hire_point_id=hire_point_id)
+    if delay:
+        changes = changes.filter(changed_at__lte=timezone.now() - datetime.timedelta(seconds=delay))
+    changes = list(changes[:limit + 1])
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+
+    bookings = _get_bookings(set(_change.booking_id for _change in changes), database)
+    return {
+        'changes': [
+            {
+                'cursor': get_cursor(_change.id),
+                'action': _change.action,
+                'booking_id': _change.booking_id,
+                'hire_point': _change.hire_point_id,
+                'changed_at': to_utc(_change.changed_at).isoformat(),
+                'booking': bookings.get(_change.booking_id),  # None once it is deleted or archived
+            }
+            for _change in changes
+        ],
+        'cursor': get_cursor(changes[-1].id if changes else last_id),
+        'has_more': has_more,
+    }
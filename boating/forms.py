@@ -1,22 +1,57 @@
+import copy
 import datetime
 
 from django import forms
 from django.core.validators import MinValueValidator
 
-from boating.models import HirePoint, Booking, MAX_DURATION, SLOT_TIME
+from boating import feed, reference
+from boating.export import FORMATS
+from boating.models import Booking, MAX_DURATION, MAX_SERIES_OCCURRENCES, SLOT_TIME
 from boating.utils import humanize_time
 
+DURATION_CHOICES = [(_value, humanize_time(_value)) for _value in range(SLOT_TIME, MAX_DURATION + 1, SLOT_TIME)]
+
+
+class HirePointField(forms.ChoiceField):
+    """
+    Choice of hire point built from the configuration kept in memory instead of a queryset
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(HirePointField, self).__init__(*args, **kwargs)
+        self.choices = [('', '---------')] + [
+            (_pk, _config.hire_point.name) for _pk, _config in reference.get_hire_points().items()
+        ]
+
+    def prepare_value(self, value):
+        return getattr(value, 'pk', value)
+
+    def to_python(self, value):
+        value = super(HirePointField, self).to_python(value)
+        if not value:
+            return None
+        try:
+            config = reference.get_hire_point_config(value)
+        except ValueError:
+            config = None
+        if config is None:
+            raise forms.ValidationError(self.error_messages['invalid_choice'], code='invalid_choice',
+                                        params={'value': value})
+        return copy.copy(config.hire_point)
+
+    def validate(self, value):
+        if value is None and self.required:
+            raise forms.ValidationError(self.error_messages['required'], code='required')
+
 
 class CommonFieldsForm(forms.Form):
     name = Booking._meta.get_field('name').formfield()
-    duration = forms.ChoiceField(
-        choices=[(_value, humanize_time(_value)) for _value in range(SLOT_TIME, MAX_DURATION + 1, SLOT_TIME)]
-    )
+    duration = forms.ChoiceField(choices=DURATION_CHOICES)
     number_of_people = Booking._meta.get_field('number_of_people').formfield()
 
     def __init__(self, *args, **kwargs):
         super(CommonFieldsForm, self).__init__(*args, **kwargs)
-        self.fields['hire_point'] = forms.ModelChoiceField(queryset=HirePoint.objects.all())
+        self.fields['hire_point'] = HirePointField()
         self.fields['number_of_people'].validators = [MinValueValidator(1)]
 
 
@@ -25,6 +60,12 @@ class HomeForm(CommonFieldsForm):
         initial=datetime.date.today, input_formats=['%d/%m/%Y'], widget=forms.widgets.DateInput(format='%d/%m/%Y')
     )
 
+    def __init__(self, *args, **kwargs):
+        super(HomeForm, self).__init__(*args, **kwargs)
+        # without hire point every hire point is searched
+        self.fields['hire_point'].required = False
+        self.fields['hire_point'].choices = [('', 'Any hire point')] + self.fields['hire_point'].choices[1:]
+
 
 class BookingForm(CommonFieldsForm):
     start_time = forms.DateTimeField()
@@ -37,3 +78,80 @@ class BookingForm(CommonFieldsForm):
     def clean_duration(self):
         duration = self.cleaned_data['duration']
         return datetime.timedelta(minutes=int(duration))
+
+
+class SeriesForm(CommonFieldsForm):
+    start_time = forms.DateTimeField(help_text='Start of the first booking')
+    occurrences = forms.IntegerField(min_value=1, max_value=MAX_SERIES_OCCURRENCES)
+    every = forms.IntegerField(min_value=1, required=False, help_text='Weeks between bookings, by default 1')
+
+    def __init__(self, *args, **kwargs):
+        super(SeriesForm, self).__init__(*args, **kwargs)
+        del self.fields['hire_point']  # given by the url
+
+    def clean_duration(self):
+        duration = self.cleaned_data['duration']
+        return datetime.timedelta(minutes=int(duration))
+
+    def clean_every(self):
+        return self.cleaned_data['every'] or 1
+
+
+class CalendarForm(forms.Form):
+    month = forms.DateField(input_formats=['%Y-%m'])
+    duration = forms.ChoiceField(choices=DURATION_CHOICES)
+    number_of_people = forms.IntegerField(min_value=1)
+
+    def clean_duration(self):
+        duration = self.cleaned_data['duration']
+        return datetime.timedelta(minutes=int(duration))
+
+
+class DurationsForm(forms.Form):
+    date = forms.DateField(input_formats=['%Y-%m-%d'])
+    number_of_people = forms.IntegerField(min_value=1)
+
+
+class DateRangeForm(forms.Form):
+    start = forms.DateField(input_formats=['%Y-%m-%d'])
+    end = forms.DateField(input_formats=['%Y-%m-%d'])
+    include_archived = forms.BooleanField(required=False)
+
+    def clean(self):
+        cleaned_data = super(DateRangeForm, self).clean()
+        if cleaned_data.get('start') and cleaned_data.get('end') and cleaned_data['start'] > cleaned_data['end']:
+            raise forms.ValidationError('The start must not be after the end')
+        return cleaned_data
+
+
+class ExportForm(DateRangeForm):
+    format = forms.ChoiceField(choices=[(_format, _format) for _format in sorted(FORMATS)], required=False)
+
+    def clean_format(self):
+        return self.cleaned_data['format'] or 'csv'
+
+
+class UtilizationForm(DateRangeForm):
+    hire_point = forms.TypedMultipleChoiceField(coerce=int, required=False, help_text='By default all of them')
+
+    def __init__(self, *args, **kwargs):
+        super(UtilizationForm, self).__init__(*args, **kwargs)
+        self.fields['hire_point'].choices = [
+            (_pk, _config.hire_point.name) for _pk, _config in reference.get_hire_points().items()
+        ]
+
+
+class ChangesForm(forms.Form):
+    cursor = forms.CharField(required=False)
+    hire_point = forms.IntegerField(required=False)
+    limit = forms.IntegerField(min_value=1, max_value=feed.MAX_PAGE_SIZE, required=False)
+
+    def clean_cursor(self):
+        try:
+            feed.parse_cursor(self.cleaned_data['cursor'])
+        except ValueError as error:
+            raise forms.ValidationError(str(error))
+        return self.cleaned_data['cursor']
+
+    def clean_limit(self):
+        return self.cleaned_data['limit'] or feed.PAGE_SIZE
@@ -0,0 +1,215 @@
+"""
+Concurrent booking load generator, the bookings are placed by posting to BookingView as the users do
+"""
+from collections import Counter
+import datetime
+import math
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
+import random
+import threading
+import timeit
+
+from django.conf import settings
+from django.core.urlresolvers import resolve, reverse
+from django.db import connection
+from django.test import Client
+from django.utils.six.moves import http_cookiejar
+from django.utils.six.moves.urllib.error import HTTPError, URLError
+from django.utils.six.moves.urllib.parse import parse_qs, urlencode, urlsplit
+from django.utils.six.moves.urllib.request import HTTPCookieProcessor, HTTPRedirectHandler, Request, build_opener
+
+from boating import routers
+from boating.availability import iter_times
+from boating.models import Booking, MAX_DURATION, SLOT_TIME
+
+BOOKING_NAME = 'Load test'
+
+_local = threading.local()
+
+
+class _NoRedirectHandler(HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None  # the redirection tells the outcome, it is not followed
+
+
+def get_requests(hire_point, start_time, window, duration, number, max_people, seed=0):
+    """
+    Booking forms for random start times inside a window, every one for a random party
+    :param hire_point:
+    :param start_time: beginning of the window
+    :param window: the bookings start before start_time + window
+    :param duration:
+    :param number: number of requests
+    :param max_people:
+    :param seed:
+    :return: A list of (url path, form data) tuples
+    """
+    generator = random.Random(seed)
+    start_times = list(iter_times(start_time, start_time + window, datetime.timedelta(minutes=SLOT_TIME)))
+    url = reverse('booking', args=[hire_point.pk])
+    return [
+        (url, {
+            'name': BOOKING_NAME,
+            'hire_point': hire_point.pk,
+            'start_time': generator.choice(start_times).strftime('%Y-%m-%d %H:%M:%S'),
+            'duration': int(duration.total_seconds()) // 60,
+            'number_of_people': generator.randint(1, max_people),
+        })
+        for _number in range(number)
+    ]
+
+
+def get_outcome(status, location):
+    """
+    :return: 'booked', the reason given to the unsuccessful booking page or the unexpected status
+    """
+    if status != 302:
+        return 'status %s' % status
+    url = urlsplit(location)
+    if url.path == reverse('booking_unsuccessful'):
+        return parse_qs(url.query).get('reason', ['unknown'])[0]
+    return 'booked'
+
+
+def get_booking_id(status, location):
+    """
+    :return: The id of the booking placed, None if the booking has not been placed
+    """
+    if get_outcome(status, location) != 'booked':
+        return None
+    return int(resolve(urlsplit(location).path).kwargs['pk'])
+
+
+def post_in_process(request):
+    """
+    Posts a booking to the WSGI application of this process, every thread with its own client
+    :param request: (url path, form data) tuple
+    :return: A (latency in seconds, outcome, booking id) tuple
+    """
+    if not hasattr(_local, 'client'):
+        _local.client = Client()
+    url, data = request
+    booking_id = None
+    start = timeit.default_timer()
+    try:
+        response = _local.client.post(url, data)
+        outcome = get_outcome(response.status_code, response.get('Location', ''))
+        booking_id = get_booking_id(response.status_code, response.get('Location', ''))
+    except Exception as error:
+        outcome = error.__class__.__name__
+    finally:
+        connection.close()  # as at the end of every request
+    return timeit.default_timer() - start, outcome, booking_id
+
+
+def post_over_http(base_url, request):
+    """
+    Posts a booking to a running server, every thread or process keeps its own session
+    :param base_url: scheme and host of the server
+    :param request: (url path, form data) tuple
+    :return: A (latency in seconds, outcome, booking id) tuple
+    """
+    if not hasattr(_local, 'opener'):
+        cookies = http_cookiejar.CookieJar()
+        _local.opener = build_opener(HTTPCookieProcessor(cookies), _NoRedirectHandler)
+        _local.opener.open(base_url + reverse('home')).read()  # sets the CSRF cookie
+        _local.csrf_token = dict((_cookie.name, _cookie.value) for _cookie in cookies).get(
+            settings.CSRF_COOKIE_NAME, ''
+        )
+    url, data = request
+    http_request = Request(base_url + url, urlencode(data).encode('utf-8'), {
+        'X-CSRFToken': _local.csrf_token, 'Referer': base_url + url
+    })
+    booking_id = None
+    start = timeit.default_timer()
+    try:
+        response = _local.opener.open(http_request)
+        response.read()
+        outcome = get_outcome(response.getcode(), '')
+    except HTTPError as error:
+        outcome = get_outcome(error.code, error.headers.get('Location', ''))
+        booking_id = get_booking_id(error.code, error.headers.get('Location', ''))
+    except URLError:
+        outcome = 'connection error'
+    return timeit.default_timer() - start, outcome, booking_id
+
+
+def run(requests, send, concurrency, processes=False):
+    """
+    Sends every request from a pool of threads or processes
+    :param requests: list of (url path, form data) tuples
+    :param send: post_in_process or post_over_http with its base url, it must be picklable to use processes
+    :param concurrency: number of threads or processes
+    :param processes: use processes instead of threads
+    :return: A list of (latency in seconds, outcome, booking id) tuples and the seconds elapsed
+    """
+    pool = (Pool if processes else ThreadPool)(concurrency)
+    try:
+        start = timeit.default_timer()
+        results = pool.map(send, requests, chunksize=1)
+        elapsed = timeit.default_timer() - start
+    finally:
+        pool.close()
+        pool.join()
+    return results, elapsed
+
+
+def _percentile(values, percent):
+    return values[max(int(math.ceil(len(values) * percent / 100.0)) - 1, 0)]
+
+
+def summarize(results, elapsed):
+    """
+    :return: A dictionary with the number of requests, the throughput, the latency percentiles
+    in milliseconds and the number of requests by outcome
+    """
+    latencies = sorted(_latency * 1000 for _latency, _outcome, _booking_id in results)
+    return {
+        'requests': len(results),
+        'seconds': elapsed,
+        'throughput': len(results) / elapsed if elapsed else 0,
+        'p50_ms': _percentile(latencies, 50),
+        'p95_ms': _percentile(latencies, 95),
+        'p99_ms': _percentile(latencies, 99),
+        'outcomes': dict(Counter(_outcome for _latency, _outcome, _booking_id in results)),
+    }
+
+
+def delete_bookings(hire_point, results):
+    """
+    Deletes the bookings placed by a run, the ones placed by other runs or by hand are kept
+    :param hire_point:
+    :param results: list of (latency in seconds, outcome, booking id) tuples
+    """
+    booking_ids = [_booking_id for _latency, _outcome, _booking_id in results if _booking_id is not None]
+    hire_point.bookings.filter(pk__in=booking_ids).delete()  # in the shard of the hire point
+
+
+def find_double_bookings(hire_point, start_time, end_time):
+    """
+    Looks for boats assigned to overlapping bookings, checking the bookings themselves and not the claims
+    :param hire_point:
+    :param start_time:
+    :param end_time:
+    :return: A list of (boat id, booking id, overlapping booking id) tuples
+    """
+    boat_bookings = Booking.boats.through.objects.using(routers.get_shard(hire_point.pk)).filter(
+        booking__hire_point=hire_point,
+        booking__start_time__lt=end_time,
+        booking__end_time__gt=start_time - datetime.timedelta(minutes=MAX_DURATION),
+    ).order_by('boat_id', 'booking__start_time').values_list(
+        'boat_id', 'booking_id', 'booking__start_time', 'booking__end_time'
+    )
+    double_bookings = []
+    boat_id = None
+    last_booking = None  # the booking of the boat that ends later so far
+    for booking_boat_id, booking_id, booking_start, booking_end in boat_bookings:
+        if booking_boat_id != boat_id:
+            boat_id = booking_boat_id
+            last_booking = None
+        elif booking_start < last_booking[1]:
+            double_bookings.append((boat_id, last_booking[0], booking_id))
+        if last_booking is None or booking_end > last_booking[1]:
+            last_booking = (booking_id, booking_end)
+    return double_bookings
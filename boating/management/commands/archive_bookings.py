@@ -0,0 +1,39 @@
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from boating import routers
+from boating.models import ArchivedBooking
+
+
+class Command(BaseCommand):
+    help = (
+        'Moves the bookings older than the live booking window to the archive in batches. '
+        'It can be stopped at any moment, the next run continues with the bookings left'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int,
+            help='Bookings ended more than these days ago are archived, by default BOATING_ARCHIVE_DAYS'
+        )
+        parser.add_argument('--batch-size', type=int, default=500, help='Bookings archived per transaction')
+        parser.add_argument('--max-batches', type=int, help='Stop after these batches, by default all of them')
+
+    def handle(self, *args, **options):
+        days = options['days'] if options['days'] is not None else getattr(settings, 'BOATING_ARCHIVE_DAYS', 365)
+        before = timezone.now() - datetime.timedelta(days=days)
+        archived = 0
+        batches = 0
+        for database in routers.get_shards():
+            while options['max_batches'] is None or batches < options['max_batches']:
+                count = ArchivedBooking.archive(before, options['batch_size'], using=database)
+                if not count:
+                    break
+                archived += count
+                batches += 1
+                if options['verbosity'] > 1:
+                    self.stdout.write('Archived %s bookings' % archived)
+        self.stdout.write('Archived %s bookings ended before %s' % (archived, before.strftime('%Y-%m-%d %H:%M')))
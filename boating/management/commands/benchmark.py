@@ -0,0 +1,78 @@
+import itertools
+import json
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from boating import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        'Measures wall time, queries and peak memory of the availability and booking hot paths over a matrix '
+        'of synthetic hire points, in a test database. The results are written as JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--boats', type=int, nargs='+', default=[5, 20, 50], help='Fleet sizes')
+        parser.add_argument(
+            '--bookings-per-day', type=int, nargs='+', default=[10, 50, 200], help='Booking densities'
+        )
+        parser.add_argument('--opening-hours', type=int, nargs='+', default=[8, 14], help='Opening hour spans')
+        parser.add_argument('--days', type=int, default=7, help='Days of booking history')
+        parser.add_argument('--repeat', type=int, default=5, help='Timed runs of every operation')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='File where the results are written, by default the standard output')
+        parser.add_argument('--compare', metavar='BASELINE', help='Results of a previous run to compare with')
+        parser.add_argument(
+            '--tolerance', type=float, default=0.5, help='Fraction that time and memory may grow before failing'
+        )
+
+    def _run_benchmarks(self, options):
+        cases = [
+            {'boats': _boats, 'bookings_per_day': _bookings, 'opening_hours': _hours}
+            for _boats, _bookings, _hours in itertools.product(
+                options['boats'], options['bookings_per_day'], options['opening_hours']
+            )
+        ]
+        report = {'environment': benchmark.get_environment(), 'results': []}
+        for case in cases:
+            if options['verbosity'] > 1:
+                self.stderr.write(benchmark.get_case_name(case))
+            call_command('flush', interactive=False, verbosity=0)
+            report['results'].extend(benchmark.run_case(case, options['days'], options['repeat'], options['seed']))
+        return report
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as baseline_file:
+                baseline = json.load(baseline_file)
+
+        # never touch the real data
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with override_settings(**benchmark.CACHE_SETTINGS):
+                report = self._run_benchmarks(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        output = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                output_file.write(output)
+        else:
+            self.stdout.write(output)
+
+        if baseline is not None:
+            regressions = benchmark.compare(report, baseline, options['tolerance'])
+            for case_name, operation, metric, before, after in regressions:
+                self.stderr.write('%s %s: %s went from %s to %s' % (case_name, operation, metric, before, after))
+            if regressions:
+                raise CommandError('%s regressions against %s' % (len(regressions), options['compare']))
+            self.stderr.write('No regressions against %s' % options['compare'])
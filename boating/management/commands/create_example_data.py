@@ -1,13 +1,39 @@
 import datetime
+import random
 
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
 
-from boating.choices import MONDAY, SATURDAY, SUNDAY, FRIDAY
-from boating.models import HirePoint, OpeningTimes, Boat
+from boating import reference
+from boating.availability import Occupancy, allocate_boats, get_grid_slots
+from boating.choices import CREATED, MONDAY, SATURDAY, SUNDAY, FRIDAY
+from boating.models import (
+    HirePoint, OpeningTimes, Boat, Booking, BookingChange, BoatOccupancy, BoatSlotClaim, MAX_DURATION, SLOT_TIME
+)
 
 
 class Command(BaseCommand):
+    help = (
+        'Creates the example hire points. With --hire-points it creates instead synthetic hire points '
+        'with a booking history, written in bulk'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hire-points', type=int, help='Number of synthetic hire points')
+        parser.add_argument('--boats-per-point', type=int, default=10)
+        parser.add_argument('--days', type=int, default=30, help='Days of booking history until today')
+        parser.add_argument('--bookings-per-day', type=int, default=20, help='Bookings tried every day')
+        parser.add_argument(
+            '--opening-hours', type=int, help='Hours open every day, by default a random span on random days'
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000, help='Bookings written per transaction')
+
     def _get_or_create_hire_point(self, name, description):
         hire_point, created = HirePoint.objects.get_or_create(
             name=name,
@@ -26,7 +52,129 @@ class Command(BaseCommand):
                 hire_point=hire_point, seats=seat_number
             )
 
+    def _to_database(self, value):
+        # the same slot times repeat all over the bookings
+        if value not in self._database_times:
+            self._database_times[value] = timezone.make_aware(value) if settings.USE_TZ else value
+        return self._database_times[value]
+
+    def _write_bookings(self, bookings):
+        """
+        Writes the bookings and their boats with one bulk insert per table, signals are not sent
+        :param bookings: list of (booking with its id, boats, slots claimed) tuples
+        """
+        through = Booking.boats.through
+        with transaction.atomic():
+            Booking.objects.bulk_create([_booking for _booking, _boats, _slots in bookings])
+            through.objects.bulk_create([
+                through(booking_id=_booking.id, boat_id=_boat.id)
+                for _booking, _boats, _slots in bookings for _boat in _boats
+            ])
+            BoatOccupancy.objects.bulk_create([
+                BoatOccupancy(
+                    boat_id=_boat.id, hire_point_id=_booking.hire_point_id, booking_id=_booking.id,
+                    start_time=_booking.start_time, end_time=_booking.end_time
+                )
+                for _booking, _boats, _slots in bookings for _boat in _boats
+            ])
+            BoatSlotClaim.objects.bulk_create([
+                BoatSlotClaim(boat_id=_boat.id, booking_id=_booking.id, slot=self._to_database(_slot))
+                for _booking, _boats, _slots in bookings for _slot in _slots for _boat in _boats
+            ])
+            BookingChange.objects.bulk_create([
+                BookingChange(booking_id=_booking.id, hire_point_id=_booking.hire_point_id, action=CREATED)
+                for _booking, _boats, _slots in bookings
+            ])
+
+    def _create_synthetic_data(self, options):
+        self._database_times = {}
+        generator = random.Random(options['seed'])
+        step = datetime.timedelta(minutes=SLOT_TIME)
+        durations = [datetime.timedelta(minutes=_minutes) for _minutes in range(SLOT_TIME, MAX_DURATION + 1, SLOT_TIME)]
+        first_date = datetime.date.today() - datetime.timedelta(days=options['days'])
+
+        hire_points = []
+        first_number = HirePoint.objects.count() + 1
+        for number in range(first_number, first_number + options['hire_points']):
+            hire_point = HirePoint.objects.create(name='Synthetic Hire Point %s' % number)
+            if options['opening_hours']:
+                opening_hour = min(9, 23 - options['opening_hours'])
+                opening_times = [
+                    OpeningTimes(
+                        hire_point=hire_point, day=_day, from_hour=datetime.time(hour=opening_hour),
+                        to_hour=datetime.time(hour=opening_hour + options['opening_hours'])
+                    )
+                    for _day in range(MONDAY, SUNDAY + 1)
+                ]
+            else:
+                opening_hour = generator.randint(7, 11)
+                opening_times = [
+                    OpeningTimes(
+                        hire_point=hire_point, day=_day, from_hour=datetime.time(hour=opening_hour),
+                        to_hour=datetime.time(hour=generator.randint(opening_hour + 4, 23))
+                    )
+                    for _day in range(MONDAY, SUNDAY + 1) if generator.random() < 0.9
+                ]
+            OpeningTimes.objects.bulk_create(opening_times)
+            Boat.objects.bulk_create([
+                Boat(hire_point=hire_point, seats=generator.choice([2, 2, 4, 4, 4, 6, 8]))
+                for _index in range(options['boats_per_point'])
+            ])
+            boats = list(hire_point.boats.order_by('seats', 'id'))
+            opening_times = dict((_opening_time.day, _opening_time) for _opening_time in opening_times)
+            hire_points.append((hire_point, opening_times, boats))
+        reference.invalidate()
+
+        next_id = (Booking.objects.aggregate(Max('id'))['id__max'] or 0) + 1
+        pending = []
+        created = 0
+        for hire_point, opening_times, boats in hire_points:
+            for day in range(options['days'] + 1):
+                date = first_date + datetime.timedelta(days=day)
+                opening_time = opening_times.get(date.isoweekday())
+                if opening_time is None:
+                    continue
+                start_time = datetime.datetime.combine(date, opening_time.from_hour)
+                closing_time = datetime.datetime.combine(date, opening_time.to_hour)
+                occupancy = Occupancy(start_time, closing_time, step, boats, [])
+                slots = int((closing_time - start_time).total_seconds()) // int(step.total_seconds())
+                for _booking in range(options['bookings_per_day']):
+                    duration = generator.choice(durations)
+                    booking_start = start_time + step * generator.randrange(slots)
+                    booking_end = booking_start + duration
+                    if booking_end > closing_time:
+                        continue
+                    people = generator.randint(1, 12)
+                    selected_boats = allocate_boats(occupancy.get_free_boats(booking_start, booking_end), people)
+                    if not selected_boats:
+                        continue  # turned away
+                    occupancy.add(selected_boats, booking_start, booking_end)
+                    pending.append((Booking(
+                        id=next_id, name='Customer %s' % next_id, number_of_people=people, hire_point=hire_point,
+                        start_time=self._to_database(booking_start), end_time=self._to_database(booking_end)
+                    ), selected_boats, get_grid_slots(booking_start, booking_end, step)))
+                    next_id += 1
+                    if len(pending) >= options['batch_size']:
+                        self._write_bookings(pending)
+                        created += len(pending)
+                        pending = []
+        if pending:
+            self._write_bookings(pending)
+            created += len(pending)
+
+        # the ids have been set by hand, so the sequences must continue after them
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), [Booking]):
+                cursor.execute(sql)
+        self.stdout.write('Created %s hire points and %s bookings' % (len(hire_points), created))
+
     def handle(self, *args, **options):
+        if options['hire_points']:
+            if options['opening_hours'] is not None and not 1 <= options['opening_hours'] <= 23:
+                raise CommandError('--opening-hours must be between 1 and 23')
+            self._create_synthetic_data(options)
+            return
+
         # Create administrator user
         user, created = User.objects.get_or_create(
             username='admin', defaults={
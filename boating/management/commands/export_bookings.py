@@ -0,0 +1,41 @@
+import datetime
+import io
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import six
+
+from boating import export
+from boating.models import HirePoint
+
+
+class Command(BaseCommand):
+    help = 'Writes the bookings of a hire point between two dates as CSV, JSON lines or iCalendar'
+
+    def add_arguments(self, parser):
+        parser.add_argument('hire_point', type=int, help='Id of the hire point')
+        parser.add_argument('start', help='First day, as YYYY-MM-DD')
+        parser.add_argument('end', help='Last day, as YYYY-MM-DD')
+        parser.add_argument('--format', choices=sorted(export.FORMATS), default='csv')
+        parser.add_argument('--output', help='File where the bookings are written, by default the standard output')
+        parser.add_argument('--include-archived', action='store_true')
+
+    def handle(self, *args, **options):
+        try:
+            hire_point = HirePoint.objects.get(pk=options['hire_point'])
+        except HirePoint.DoesNotExist:
+            raise CommandError('Hire point %s does not exist' % options['hire_point'])
+        try:
+            start = datetime.datetime.strptime(options['start'], '%Y-%m-%d').date()
+            end = datetime.datetime.strptime(options['end'], '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError('The dates must be YYYY-MM-DD')
+
+        bookings = export.iter_bookings(hire_point, start, end, include_archived=options['include_archived'])
+        chunks = export.export(bookings, options['format'])
+        if options['output']:
+            with io.open(options['output'], 'w', encoding='utf-8', newline='') as output:
+                for chunk in chunks:
+                    output.write(chunk)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk.encode('utf-8') if six.PY2 else chunk, ending='')
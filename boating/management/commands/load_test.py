@@ -0,0 +1,72 @@
+import datetime
+import functools
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from boating import loadtest
+from boating.models import HirePoint
+
+
+class Command(BaseCommand):
+    help = (
+        'Fires concurrent booking requests at the same hire point and time window, reports the throughput, '
+        'the latency and the outcomes, and checks that no boat has been booked twice'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('hire_point', type=int, help='Id of the hire point')
+        parser.add_argument('start_time', help='Beginning of the window, as YYYY-MM-DD HH:MM')
+        parser.add_argument('--window', type=int, default=60, help='Minutes where the bookings start')
+        parser.add_argument('--duration', type=int, default=60, help='Minutes of every booking')
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=20, help='Requests sent at the same time')
+        parser.add_argument('--max-people', type=int, default=6, help='Parties are from 1 to max people')
+        parser.add_argument(
+            '--url', help='Base url of a running server, by default the WSGI application is called in this process'
+        )
+        parser.add_argument('--processes', action='store_true', help='Send from processes instead of threads')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--keep', action='store_true', help='Keep the bookings placed by this run')
+
+    def handle(self, *args, **options):
+        if options['processes'] and not options['url']:
+            raise CommandError('--processes needs --url, the WSGI application can only be shared by threads')
+        try:
+            hire_point = HirePoint.objects.get(pk=options['hire_point'])
+        except HirePoint.DoesNotExist:
+            raise CommandError('Hire point %s does not exist' % options['hire_point'])
+        try:
+            start_time = datetime.datetime.strptime(options['start_time'], '%Y-%m-%d %H:%M')
+        except ValueError:
+            raise CommandError('The start time must be YYYY-MM-DD HH:MM')
+        window = datetime.timedelta(minutes=options['window'])
+        duration = datetime.timedelta(minutes=options['duration'])
+
+        requests = loadtest.get_requests(
+            hire_point, start_time, window, duration, options['requests'], options['max_people'], options['seed']
+        )
+        if options['url']:
+            send = functools.partial(loadtest.post_over_http, options['url'].rstrip('/'))
+            results, elapsed = loadtest.run(requests, send, options['concurrency'], options['processes'])
+        else:
+            setup_test_environment()  # the test client is allowed by ALLOWED_HOSTS
+            try:
+                results, elapsed = loadtest.run(requests, loadtest.post_in_process, options['concurrency'])
+            finally:
+                teardown_test_environment()
+
+        summary = loadtest.summarize(results, elapsed)
+        self.stdout.write('%(requests)s requests in %(seconds).2fs, %(throughput).1f requests/s' % summary)
+        self.stdout.write('Latency: p50 %(p50_ms).1fms, p95 %(p95_ms).1fms, p99 %(p99_ms).1fms' % summary)
+        for outcome, count in sorted(summary['outcomes'].items()):
+            self.stdout.write('  %s: %s' % (outcome, count))
+
+        double_bookings = loadtest.find_double_bookings(hire_point, start_time, start_time + window + duration)
+        for boat_id, booking_id, other_booking_id in double_bookings:
+            self.stdout.write('Boat %s is in bookings %s and %s' % (boat_id, booking_id, other_booking_id))
+        if not options['keep']:
+            loadtest.delete_bookings(hire_point, results)
+        if double_bookings:
+            raise CommandError('%s double bookings found' % len(double_bookings))
+        self.stdout.write('No double bookings')
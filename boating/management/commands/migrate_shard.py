@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from boating import routers, sharding
+from boating.models import HirePoint
+
+
+class Command(BaseCommand):
+    help = (
+        'Copies the boats, opening times, series and bookings of a hire point to another database. '
+        'No booking of the hire point should be made meanwhile, afterwards BOATING_SHARD_MAP must give '
+        'the new database for the hire point. Once it does, run again with --delete and --source to delete '
+        'the rows left in the previous database'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('hire_point', type=int, help='Id of the hire point')
+        parser.add_argument('database', help='Alias of the target database')
+        parser.add_argument('--source', help='Alias of the database the rows are in, by default its shard')
+        parser.add_argument(
+            '--delete', action='store_true',
+            help='Delete the rows from the source instead of copying them, the hire point must be in the target'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            hire_point = HirePoint.objects.get(pk=options['hire_point'])
+        except HirePoint.DoesNotExist:
+            raise CommandError('Hire point %s does not exist' % options['hire_point'])
+        source = options['source'] or routers.get_shard(hire_point.pk)
+        target = options['database']
+        for database in (source, target):
+            if database not in connections.databases:
+                raise CommandError('Database %s does not exist' % database)
+
+        if options['delete']:
+            # the reads and writes of the hire point still go to its shard, which must not be emptied
+            if routers.get_shard(hire_point.pk) != target:
+                raise CommandError('BOATING_SHARD_MAP must give %s for %s before deleting' % (target, hire_point))
+            if source == target:
+                raise CommandError('--delete needs the --source the rows were copied from')
+            sharding.delete_hire_point(hire_point, source)
+            self.stdout.write('Deleted the rows of %s from %s' % (hire_point, source))
+            return
+
+        try:
+            copied = sharding.copy_hire_point(hire_point, target, source)
+        except ValueError as error:
+            raise CommandError(str(error))
+        self.stdout.write(
+            'Copied %(boats)s boats, %(opening_times)s opening times, %(series)s series, %(bookings)s bookings '
+            'and %(archived_bookings)s archived bookings' % copied
+        )
+        self.stdout.write('Set BOATING_SHARD_MAP[%s] = %r and delete the rows from %s with --delete' % (
+            hire_point.pk, target, source
+        ))
@@ -0,0 +1,39 @@
+import datetime
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from boating import analytics
+
+
+class Command(BaseCommand):
+    help = (
+        'Computes the utilization, peak hours, sold out hours and empty seats of every boat and hire point '
+        'between two dates. The results are written as JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('start', help='First day, as YYYY-MM-DD')
+        parser.add_argument('end', help='Last day, as YYYY-MM-DD')
+        parser.add_argument('--hire-point', type=int, action='append', help='Id of a hire point, by default all')
+        parser.add_argument('--include-archived', action='store_true')
+        parser.add_argument('--output', help='File where the results are written, by default the standard output')
+
+    def handle(self, *args, **options):
+        try:
+            start = datetime.datetime.strptime(options['start'], '%Y-%m-%d').date()
+            end = datetime.datetime.strptime(options['end'], '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError('The dates must be YYYY-MM-DD')
+        if start > end:
+            raise CommandError('The start must not be after the end')
+
+        report = analytics.get_utilization(
+            start, end, hire_point_ids=options['hire_point'], include_archived=options['include_archived']
+        )
+        output = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                output_file.write(output)
+        else:
+            self.stdout.write(output)
@@ -0,0 +1,89 @@
+import json
+import logging
+import re
+from collections import Counter
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('boating.queries')
+logger.addHandler(logging.NullHandler())  # configured in LOGGING to be written
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_LISTS = re.compile(r'\(\?(?:, \?)+\)')
+
+
+def get_fingerprint(sql):
+    """
+    The query without its values, queries that only differ in them share the fingerprint
+    """
+    return _LISTS.sub('(...)', _LITERALS.sub('?', sql))
+
+
+def get_query_budget(url_name, method):
+    """
+    BOATING_QUERY_BUDGETS gives the maximum queries by url name, or by url name and method as 'name:METHOD'
+    :return: The maximum queries of a request or None if there is no budget
+    """
+    budgets = getattr(settings, 'BOATING_QUERY_BUDGETS', {})
+    return budgets.get('%s:%s' % (url_name, method), budgets.get(url_name))
+
+
+def get_query_stats(queries):
+    """
+    :param queries: list of dictionaries with the sql and the time as stored in connection.queries
+    :return: A dictionary with the number of queries, their time in milliseconds and the fingerprints
+    of the queries run more than once with the number of times
+    """
+    fingerprints = Counter(get_fingerprint(_query['sql']) for _query in queries)
+    return {
+        'count': len(queries),
+        'time_ms': round(sum(float(_query['time']) for _query in queries) * 1000, 3),
+        'duplicates': dict((_sql, _count) for _sql, _count in fingerprints.items() if _count > 1),
+    }
+
+
+class QueryCountMiddleware(object):
+    """
+    Records the queries of every request. With DEBUG they are sent back in the response headers,
+    otherwise they are logged as a JSON line in 'boating.queries', as a warning if the url has a budget
+    in BOATING_QUERY_BUDGETS and it is exceeded. The stats are also kept in request.query_stats
+    """
+
+    def process_request(self, request):
+        request._query_logs = []
+        for connection in connections.all():
+            request._query_logs.append((connection, connection.force_debug_cursor, len(connection.queries_log)))
+            connection.force_debug_cursor = True
+
+    def process_response(self, request, response):
+        query_logs = getattr(request, '_query_logs', None)
+        if query_logs is None:
+            return response
+        queries = []
+        for connection, force_debug_cursor, start in query_logs:
+            connection.force_debug_cursor = force_debug_cursor
+            queries.extend(list(connection.queries_log)[start:])
+        del request._query_logs
+
+        stats = get_query_stats(queries)
+        request.query_stats = stats
+        url_name = getattr(getattr(request, 'resolver_match', None), 'url_name', None)
+        budget = get_query_budget(url_name, request.method)
+
+        if settings.DEBUG:
+            response['X-Query-Count'] = stats['count']
+            response['X-Query-Time-Ms'] = stats['time_ms']
+            response['X-Query-Duplicates'] = sum(_count - 1 for _count in stats['duplicates'].values())
+            if budget is not None:
+                response['X-Query-Budget'] = budget
+        else:
+            line = json.dumps(dict(
+                stats, view=url_name, path=request.path, method=request.method, status=response.status_code,
+                budget=budget
+            ), sort_keys=True)
+            if budget is not None and stats['count'] > budget:
+                logger.warning(line)
+            else:
+                logger.info(line)
+        return response
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.5 on 2026-10-18 08:22
+from __future__ import unicode_literals
+
+import datetime
+import logging
+
+from django.db import IntegrityError, migrations, models, transaction
+from django.utils import timezone
+import django.db.models.deletion
+
+SLOT_TIME = 15
+
+logger = logging.getLogger('boating.migrations')
+
+
+def claim_booked_boats(apps, schema_editor):
+    database = schema_editor.connection.alias
+    Booking = apps.get_model('boating', 'Booking')
+    BoatSlotClaim = apps.get_model('boating', 'BoatSlotClaim')
+    step = datetime.timedelta(minutes=SLOT_TIME)
+    for booking in Booking.objects.using(database).prefetch_related('boats'):
+        start_time, end_time = [
+            timezone.make_naive(_time) if timezone.is_aware(_time) else _time
+            for _time in sorted([booking.start_time, booking.end_time])
+        ]
+        midnight = datetime.datetime.combine(start_time.date(), datetime.time.min)
+        seconds = int((start_time - midnight).total_seconds())
+        slots = [midnight + datetime.timedelta(seconds=seconds - seconds % int(step.total_seconds()))]
+        while slots[-1] + step < end_time:
+            slots.append(slots[-1] + step)
+        # slot by slot, bookings off the slot grid may share a slot with the previous one
+        for boat in booking.boats.all():
+            for slot in slots:
+                try:
+                    with transaction.atomic(using=database):
+                        BoatSlotClaim.objects.using(database).create(boat=boat, booking=booking, slot=slot)
+                except IntegrityError:
+                    other_booking_ids = list(BoatSlotClaim.objects.using(database).filter(
+                        boat=boat, slot=slot
+                    ).values_list('booking_id', flat=True))
+                    logger.warning(
+                        'Slot %s of boat %s not claimed for booking %s, it is claimed by booking %s',
+                        slot, boat.pk, booking.pk, ', '.join('%s' % _id for _id in other_booking_ids)
+                    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boating', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BoatSlotClaim',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slot', models.DateTimeField()),
+                ('boat', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='claims', to='boating.Boat')),
+                ('booking', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='claims', to='boating.Booking')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='boatslotclaim',
+            unique_together=set([('boat', 'slot')]),
+        ),
+        migrations.RunPython(claim_booked_boats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.5 on 2026-10-18 08:29
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def copy_booked_boats(apps, schema_editor):
+    Booking = apps.get_model('boating', 'Booking')
+    BoatOccupancy = apps.get_model('boating', 'BoatOccupancy')
+    for booking in Booking.objects.prefetch_related('boats'):
+        BoatOccupancy.objects.bulk_create([
+            BoatOccupancy(
+                boat=_boat, hire_point_id=booking.hire_point_id, booking=booking,
+                start_time=booking.start_time, end_time=booking.end_time
+            )
+            for _boat in booking.boats.all()
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boating', '0002_boat_slot_claim'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BoatOccupancy',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_time', models.DateTimeField()),
+                ('end_time', models.DateTimeField()),
+                ('boat', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='occupancy', to='boating.Boat')),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='booking',
+            index_together=set([('hire_point', 'start_time', 'end_time')]),
+        ),
+        migrations.AddField(
+            model_name='boatoccupancy',
+            name='booking',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='occupancy', to='boating.Booking'),
+        ),
+        migrations.AddField(
+            model_name='boatoccupancy',
+            name='hire_point',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='occupancy', to='boating.HirePoint'),
+        ),
+        migrations.AlterIndexTogether(
+            name='boatoccupancy',
+            index_together=set([('boat', 'start_time', 'end_time'), ('hire_point', 'start_time', 'end_time')]),
+        ),
+        migrations.RunPython(copy_booked_boats, migrations.RunPython.noop),
+    ]
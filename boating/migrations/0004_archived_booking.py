@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.5 on 2026-10-18 08:57
+from __future__ import unicode_literals
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boating', '0003_boat_occupancy'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedBooking',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=50)),
+                ('number_of_people', models.IntegerField(validators=[django.core.validators.MinValueValidator(1)])),
+                ('start_time', models.DateTimeField()),
+                ('end_time', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('boats', models.ManyToManyField(related_name='archived_bookings', to='boating.Boat')),
+                ('hire_point', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_bookings', to='boating.HirePoint')),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='archivedbooking',
+            index_together=set([('hire_point', 'start_time', 'end_time')]),
+        ),
+    ]
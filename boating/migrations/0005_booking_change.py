@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.5 on 2026-10-18 09:01
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def record_existing_bookings(apps, schema_editor):
+    Booking = apps.get_model('boating', 'Booking')
+    BookingChange = apps.get_model('boating', 'BookingChange')
+    BookingChange.objects.bulk_create([
+        BookingChange(booking_id=_booking_id, hire_point_id=_hire_point_id, action='created')
+        for _booking_id, _hire_point_id in Booking.objects.order_by('id').values_list('id', 'hire_point_id')
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boating', '0004_archived_booking'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookingChange',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('booking_id', models.IntegerField()),
+                ('hire_point_id', models.IntegerField()),
+                ('action', models.CharField(choices=[(b'created', b'Created'), (b'updated', b'Updated'), (b'deleted', b'Deleted'), (b'archived', b'Archived')], max_length=10)),
+                ('changed_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='bookingchange',
+            index_together=set([('hire_point_id', 'id')]),
+        ),
+        migrations.RunPython(record_existing_bookings, migrations.RunPython.noop),
+    ]
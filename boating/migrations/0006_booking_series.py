@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.5 on 2026-10-18 09:20
+from __future__ import unicode_literals
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boating', '0005_booking_change'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookingSeries',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50)),
+                ('number_of_people', models.IntegerField(validators=[django.core.validators.MinValueValidator(1)])),
+                ('start_time', models.DateTimeField()),
+                ('duration', models.IntegerField()),
+                ('occurrences', models.IntegerField()),
+                ('every', models.IntegerField(default=1)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('hire_point', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='series', to='boating.HirePoint')),
+            ],
+            options={
+                'verbose_name_plural': 'booking series',
+            },
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='series',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='bookings', to='boating.BookingSeries'),
+        ),
+    ]
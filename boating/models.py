@@ -1,14 +1,59 @@
+import collections
+from contextlib import contextmanager
 import datetime
+import functools
+import itertools
+import operator
+import threading
 
+from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import DEFAULT_DB_ALIAS, models, transaction
 from django.db.models import Q
 from django.utils.six import python_2_unicode_compatible
 
-from boating.choices import DAYS
+from boating import reference
+from boating.availability import (
+    Occupancy, allocate_boats, available_slots_by_duration, get_grid_slots, iter_times, select_boats,
+    sweep_available_slots, sweep_boats_in_use, to_naive
+)
+from boating.choices import ARCHIVED, CHANGE_ACTIONS, CREATED, DAYS
 
 SLOT_TIME = 15  # 15 minutes
 MAX_DURATION = 60*3  # 3 hours
+SEARCH_DAYS = 60  # days looked at when searching the next available slot
+MAX_SERIES_OCCURRENCES = 52  # bookings of a series
+TOO_LONG = 'A booking can not last more than %s minutes' % MAX_DURATION
+
+
+_changes = threading.local()
+
+
+@contextmanager
+def record_changes_in_bulk():
+    """
+    Saves and deletes bookings inside the block without the change recorded for every one of them by the
+    signals, the code in the block writes the changes itself
+    """
+    previous = getattr(_changes, 'in_bulk', False)
+    _changes.in_bulk = True
+    try:
+        yield
+    finally:
+        _changes.in_bulk = previous
+
+
+def are_changes_recorded_in_bulk():
+    return getattr(_changes, 'in_bulk', False)
+
+
+def get_earliest_start(start_time):
+    """
+    Earliest start of a booking still going on at a time, it bounds the range of the indexes on start_time
+    that would otherwise be read from the first booking. The bookings longer than MAX_DURATION are refused
+    by Booking.clean
+    """
+    return start_time - datetime.timedelta(minutes=MAX_DURATION)
 
 
 @python_2_unicode_compatible
@@ -19,79 +64,264 @@ class HirePoint(models.Model):
     def __str__(self):
         return self.name
 
-    def get_available_slots(self, date, people, duration):
+    def get_available_slots(self, date, people, duration, occupancy=None):
         """
-        Gets all the available schedules and the boats selected
+        Gets all the available schedules and the boats selected.
+        The day's bookings and boats are loaded once and every slot is computed in memory
         :param date:
         :param people:
         :param duration:
+        :param occupancy: Occupancy to use instead of loading the bookings
         :return: Two list with the same lenght, the first one contains the available slots
         and the second the boats to be used
         """
-        slots = []
-        boats = []
-        time = self.get_start_time(date)
+        start_time = self.get_start_time(date)
+        closing_time = self.get_closing_time(date)
+        if start_time is None or closing_time is None:
+            return [], []
+
+        if occupancy is not None:
+            slots = []
+            boats = []
+            time = start_time
+            while time < closing_time:
+                boats_available = self.is_available(
+                    people=people, start_time=time, duration=duration, occupancy=occupancy
+                )
+                if boats_available:
+                    slots.append(time)
+                    boats.append(boats_available)
+                time += datetime.timedelta(minutes=SLOT_TIME)
+            return slots, boats
+
+        return sweep_available_slots(
+            times=iter_times(start_time, closing_time, datetime.timedelta(minutes=SLOT_TIME)),
+            duration=duration,
+            people=people,
+            boats=self.get_boats(),
+            bookings=self.get_booking_intervals(start_time=start_time, end_time=closing_time + duration),
+        )
+
+    def get_available_slots_by_duration(self, date, people, durations):
+        """
+        Same as get_available_slots for several durations, loading the day's bookings once
+        :param date:
+        :param people:
+        :param durations: multiples of SLOT_TIME
+        :return: A dictionary with the durations as keys and the values returned by get_available_slots
+        """
+        start_time = self.get_start_time(date)
         closing_time = self.get_closing_time(date)
-        while time < closing_time:
-            boats_available = self.is_available(people=people, start_time=time, duration=duration)
-            if boats_available:
-                slots.append(time)
-                boats.append(boats_available)
-            time += datetime.timedelta(minutes=SLOT_TIME)
-        return slots, boats
+        if start_time is None or closing_time is None:
+            return dict((_duration, ([], [])) for _duration in durations)
 
-    def is_available(self, start_time, people, duration):
+        return available_slots_by_duration(
+            start_time=start_time,
+            closing_time=closing_time,
+            step=datetime.timedelta(minutes=SLOT_TIME),
+            durations=durations,
+            people=people,
+            boats=self.get_boats(),
+            bookings=self.get_booking_intervals(start_time=start_time, end_time=closing_time + max(durations)),
+        )
+
+    def is_available(self, start_time, people, duration, occupancy=None):
         """
         Check if there is any boat available in a concrete period
         :param start_time:
         :param people:
         :param duration:
+        :param occupancy: Occupancy to use instead of querying the bookings
         :return: A list of boats that the customer would use
         """
-        collision_bookings = Booking.get_bookings_between(
+        if occupancy is not None:
+            return allocate_boats(occupancy.get_free_boats(start_time, start_time + duration), people)
+
+        boats_in_use = set(BoatOccupancy.get_occupancy_between(
             hire_point=self, start_time=start_time, end_time=start_time + duration
+        ).values_list('boat_id', flat=True))
+        free_boats = [_boat for _boat in self.get_boats() if _boat.id not in boats_in_use]
+        return allocate_boats(free_boats, people)
+
+    def get_booking_intervals(self, start_time, end_time):
+        """
+        Loads the bookings that may collide with any period inside [start_time, end_time]
+        :return: A list of (start_time, end_time, boat ids) tuples
+        """
+        occupancy = self.occupancy.filter(
+            start_time__gte=get_earliest_start(start_time), start_time__lte=end_time, end_time__gte=start_time
+        ).values_list('start_time', 'end_time', 'boat_id')
+        return [
+            (to_naive(_start_time), to_naive(_end_time), [_boat_id])
+            for _start_time, _end_time, _boat_id in occupancy
+        ]
+
+    def get_occupancy(self, start_time, end_time):
+        """
+        Builds the occupancy bitmaps of every boat between two times
+        """
+        return Occupancy(
+            start_time=start_time,
+            end_time=end_time,
+            step=datetime.timedelta(minutes=SLOT_TIME),
+            boats=self.get_boats(),
+            bookings=self.get_booking_intervals(start_time=start_time, end_time=end_time),
+        )
+
+    def get_periods_occupancy(self, periods):
+        """
+        Builds the occupancy of several periods loading the bookings of all of them with one query
+        :param periods: list of (start_time, end_time) tuples sorted by start time
+        """
+        windows = functools.reduce(operator.or_, (
+            Q(start_time__gte=get_earliest_start(_start_time), start_time__lte=_end_time, end_time__gte=_start_time)
+            for _start_time, _end_time in periods
+        ))
+        occupancy = self.occupancy.filter(windows).values_list('start_time', 'end_time', 'boat_id')
+        return Occupancy(
+            start_time=periods[0][0],
+            end_time=max(_end_time for _start_time, _end_time in periods),
+            step=datetime.timedelta(minutes=SLOT_TIME),
+            boats=self.get_boats(),
+            bookings=[
+                (to_naive(_start_time), to_naive(_end_time), [_boat_id])
+                for _start_time, _end_time, _boat_id in occupancy
+            ],
         )
-        boats_per_booking = [_booking.boats.all() for _booking in collision_bookings]
-        boats_in_use = set([_boat for _boats in boats_per_booking for _boat in _boats])
-
-        selected_boats = []
-        boats_allocations = 0
-        free_boats = self.boats.all().exclude(id__in=[_boat.id for _boat in boats_in_use]).order_by('seats')
-        for free_boat in free_boats:
-            if free_boat.seats == people:  # perfect match
-                return [free_boat]
-            elif people > boats_allocations:  # if the space is still not enough
-                boats_allocations += free_boat.seats
-                selected_boats.append(free_boat)
-            elif free_boat.seats > people:  # it's not necessary keep looking
-                break
-
-        if people <= boats_allocations:
-            return selected_boats
-        else:
+
+    def get_day_occupancy(self, date, max_duration=MAX_DURATION):
+        """
+        Builds the occupancy of a whole day, including the bookings of any slot finishing after midnight
+        """
+        start_time = datetime.datetime.combine(date, datetime.time.min)
+        end_time = start_time + datetime.timedelta(days=1, minutes=max_duration)
+        return self.get_occupancy(start_time=start_time, end_time=end_time)
+
+    def get_month_availability(self, year, month, people, duration):
+        """
+        Counts the bookable slots of every day in a month, loading all the month's bookings at once
+        :param year:
+        :param month:
+        :param people:
+        :param duration:
+        :return: A list of dictionaries with the date, if the hire point opens
+        and the number of slots available for the whole duration
+        """
+        opening_times = self.get_config().opening_times
+        step = datetime.timedelta(minutes=SLOT_TIME)
+        first_date = datetime.date(year, month, 1)
+        days = []
+        date = first_date
+        while date.month == month:
+            opening_time = opening_times.get(date.isoweekday())
+            if opening_time is None:
+                days.append((date, None, None))
+            else:
+                days.append((
+                    date,
+                    datetime.datetime.combine(date, opening_time.from_hour),
+                    datetime.datetime.combine(date, opening_time.to_hour),
+                ))
+            date += datetime.timedelta(days=1)
+
+        slots = []
+        if opening_times:
+            slots, _boats = sweep_available_slots(
+                times=itertools.chain.from_iterable(
+                    iter_times(_start_time, _closing_time, step)
+                    for _date, _start_time, _closing_time in days if _start_time is not None
+                ),
+                duration=duration,
+                people=people,
+                boats=self.get_boats(),
+                bookings=self.get_booking_intervals(
+                    start_time=datetime.datetime.combine(first_date, datetime.time.min),
+                    end_time=datetime.datetime.combine(date, datetime.time.min) + duration,
+                ),
+            )
+
+        closing_times = dict((_date, _closing_time) for _date, _start_time, _closing_time in days)
+        bookable_slots = collections.Counter(
+            _slot.date() for _slot in slots if _slot + duration <= closing_times[_slot.date()]
+        )
+        return [
+            {'date': _date, 'is_open': _start_time is not None, 'slots': bookable_slots[_date]}
+            for _date, _start_time, _closing_time in days
+        ]
+
+    def get_next_available_slot(self, start_time, people, duration, max_days=SEARCH_DAYS, batch_days=7):
+        """
+        Looks for the first slot from a time onwards where the whole duration fits before closing.
+        Closed days are skipped using the opening times and the bookings are loaded a batch of days at a time
+        :param start_time: slots starting before this time are ignored
+        :param people:
+        :param duration:
+        :param max_days: days to look at, including the first one
+        :param batch_days: days whose bookings are loaded together
+        :return: A tuple with the slot and the boats to be used or None if there is no slot available
+        """
+        opening_times = self.get_config().opening_times
+        if not opening_times:
             return None
 
+        step = datetime.timedelta(minutes=SLOT_TIME)
+        periods = []
+        date = start_time.date()
+        for _day in range(max_days):
+            opening_time = opening_times.get(date.isoweekday())
+            if opening_time is not None:
+                periods.append((
+                    max(datetime.datetime.combine(date, opening_time.from_hour), start_time),
+                    datetime.datetime.combine(date, opening_time.to_hour),
+                ))
+            date += datetime.timedelta(days=1)
+
+        boats = self.get_boats()
+        for index in range(0, len(periods), batch_days):
+            batch = periods[index:index + batch_days]
+            times = (
+                _time
+                for _start_time, _closing_time in batch
+                for _time in iter_times(_start_time, _closing_time - duration + step, step)
+                if _time + duration <= _closing_time
+            )
+            bookings = self.get_booking_intervals(start_time=batch[0][0], end_time=batch[-1][1])
+            allocations = {}
+            for time, boats_in_use in sweep_boats_in_use(times, duration, bookings):
+                selected_boats = select_boats(boats, boats_in_use, people, allocations)
+                if selected_boats:
+                    return time, list(selected_boats)
+        return None
+
+    def get_config(self):
+        """
+        Opening times and boats, kept in memory between requests
+        """
+        return reference.load_hire_point_config(self)
+
+    def get_boats(self):
+        """
+        :return: A list with the boats sorted by seats
+        """
+        return list(self.get_config().boats)
+
     def get_start_time(self, date):
-        try:
-            opening_time = self.opening_times.get(day=date.isoweekday())
-            return datetime.datetime.combine(date, opening_time.from_hour)
-        except OpeningTimes.DoesNotExist:
+        opening_time = self.get_config().opening_times.get(date.isoweekday())
+        if opening_time is None:
             return None
+        return datetime.datetime.combine(date, opening_time.from_hour)
 
     def get_closing_time(self, date):
-        try:
-            opening_time = self.opening_times.get(day=date.isoweekday())
-            return datetime.datetime.combine(date, opening_time.to_hour)
-        except OpeningTimes.DoesNotExist:
+        opening_time = self.get_config().opening_times.get(date.isoweekday())
+        if opening_time is None:
             return None
+        return datetime.datetime.combine(date, opening_time.to_hour)
 
     def is_open(self, time):
-        try:
-            opening_time = self.opening_times.get(day=time.date().isoweekday())
-            return opening_time.from_hour <= time.time() and opening_time.to_hour >= time.time()
-        except OpeningTimes.DoesNotExist:
-            pass
-        return False
+        opening_time = self.get_config().opening_times.get(time.date().isoweekday())
+        if opening_time is None:
+            return False
+        return opening_time.from_hour <= time.time() and opening_time.to_hour >= time.time()
 
 
 class OpeningTimes(models.Model):
@@ -116,6 +346,62 @@ class Boat(models.Model):
         return 'Seats: %s' % self.seats
 
 
+@python_2_unicode_compatible
+class BookingSeries(models.Model):
+    """
+    Store the bookings repeated every some weeks, such as the ones of clubs and schools
+    """
+    name = models.CharField(max_length=50)
+    number_of_people = models.IntegerField(validators=[MinValueValidator(1)])
+    hire_point = models.ForeignKey(HirePoint, related_name='series')
+    start_time = models.DateTimeField()  # of the first booking
+    duration = models.IntegerField()  # minutes
+    occurrences = models.IntegerField()
+    every = models.IntegerField(default=1)  # weeks between bookings
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def clean(self):
+        if self.duration is not None and self.duration > MAX_DURATION:
+            raise ValidationError({'duration': TOO_LONG})
+
+    class Meta:
+        verbose_name_plural = 'booking series'
+
+    def __str__(self):
+        return '%s' % self.name
+
+    def create_bookings(self, allocations):
+        """
+        Creates bookings of the series with their boats, claims and occupancy with one bulk insert per table.
+        No signal is sent, the change feed is written here and the cache must be invalidated after it
+        :param allocations: list of (start time, boats) tuples
+        :return: The bookings sorted by start time
+        :raises: IntegrityError if any of the boats is already claimed by another booking
+        """
+        duration = datetime.timedelta(minutes=self.duration)
+        Booking.objects.using(self._state.db).bulk_create([
+            Booking(
+                series=self, name=self.name, number_of_people=self.number_of_people, hire_point_id=self.hire_point_id,
+                start_time=_start_time, end_time=_start_time + duration
+            )
+            for _start_time, _boats in allocations
+        ])
+        # bulk_create does not set the ids with every database
+        bookings = list(self.bookings.order_by('start_time'))
+        boats = dict(allocations)
+        booking_boats = [(_booking, boats[to_naive(_booking.start_time)]) for _booking in bookings]
+        Booking.boats.through.objects.using(self._state.db).bulk_create([
+            Booking.boats.through(booking_id=_booking.id, boat_id=_boat.pk)
+            for _booking, _boats in booking_boats for _boat in _boats
+        ])
+        Booking.bulk_claim_boats(booking_boats)
+        BookingChange.objects.using(self._state.db).bulk_create([
+            BookingChange(booking_id=_booking.id, hire_point_id=_booking.hire_point_id, action=CREATED)
+            for _booking in bookings
+        ])
+        return bookings
+
+
 @python_2_unicode_compatible
 class Booking(models.Model):
     """
@@ -127,15 +413,206 @@ class Booking(models.Model):
     boats = models.ManyToManyField(Boat, related_name='bookings')
     start_time = models.DateTimeField()
     end_time = models.DateTimeField()
+    series = models.ForeignKey(BookingSeries, null=True, blank=True, related_name='bookings')
+
+    class Meta:
+        index_together = [('hire_point', 'start_time', 'end_time')]
+
+    def __str__(self):
+        return '%s' % self.name
+
+    def clean(self):
+        # the reads of the bookings overlapping a period only look MAX_DURATION before it
+        if self.start_time is not None and self.end_time is not None:
+            if self.end_time < self.start_time:
+                raise ValidationError({'end_time': 'The end must not be before the start'})
+            if self.end_time - self.start_time > datetime.timedelta(minutes=MAX_DURATION):
+                raise ValidationError({'end_time': TOO_LONG})
+
+    @classmethod
+    def get_bookings_between(cls, hire_point, start_time, end_time, include_archived=False):
+        """
+        :param include_archived: include the archived bookings too, a list sorted by start time
+        is returned instead of a queryset
+        """
+        bookings = hire_point.bookings.filter(
+            Q(start_time__lt=end_time, end_time__gt=start_time) |
+            Q(start_time=end_time, end_time=start_time),
+            start_time__gte=get_earliest_start(start_time)
+        )
+        if include_archived:
+            archived_bookings = ArchivedBooking.get_bookings_between(hire_point, start_time, end_time)
+            return sorted(
+                itertools.chain(bookings, archived_bookings), key=lambda _booking: _booking.start_time
+            )
+        return bookings
+
+    def claim_boats(self, boats):
+        """
+        Claims every slot of the booking for the boats given and records their occupancy
+        :raises: IntegrityError if any of the boats is already claimed by another booking
+        """
+        self.bulk_claim_boats([(self, boats)])
+
+    @classmethod
+    def bulk_claim_boats(cls, booking_boats):
+        """
+        Same as claim_boats for several bookings with one bulk insert per table
+        :param booking_boats: list of (booking, boats or boat ids) tuples, of bookings of the same hire point
+        """
+        if not booking_boats:
+            return
+        database = booking_boats[0][0]._state.db
+        step = datetime.timedelta(minutes=SLOT_TIME)
+        booking_boats = [
+            (_booking, [getattr(_boat, 'pk', _boat) for _boat in _boats]) for _booking, _boats in booking_boats
+        ]
+        BoatSlotClaim.objects.using(database).bulk_create([
+            BoatSlotClaim(boat_id=_boat_id, booking=_booking, slot=_slot)
+            for _booking, _boat_ids in booking_boats
+            for _slot in get_grid_slots(to_naive(_booking.start_time), to_naive(_booking.end_time), step)
+            for _boat_id in _boat_ids
+        ])
+        BoatOccupancy.objects.using(database).bulk_create([
+            BoatOccupancy(
+                boat_id=_boat_id, hire_point_id=_booking.hire_point_id, booking=_booking,
+                start_time=_booking.start_time, end_time=_booking.end_time
+            )
+            for _booking, _boat_ids in booking_boats for _boat_id in _boat_ids
+        ])
+
+    def release_boats(self, boats=None):
+        """
+        Releases the slots claimed for the boats given and their occupancy, all of them by default
+        """
+        claims = self.claims.all()
+        occupancy = self.occupancy.all()
+        if boats is not None:
+            claims = claims.filter(boat__in=boats)
+            occupancy = occupancy.filter(boat__in=boats)
+        claims.delete()
+        occupancy.delete()
+
+
+class BoatSlotClaim(models.Model):
+    """
+    Store the slots in use by every boat, the unique constraint stops two bookings from sharing a boat.
+    Slots are aligned to midnight, a booking takes every slot it touches
+    """
+    boat = models.ForeignKey(Boat, related_name='claims')
+    booking = models.ForeignKey(Booking, related_name='claims')
+    slot = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('boat', 'slot')
+
+
+class BoatOccupancy(models.Model):
+    """
+    Store the period every boat is in use by a booking. It copies the bookings and their boats
+    so overlap queries are answered from one indexed table without joins
+    """
+    boat = models.ForeignKey(Boat, related_name='occupancy')
+    hire_point = models.ForeignKey(HirePoint, related_name='occupancy')
+    booking = models.ForeignKey(Booking, related_name='occupancy')
+    start_time = models.DateTimeField()
+    end_time = models.DateTimeField()
+
+    class Meta:
+        index_together = [('hire_point', 'start_time', 'end_time'), ('boat', 'start_time', 'end_time')]
+
+    @classmethod
+    def get_occupancy_between(cls, hire_point, start_time, end_time):
+        """
+        Same periods than Booking.get_bookings_between, one row per boat
+        """
+        return hire_point.occupancy.filter(
+            Q(start_time__lt=end_time, end_time__gt=start_time) |
+            Q(start_time=end_time, end_time=start_time),
+            start_time__gte=get_earliest_start(start_time)
+        )
+
+
+@python_2_unicode_compatible
+class ArchivedBooking(models.Model):
+    """
+    Store the bookings older than the live booking window with their boats, they are not taken
+    into account for the availability
+    """
+    id = models.IntegerField(primary_key=True)  # the id it had as a booking
+    name = models.CharField(max_length=50)
+    number_of_people = models.IntegerField(validators=[MinValueValidator(1)])
+    hire_point = models.ForeignKey(HirePoint, related_name='archived_bookings')
+    boats = models.ManyToManyField(Boat, related_name='archived_bookings')
+    start_time = models.DateTimeField()
+    end_time = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        index_together = [('hire_point', 'start_time', 'end_time')]
 
     def __str__(self):
         return '%s' % self.name
 
     @classmethod
     def get_bookings_between(cls, hire_point, start_time, end_time):
-        return cls.objects.filter(
-            hire_point=hire_point
-        ).filter(
+        return hire_point.archived_bookings.filter(
             Q(start_time__lt=end_time, end_time__gt=start_time) |
-            Q(start_time=end_time, end_time=start_time)
+            Q(start_time=end_time, end_time=start_time),
+            start_time__gte=get_earliest_start(start_time)
         )
+
+    @classmethod
+    def archive(cls, before, batch_size=500, using=DEFAULT_DB_ALIAS):
+        """
+        Moves a batch of the bookings ended before a time to the archive, with their boats.
+        Every batch is a transaction and the bookings are removed as they are archived,
+        so the archival can be stopped at any moment and continued later
+        :param before:
+        :param batch_size: bookings moved, SQLite does not take more than 999 parameters in a query
+        :param using: database of the bookings, the archive is kept in the same one
+        :return: The number of bookings archived, 0 when there are no more
+        """
+        with transaction.atomic(using=using):
+            bookings = list(Booking.objects.using(using).filter(end_time__lt=before).order_by('id')[:batch_size])
+            if not bookings:
+                return 0
+            booking_ids = [_booking.id for _booking in bookings]
+            cls.objects.using(using).bulk_create([
+                cls(
+                    id=_booking.id, name=_booking.name, number_of_people=_booking.number_of_people,
+                    hire_point_id=_booking.hire_point_id, start_time=_booking.start_time, end_time=_booking.end_time
+                )
+                for _booking in bookings
+            ])
+            cls.boats.through.objects.using(using).bulk_create([
+                cls.boats.through(archivedbooking_id=_booking_id, boat_id=_boat_id)
+                for _booking_id, _boat_id in Booking.boats.through.objects.using(using).filter(
+                    booking_id__in=booking_ids
+                ).values_list('booking_id', 'boat_id')
+            ])
+            BookingChange.objects.using(using).bulk_create([
+                BookingChange(booking_id=_booking.id, hire_point_id=_booking.hire_point_id, action=ARCHIVED)
+                for _booking in bookings
+            ])
+            with record_changes_in_bulk():
+                Booking.objects.using(using).filter(id__in=booking_ids).delete()
+        return len(bookings)
+
+
+@python_2_unicode_compatible
+class BookingChange(models.Model):
+    """
+    Append only log of the bookings created, updated, deleted and archived. The ids are the sequence
+    the change feed is read in. The bookings and hire points are referred by id so the changes outlive them
+    """
+    booking_id = models.IntegerField()
+    hire_point_id = models.IntegerField()
+    action = models.CharField(max_length=10, choices=CHANGE_ACTIONS)
+    changed_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        index_together = [('hire_point_id', 'id')]
+
+    def __str__(self):
+        return '%s %s' % (self.booking_id, self.action)
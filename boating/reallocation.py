@@ -0,0 +1,188 @@
+"""
+Reallocation of the boats of existing bookings to make room for a new party.
+
+The boats of every booking are selected when it is placed, so the boats given to earlier bookings may
+block a party even when swapping boats among them would leave enough room. The bookings overlapping the
+new one are moved between boats with a backtracking search bounded in time and size, the bookings that
+only overlap those keep their boats, and so do the bookings already started.
+"""
+import datetime
+import itertools
+import timeit
+
+from django.conf import settings
+from django.utils import timezone
+
+from boating import routers
+from boating.availability import Occupancy, to_naive
+from boating.choices import UPDATED
+from boating.models import BookingChange, MAX_DURATION, SLOT_TIME, get_earliest_start
+
+MAX_SELECTIONS = 20  # selections of boats tried for every booking
+
+
+class Plan(object):
+    """
+    Boats for the new booking and the bookings to move with their new boats
+    """
+
+    def __init__(self, hire_point, boats, moves):
+        self.hire_point = hire_point
+        self.boats = boats
+        self.moves = moves  # boats by booking id
+
+
+class _OutOfTime(Exception):
+    pass
+
+
+def get_selections(boats, people, limit=MAX_SELECTIONS):
+    """
+    Selections of boats with enough seats for a party where no boat could be left out,
+    the ones with the fewest seats left empty and then the fewest boats first
+    :param boats: boats to choose from
+    :param people:
+    :param limit: maximum selections
+    :return: A list of lists of boats
+    """
+    boats = sorted(boats, key=lambda _boat: (-_boat.seats, _boat.id))
+    remaining = [sum(_boat.seats for _boat in boats[_index:]) for _index in range(len(boats) + 1)]
+
+    def _iter_selections(index, selected, seats):
+        if seats >= people:
+            yield list(selected)
+            return
+        if index == len(boats) or seats + remaining[index] < people:
+            return
+        selected.append(boats[index])
+        for selection in _iter_selections(index + 1, selected, seats + boats[index].seats):
+            yield selection
+        selected.pop()
+        for selection in _iter_selections(index + 1, selected, seats):
+            yield selection
+
+    # only a bounded number of them is generated, the number of selections grows exponentially with the boats
+    selections = list(itertools.islice(_iter_selections(0, [], 0), limit * 10))
+    selections.sort(key=lambda _selection: (sum(_boat.seats for _boat in _selection), len(_selection)))
+    return selections[:limit]
+
+
+def _assign(bookings, index, in_use, boats, deadline, assignment):
+    """
+    Gives boats to the bookings from index onwards without sharing them with overlapping bookings
+    :param bookings: list of (booking id, mask, people, boat ids) tuples
+    :param in_use: bitmaps of the slots every boat is in use, updated while searching
+    :param assignment: boats by booking id, filled in when a solution is found
+    :return: True if every booking has got boats
+    :raises: _OutOfTime when the deadline has passed
+    """
+    if index == len(bookings):
+        return True
+    if timeit.default_timer() > deadline:
+        raise _OutOfTime()
+    booking_id, mask, people, boat_ids = bookings[index]
+    free_boats = [_boat for _boat in boats if not in_use[_boat.id] & mask]
+    selections = get_selections(free_boats, people)
+    current = [_boat for _boat in free_boats if _boat.id in boat_ids]
+    if len(current) == len(boat_ids):  # keeping its boats is tried first
+        selections.insert(0, current)
+    for selection in selections:
+        for boat in selection:
+            in_use[boat.id] |= mask
+        if _assign(bookings, index + 1, in_use, boats, deadline, assignment):
+            assignment[booking_id] = selection
+            return True
+        for boat in selection:
+            in_use[boat.id] &= ~mask
+    return False
+
+
+def find_plan(hire_point, start_time, duration, people, now=None, timeout=None, max_bookings=None):
+    """
+    Looks for new boats for the bookings overlapping a period that leave room for a party
+    :param hire_point:
+    :param start_time:
+    :param duration:
+    :param people:
+    :param now: bookings started before this time are not moved, by default the current time
+    :param timeout: seconds the search may take, BOATING_REALLOCATION_TIMEOUT by default, 0 disables it
+    :param max_bookings: no search is done when more bookings overlap the period,
+    BOATING_REALLOCATION_MAX_BOOKINGS by default
+    :return: A Plan or None if no plan has been found
+    """
+    if timeout is None:
+        timeout = getattr(settings, 'BOATING_REALLOCATION_TIMEOUT', 0.2)
+    if max_bookings is None:
+        max_bookings = getattr(settings, 'BOATING_REALLOCATION_MAX_BOOKINGS', 20)
+    if not timeout:
+        return None
+    start_time = to_naive(start_time)
+    end_time = start_time + duration
+    now = to_naive(now or timezone.now())
+    # the bookings overlapping the period and the ones overlapping those
+    margin = datetime.timedelta(minutes=2 * MAX_DURATION)
+    rows = hire_point.occupancy.filter(
+        start_time__gte=get_earliest_start(start_time - margin), start_time__lte=end_time + margin,
+        end_time__gte=start_time - margin
+    ).values_list('booking_id', 'boat_id', 'start_time', 'end_time', 'booking__number_of_people')
+    bookings = {}
+    for booking_id, boat_id, booking_start, booking_end, booking_people in rows:
+        bookings.setdefault(booking_id, (to_naive(booking_start), to_naive(booking_end), booking_people, set()))
+        bookings[booking_id][3].add(boat_id)
+
+    boats = hire_point.get_boats()
+    occupancy = Occupancy(
+        start_time=start_time - margin, end_time=end_time + margin, step=datetime.timedelta(minutes=SLOT_TIME),
+        boats=boats, bookings=[]
+    )
+    new_mask = occupancy.get_mask(start_time, end_time)
+    in_use = dict((_boat.id, 0) for _boat in boats)
+    movable = []
+    for booking_id, (booking_start, booking_end, booking_people, boat_ids) in bookings.items():
+        mask = occupancy.get_mask(booking_start, booking_end)
+        if mask & new_mask and booking_start > now and boat_ids <= set(in_use):
+            movable.append((booking_id, mask, booking_people, boat_ids))
+        else:
+            for boat_id in boat_ids:
+                if boat_id in in_use:
+                    in_use[boat_id] |= mask
+    if not movable or len(movable) > max_bookings:
+        return None
+    # the largest parties have the fewest choices
+    movable.sort(key=lambda _booking: (-_booking[2], _booking[0]))
+
+    deadline = timeit.default_timer() + timeout
+    free_boats = [_boat for _boat in boats if not in_use[_boat.id] & new_mask]
+    try:
+        for selection in get_selections(free_boats, people):
+            for boat in selection:
+                in_use[boat.id] |= new_mask
+            assignment = {}
+            if _assign(movable, 0, in_use, boats, deadline, assignment):
+                return Plan(hire_point, selection, dict(
+                    (_booking_id, assignment[_booking_id])
+                    for _booking_id, _mask, _people, _boat_ids in movable
+                    if set(_boat.id for _boat in assignment[_booking_id]) != _boat_ids
+                ))
+            for boat in selection:
+                in_use[boat.id] &= ~new_mask
+    except _OutOfTime:
+        pass
+    return None
+
+
+def apply_plan(plan):
+    """
+    Moves the bookings of a plan to their new boats, it must be run in a transaction
+    :raises: IntegrityError if any of the boats has been claimed by another booking meanwhile
+    """
+    bookings = list(plan.hire_point.bookings.filter(pk__in=plan.moves))
+    # every boat is released before any is claimed, the bookings may be swapping them
+    for booking in bookings:
+        booking.boats.clear()
+    for booking in bookings:
+        booking.boats.add(*plan.moves[booking.pk])
+    BookingChange.objects.using(routers.get_shard(plan.hire_point.pk)).bulk_create([
+        BookingChange(booking_id=_booking.pk, hire_point_id=_booking.hire_point_id, action=UPDATED)
+        for _booking in bookings
+    ])
@@ -0,0 +1,98 @@
+"""
+Process local copy of the hire points with their opening times and boats.
+
+This configuration is read on every request and rarely changes, so it is loaded once and kept in memory.
+A version stamp in BOATING_CACHE is bumped whenever a hire point, an opening time or a boat changes,
+and every process reloads its copy when it sees a version it did not load. The cache must be shared by
+processes, boating.W001 warns about a local memory one, whose changes never reach the other processes.
+"""
+from collections import OrderedDict
+import threading
+import uuid
+
+from django.apps import apps
+
+from boating import cache, routers
+
+VERSION_KEY = 'boating:reference:version'
+
+_lock = threading.Lock()
+_loaded = {'version': None, 'hire_points': None}
+
+
+class HirePointConfig(object):
+    """
+    A hire point with its opening times by day and its boats sorted by seats
+    """
+
+    def __init__(self, hire_point, opening_times, boats):
+        self.hire_point = hire_point
+        self.opening_times = opening_times
+        self.boats = boats
+
+
+def get_version():
+    version = cache.get_cache().get(VERSION_KEY)
+    if version is None:
+        cache.get_cache().add(VERSION_KEY, uuid.uuid4().hex, None)
+        version = cache.get_cache().get(VERSION_KEY)
+    return version
+
+
+def _load(hire_points):
+    """
+    :param hire_points: queryset of the hire points to load
+    :return: A dictionary of HirePointConfig by hire point id
+    """
+    hire_points = OrderedDict((_hire_point.pk, _hire_point) for _hire_point in hire_points)
+    opening_times = dict((_pk, {}) for _pk in hire_points)
+    boats = dict((_pk, []) for _pk in hire_points)
+    shards = {}
+    for pk in hire_points:
+        shards.setdefault(routers.get_shard(pk), []).append(pk)
+    OpeningTimes = apps.get_model('boating', 'OpeningTimes')
+    Boat = apps.get_model('boating', 'Boat')
+    for database, pks in sorted(shards.items()):
+        for opening_time in OpeningTimes.objects.using(database).filter(hire_point__in=pks):
+            opening_times[opening_time.hire_point_id][opening_time.day] = opening_time
+        for boat in Boat.objects.using(database).filter(hire_point__in=pks).order_by('seats', 'id'):
+            boats[boat.hire_point_id].append(boat)
+    return OrderedDict(
+        (_pk, HirePointConfig(_hire_point, opening_times[_pk], boats[_pk]))
+        for _pk, _hire_point in hire_points.items()
+    )
+
+
+def get_hire_points():
+    """
+    :return: A dictionary of HirePointConfig by hire point id, sorted by name
+    """
+    version = get_version()
+    with _lock:
+        if _loaded['version'] != version:
+            HirePoint = apps.get_model('boating', 'HirePoint')
+            with routers.use_replica(False):  # a replica behind would be kept under the new version
+                _loaded['hire_points'] = _load(HirePoint.objects.order_by('name', 'id'))
+            _loaded['version'] = version
+        return _loaded['hire_points']
+
+
+def get_hire_point_config(hire_point_id):
+    """
+    :return: The HirePointConfig of a hire point or None if it does not exist
+    """
+    return get_hire_points().get(int(hire_point_id))
+
+
+def load_hire_point_config(hire_point):
+    """
+    Configuration of a hire point that may not be loaded yet, read from the database if so
+    """
+    config = get_hire_point_config(hire_point.pk) if hire_point.pk else None
+    if config is None:
+        config = _load([hire_point])[hire_point.pk]
+    return config
+
+
+def invalidate():
+    cache.get_cache().set(VERSION_KEY, uuid.uuid4().hex, None)
@@ -0,0 +1,201 @@
+"""
+Routing of the hire points to their shards and of the availability reads to a read replica.
+
+BOATING_SHARD_MAP gives the database of every hire point, by id, the ones left out are in the default one.
+The boats, opening times, bookings and the rest of rows of a hire point are stored in its shard, the hire
+points are kept in the default database, which lists them all, and copied to their shard for the foreign keys.
+The queries made through a hire point or through any of its rows, such as hire_point.bookings or
+booking.boats, go to its shard, the ones made without any, such as the admin forms, go to the shard
+given with use_shard, or to the default database.
+
+The database in BOATING_READ_REPLICA answers the reads of the views decorated with read_from_replica,
+which only show availability, every other read and every write, place_booking included, goes to the primary.
+A client that has just booked is pinned to the primary with a cookie for BOATING_REPLICA_PIN seconds,
+the replica may not have received the booking yet. The replica is a replica of the default database
+"""
+from contextlib import contextmanager
+from functools import wraps
+import threading
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+PIN_COOKIE = 'boating_primary'
+
+_state = threading.local()
+
+
+# rows stored in the shard of their hire point
+SHARDED_MODELS = (
+    'boat', 'openingtimes', 'bookingseries', 'booking', 'booking_boats', 'boatslotclaim', 'boatoccupancy',
+    'archivedbooking', 'archivedbooking_boats', 'bookingchange',
+)
+
+
+def get_shard(hire_point_id):
+    """
+    :return: The database alias of a hire point
+    """
+    shard_map = getattr(settings, 'BOATING_SHARD_MAP', {})
+    try:
+        return shard_map.get(int(hire_point_id), DEFAULT_DB_ALIAS)
+    except (TypeError, ValueError):
+        return DEFAULT_DB_ALIAS
+
+
+def get_shards():
+    """
+    :return: The database aliases with any hire point, the default one first
+    """
+    return [DEFAULT_DB_ALIAS] + sorted(
+        set(getattr(settings, 'BOATING_SHARD_MAP', {}).values()) - set([DEFAULT_DB_ALIAS])
+    )
+
+
+@contextmanager
+def use_shard(hire_point_id):
+    """
+    Sends the queries of this thread inside the block that are not made through a hire point or its rows
+    to the shard of a hire point, to the default database if it is None
+    """
+    previous = getattr(_state, 'shard', None)
+    _state.shard = get_shard(hire_point_id) if hire_point_id is not None else None
+    try:
+        yield
+    finally:
+        _state.shard = previous
+
+
+def render(response):
+    """
+    Renders a template response so the querysets given to the template are read in the current block
+    """
+    if hasattr(response, 'render') and not response.is_rendered:
+        response.render()
+    return response
+
+
+def get_replica():
+    """
+    :return: The alias of the read replica or None if there is none
+    """
+    return getattr(settings, 'BOATING_READ_REPLICA', None)
+
+
+def get_pin_seconds():
+    return getattr(settings, 'BOATING_REPLICA_PIN', 5)
+
+
+def is_replica_used():
+    """
+    :return: True if the reads of this thread go to the replica
+    """
+    return getattr(_state, 'replica', False) and get_replica() is not None
+
+
+@contextmanager
+def use_replica(enabled=True):
+    """
+    Sends the reads of this thread inside the block to the replica, or to the primary if not enabled
+    """
+    previous = getattr(_state, 'replica', False)
+    _state.replica = enabled
+    try:
+        yield
+    finally:
+        _state.replica = previous
+
+
+def is_pinned(request):
+    try:
+        return float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def pin_to_primary(response):
+    """
+    Sends the reads of the next requests of the client to the primary for BOATING_REPLICA_PIN seconds
+    """
+    if get_replica() is not None:
+        response.set_cookie(PIN_COOKIE, '%d' % (time.time() + get_pin_seconds()), max_age=get_pin_seconds())
+    return response
+
+
+def read_from_replica(view):
+    """
+    Decorator of the views whose reads may go to the replica, unless the client is pinned to the primary
+    """
+    @wraps(view)
+    def _view(request, *args, **kwargs):
+        with use_replica(not is_pinned(request)):
+            return render(view(request, *args, **kwargs))
+    return _view
+
+
+def _is_sharded(model):
+    return model._meta.app_label == 'boating' and model._meta.model_name in SHARDED_MODELS
+
+
+def _get_database(instance):
+    """
+    :return: The database of the rows of the hire point of an object, for the rows themselves
+    the one they were read from or written to
+    """
+    if instance._meta.app_label == 'boating' and instance._meta.model_name == 'hirepoint':
+        return get_shard(instance.pk)
+    if instance._state.db is not None:
+        return instance._state.db
+    if getattr(instance, 'hire_point_id', None) is not None:
+        return get_shard(instance.hire_point_id)
+    return None
+
+
+class ShardRouter(object):
+    def _db_for_model(self, model, **hints):
+        if not _is_sharded(model):
+            if hints.get('instance') is not None and hints['instance']._state.db not in (None, DEFAULT_DB_ALIAS):
+                return DEFAULT_DB_ALIAS  # the hire point of a row read from a shard
+            return None
+        database = None
+        if hints.get('instance') is not None:
+            database = _get_database(hints['instance'])
+        if database is None:
+            database = getattr(_state, 'shard', None)
+        # the reads of the default database may go to the replica
+        return database if database != DEFAULT_DB_ALIAS else None
+
+    db_for_read = _db_for_model
+
+    def db_for_write(self, model, **hints):
+        return self._db_for_model(model, **hints) or DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the rows of a hire point are in the same shard and its hire point is in every database
+        if obj1._meta.app_label == 'boating' and obj2._meta.app_label == 'boating':
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return None
+
+
+class ReplicaRouter(object):
+    def db_for_read(self, model, **hints):
+        if is_replica_used():
+            return get_replica()
+        return None
+
+    def db_for_write(self, model, **hints):
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replica has the same rows than the primary
+        databases = set([DEFAULT_DB_ALIAS, get_replica()])
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return None
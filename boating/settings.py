@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/1.9/ref/settings/
 """
 
 import os
+import tempfile
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -51,6 +52,7 @@ MIDDLEWARE_CLASSES = [
     'django.contrib.auth.middleware.SessionAuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'boating.middleware.QueryCountMiddleware',
 ]
 
 ROOT_URLCONF = 'boating.urls'
@@ -81,9 +83,73 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+    },
+    # A read replica of the default database, enabled with BOATING_READ_REPLICA = 'replica'
+    # 'replica': {
+    #     'ENGINE': 'django.db.backends.sqlite3',
+    #     'NAME': os.path.join(BASE_DIR, 'db-replica.sqlite3'),
+    # },
+}
+
+DATABASE_ROUTERS = ['boating.routers.ShardRouter', 'boating.routers.ReplicaRouter']
+
+# Database alias of the hire points by id, the ones left out are kept in the default database.
+# A hire point is moved to another database with the migrate_shard command
+BOATING_SHARD_MAP = {}
+
+# Database alias answering the reads of the availability pages, None reads everything from the default one
+BOATING_READ_REPLICA = None
+BOATING_REPLICA_PIN = 5  # seconds a client reads from the default database after booking
+
+
+# Cache
+# https://docs.djangoproject.com/en/1.9/topics/cache/
+
+# The cache is shared by every process, it keeps the versions of the availability and of the hire points
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(tempfile.gettempdir(), 'boating_cache'),
     }
 }
 
+BOATING_CACHE = 'default'
+BOATING_CACHE_TIMEOUT = 60 * 60
+
+# Boats selection, boating.allocation.optimal leaves fewer seats empty
+BOATING_ALLOCATION_STRATEGY = 'boating.allocation.greedy'
+
+# Searches across hire points
+BOATING_SEARCH_WORKERS = 4  # threads shared by the searches
+BOATING_SEARCH_TIMEOUT = 5  # seconds every hire point has
+
+# Bookings ended more than these days ago are moved to the archive by archive_bookings
+BOATING_ARCHIVE_DAYS = 365
+
+# Bookings written by a single thread per hire point, in batches, instead of by every request
+BOATING_BOOKING_WRITER = False
+BOATING_WRITER_QUEUE_SIZE = 100  # bookings waiting, the next ones are rejected
+BOATING_WRITER_BATCH_SIZE = 20  # bookings written in the same transaction
+BOATING_WRITER_TIMEOUT = 10  # seconds a booking may wait
+
+# Seconds a booking change waits before the change feed gives it. SQLite writes one transaction at a time,
+# with concurrent writers it gives the transactions that took an earlier id time to commit
+BOATING_CHANGES_DELAY = 0
+
+# When no boats are free for a booking the boats of the bookings overlapping it are reallocated if that
+# leaves room. The search gives up after these seconds or when more bookings overlap it, 0 disables it
+BOATING_REALLOCATION_TIMEOUT = 0.2
+BOATING_REALLOCATION_MAX_BOOKINGS = 20
+
+# Maximum queries by url name or by 'url name:method', the requests over budget are logged as warnings
+BOATING_QUERY_BUDGETS = {
+    'home': 3,
+    'booking:GET': 4,
+    'booking:POST': 9,
+    'booking_successful': 2,
+    'series:POST': 14,  # the claims of the longest series take two inserts in SQLite
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/1.9/ref/settings/#auth-password-validators
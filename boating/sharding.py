@@ -0,0 +1,140 @@
+"""
+Moves the rows of a hire point between databases.
+
+The ids are only unique inside every database, so the rows copied get new ids in the target and the
+bookings are written as new bookings, with their claims, occupancy and changes. The archived bookings
+are written as bookings and archived again, their id in the archive is the id they take as bookings.
+The change feed of the hire point starts again in the target, from the bookings it has.
+No booking of the hire point should be made while it is copied, BOATING_SHARD_MAP points to the
+source until it is changed to the target
+"""
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from boating import cache, reference, routers
+from boating.choices import ARCHIVED
+from boating.models import (
+    ArchivedBooking, Boat, Booking, BookingChange, BookingSeries, HirePoint, OpeningTimes, record_changes_in_bulk
+)
+
+SAME_DATABASE = 'The source and the target are the same database'
+TARGET_NOT_EMPTY = 'The target database already has rows of the hire point'
+
+
+def copy_hire_point_row(hire_point, database):
+    """
+    Writes the hire point itself in a shard, where the foreign keys of its rows refer to it
+    """
+    HirePoint.objects.using(database).update_or_create(pk=hire_point.pk, defaults=dict(
+        (_field.attname, getattr(hire_point, _field.attname))
+        for _field in HirePoint._meta.concrete_fields if not _field.primary_key
+    ))
+
+
+def _copy_bookings(model, hire_point, source, target, boat_ids, series_ids):
+    """
+    Writes the bookings or the archived bookings of a hire point in the target as bookings
+    :return: A list of (booking in the source, booking in the target) tuples
+    """
+    bookings = []
+    for booking in model.objects.using(source).filter(hire_point_id=hire_point.pk).order_by('id').prefetch_related(
+        'boats'
+    ):
+        copy = Booking(
+            name=booking.name, number_of_people=booking.number_of_people, hire_point_id=hire_point.pk,
+            start_time=booking.start_time, end_time=booking.end_time,
+            series_id=series_ids.get(getattr(booking, 'series_id', None))
+        )
+        copy.save(using=target)
+        if model is Booking:
+            # a boat moved to another hire point stays in the source
+            copy.boats.add(*[boat_ids[_boat.pk] for _boat in booking.boats.all() if _boat.pk in boat_ids])
+        bookings.append((booking, copy))
+    return bookings
+
+
+def copy_hire_point(hire_point, target, source=None):
+    """
+    Copies the opening times, boats, series, bookings and archived bookings of a hire point to another database
+    :param hire_point:
+    :param target: database alias
+    :param source: database alias, by default the one in BOATING_SHARD_MAP
+    :return: A dictionary with the number of rows copied of every kind
+    :raises: ValueError if the target is the source or it has rows of the hire point already
+    """
+    source = source or routers.get_shard(hire_point.pk)
+    if source == target:
+        raise ValueError(SAME_DATABASE)
+    if any(
+        _model.objects.using(target).filter(hire_point_id=hire_point.pk).exists()
+        for _model in (Boat, OpeningTimes, Booking, ArchivedBooking)
+    ):
+        raise ValueError(TARGET_NOT_EMPTY)
+
+    with transaction.atomic(using=target):
+        if target != DEFAULT_DB_ALIAS:
+            copy_hire_point_row(hire_point, target)
+        opening_times = list(OpeningTimes.objects.using(source).filter(hire_point_id=hire_point.pk))
+        OpeningTimes.objects.using(target).bulk_create([
+            OpeningTimes(
+                hire_point_id=hire_point.pk, day=_opening_time.day, from_hour=_opening_time.from_hour,
+                to_hour=_opening_time.to_hour
+            )
+            for _opening_time in opening_times
+        ])
+        boat_ids = {}
+        for boat in Boat.objects.using(source).filter(hire_point_id=hire_point.pk).order_by('id'):
+            copy = Boat(hire_point_id=hire_point.pk, seats=boat.seats)
+            copy.save(using=target)
+            boat_ids[boat.pk] = copy.pk
+        series_ids = {}
+        for series in BookingSeries.objects.using(source).filter(hire_point_id=hire_point.pk).order_by('id'):
+            source_id = series.pk
+            series.pk = None
+            series.save(using=target)
+            series_ids[source_id] = series.pk
+
+        bookings = _copy_bookings(Booking, hire_point, source, target, boat_ids, series_ids)
+        archived_bookings = _copy_bookings(ArchivedBooking, hire_point, source, target, boat_ids, series_ids)
+        ArchivedBooking.objects.using(target).bulk_create([
+            ArchivedBooking(
+                id=_copy.pk, name=_copy.name, number_of_people=_copy.number_of_people, hire_point_id=hire_point.pk,
+                start_time=_copy.start_time, end_time=_copy.end_time
+            )
+            for _archived_booking, _copy in archived_bookings
+        ])
+        ArchivedBooking.boats.through.objects.using(target).bulk_create([
+            ArchivedBooking.boats.through(archivedbooking_id=_copy.pk, boat_id=boat_ids[_boat.pk])
+            for _archived_booking, _copy in archived_bookings for _boat in _archived_booking.boats.all()
+            if _boat.pk in boat_ids
+        ])
+        BookingChange.objects.using(target).bulk_create([
+            BookingChange(booking_id=_copy.pk, hire_point_id=hire_point.pk, action=ARCHIVED)
+            for _archived_booking, _copy in archived_bookings
+        ])
+        with record_changes_in_bulk():
+            Booking.objects.using(target).filter(id__in=[_copy.pk for _booking, _copy in archived_bookings]).delete()
+
+    reference.invalidate()
+    cache.invalidate_hire_point(hire_point.pk)
+    return {
+        'opening_times': len(opening_times),
+        'boats': len(boat_ids),
+        'series': len(series_ids),
+        'bookings': len(bookings),
+        'archived_bookings': len(archived_bookings),
+    }
+
+
+def delete_hire_point(hire_point, database):
+    """
+    Deletes the rows of a hire point from a database, once they have been copied to another one.
+    The hire point itself is kept in the default database
+    """
+    with transaction.atomic(using=database):
+        for model in (Booking, ArchivedBooking, BookingSeries, Boat, OpeningTimes):
+            model.objects.using(database).filter(hire_point_id=hire_point.pk).delete()
+        BookingChange.objects.using(database).filter(hire_point_id=hire_point.pk).delete()
+        if database != DEFAULT_DB_ALIAS:
+            HirePoint.objects.using(database).filter(pk=hire_point.pk).delete()
+    reference.invalidate()
+    cache.invalidate_hire_point(hire_point.pk)
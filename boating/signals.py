@@ -0,0 +1,137 @@
+import functools
+
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from boating import cache, reference, routers, sharding
+from boating.choices import CREATED, DELETED, UPDATED
+from boating.models import (
+    Boat, Booking, BookingChange, HirePoint, OpeningTimes, MAX_DURATION, are_changes_recorded_in_bulk
+)
+
+
+def _invalidate_booking(booking, using):
+    # once committed, the slots read meanwhile from the previous rows would be cached under the new version
+    transaction.on_commit(functools.partial(
+        cache.invalidate_booking, hire_point_id=booking.hire_point_id, start_time=booking.start_time,
+        end_time=booking.end_time, max_duration=MAX_DURATION
+    ), using=using)
+
+
+@receiver(pre_save, sender=Booking)
+def invalidate_previous_booking_times(sender, instance, using, **kwargs):
+    if instance.pk:
+        for previous in Booking.objects.using(using).filter(pk=instance.pk):
+            _invalidate_booking(previous, using)
+
+
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+def invalidate_booking(sender, instance, using, **kwargs):
+    _invalidate_booking(instance, using)
+
+
+@receiver(m2m_changed, sender=Booking.boats.through)
+def invalidate_booking_boats(sender, instance, action, reverse, pk_set, using, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            _invalidate_booking(instance, using)
+    elif action == 'pre_clear':
+        # The boat's bookings are unknown once they have been cleared
+        instance._cleared_bookings = list(instance.bookings.all())
+    elif action == 'post_clear':
+        for booking in instance._cleared_bookings:
+            _invalidate_booking(booking, using)
+    elif action in ('post_add', 'post_remove'):
+        for booking in Booking.objects.using(using).filter(pk__in=pk_set):
+            _invalidate_booking(booking, using)
+
+
+@receiver(post_save, sender=Booking)
+def reclaim_booking_boats(sender, instance, created, **kwargs):
+    if not created:
+        instance.release_boats()
+        instance.claim_boats(instance.boats.all())
+
+
+@receiver(m2m_changed, sender=Booking.boats.through)
+def claim_booking_boats(sender, instance, action, reverse, pk_set, using, **kwargs):
+    if not reverse:
+        if action == 'post_add':
+            instance.claim_boats(pk_set)
+        elif action == 'post_remove':
+            instance.release_boats(pk_set)
+        elif action == 'post_clear':
+            instance.release_boats()
+    elif action == 'post_add':
+        for booking in Booking.objects.using(using).filter(pk__in=pk_set):
+            booking.claim_boats([instance])
+    elif action == 'post_remove':
+        for booking in Booking.objects.using(using).filter(pk__in=pk_set):
+            booking.release_boats([instance])
+    elif action == 'post_clear':
+        instance.claims.all().delete()
+        instance.occupancy.all().delete()
+
+
+@receiver(post_save, sender=Booking)
+def record_booking_saved(sender, instance, created, using, **kwargs):
+    if are_changes_recorded_in_bulk():
+        return
+    BookingChange.objects.using(using).create(
+        booking_id=instance.pk, hire_point_id=instance.hire_point_id, action=CREATED if created else UPDATED
+    )
+
+
+@receiver(post_delete, sender=Booking)
+def record_booking_deleted(sender, instance, using, **kwargs):
+    # the archive records its own changes
+    if are_changes_recorded_in_bulk():
+        return
+    BookingChange.objects.using(using).create(
+        booking_id=instance.pk, hire_point_id=instance.hire_point_id, action=DELETED
+    )
+
+
+@receiver(pre_save, sender=Boat)
+@receiver(pre_save, sender=OpeningTimes)
+def invalidate_previous_hire_point(sender, instance, using, **kwargs):
+    if instance.pk:
+        previous = sender.objects.using(using).filter(pk=instance.pk)
+        for hire_point_id in previous.values_list('hire_point_id', flat=True):
+            cache.invalidate_hire_point(hire_point_id)
+
+
+@receiver(post_save, sender=Boat)
+@receiver(post_delete, sender=Boat)
+@receiver(post_save, sender=OpeningTimes)
+@receiver(post_delete, sender=OpeningTimes)
+def invalidate_hire_point(sender, instance, **kwargs):
+    cache.invalidate_hire_point(instance.hire_point_id)
+
+
+@receiver(post_save, sender=HirePoint)
+@receiver(post_delete, sender=HirePoint)
+@receiver(post_save, sender=Boat)
+@receiver(post_delete, sender=Boat)
+@receiver(post_save, sender=OpeningTimes)
+@receiver(post_delete, sender=OpeningTimes)
+def invalidate_reference(sender, instance, **kwargs):
+    reference.invalidate()
+
+
+@receiver(post_save, sender=HirePoint)
+def copy_hire_point_to_shard(sender, instance, using, **kwargs):
+    # the rows of the hire point in its shard refer to it
+    shard = routers.get_shard(instance.pk)
+    if using == DEFAULT_DB_ALIAS and shard != DEFAULT_DB_ALIAS:
+        sharding.copy_hire_point_row(instance, shard)
+
+
+@receiver(pre_delete, sender=HirePoint)
+def delete_hire_point_from_shard(sender, instance, using, **kwargs):
+    # the copy in the shard takes with it the rows of the hire point
+    shard = routers.get_shard(instance.pk)
+    if using == DEFAULT_DB_ALIAS and shard != DEFAULT_DB_ALIAS:
+        HirePoint.objects.using(shard).filter(pk=instance.pk).delete()
@@ -1,10 +1,79 @@
 import datetime
+import importlib
+import os
+import json
+import logging
+from multiprocessing.pool import ThreadPool
+import tempfile
+import threading
+import time
 
-from django.test import TestCase
+from django.apps import apps as django_apps
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.urlresolvers import reverse
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, OperationalError, connections, transaction
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import six, timezone
 
-from boating.choices import MONDAY, SATURDAY, SUNDAY
-from boating.models import Booking, OpeningTimes, HirePoint, Boat
-from boating.views import place_booking
+from boating import (
+    allocation, analytics, benchmark, cache as availability_cache, checks, export, feed, loadtest, middleware,
+    reallocation, reference, routers, sharding, writer
+)
+from boating.availability import to_naive
+from boating.choices import ARCHIVED, CREATED, DELETED, MONDAY, SATURDAY, SUNDAY, UPDATED
+from boating.forms import HomeForm
+from boating.models import (
+    ArchivedBooking, Booking, BookingChange, BookingSeries, BoatOccupancy, BoatSlotClaim, OpeningTimes, HirePoint, Boat,
+    MAX_DURATION, SLOT_TIME, TOO_LONG
+)
+from boating.utils import generate_url
+from boating import views
+from boating.views import (
+    get_cached_slots, get_slots, get_slots_by_duration, place_booking, place_series, search_hire_points
+)
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'boating-tests'}},
+    BOATING_CACHE='default'
+)
+class BoatingTestCase(TestCase):
+    """
+    The tests clear their own cache, never the one shared by the running processes
+    """
+
+
+def run_commit_callbacks(using=DEFAULT_DB_ALIAS):
+    """
+    Runs the functions waiting for the transaction to be committed, the one of every test never is
+    """
+    connection = connections[using]
+    callbacks, connection.run_on_commit = connection.run_on_commit, []
+    for _savepoints, callback in callbacks:
+        callback()
+
+
+class QueryBudgetMixin(object):
+    def assertQueryBudget(self, response, budget=None, duplicates=0):
+        """
+        Checks the queries recorded by QueryCountMiddleware against a budget, by default the one in
+        BOATING_QUERY_BUDGETS, and that no more than duplicates queries are repeated
+        """
+        request = response.wsgi_request
+        if budget is None:
+            budget = middleware.get_query_budget(request.resolver_match.url_name, request.method)
+        stats = request.query_stats
+        self.assertLessEqual(stats['count'], budget, '%s %s made %s queries, the budget is %s' % (
+            request.method, request.path, stats['count'], budget
+        ))
+        repeated = sum(_count - 1 for _count in stats['duplicates'].values())
+        self.assertLessEqual(repeated, duplicates, 'Queries repeated in %s %s:\n%s' % (
+            request.method, request.path, '\n'.join(stats['duplicates'])
+        ))
 
 
 class HirePointMixin(object):
@@ -12,6 +81,7 @@ class HirePointMixin(object):
     hire_point2 = None
 
     def setUp(self):
+        availability_cache.get_cache().clear()
         hire_point1 = HirePoint.objects.create(name='HirePoint 1', description='Mon-Fri')
         hire_point2 = HirePoint.objects.create(name='HirePoint 2', description='Weekend')
 
@@ -29,7 +99,7 @@ class HirePointMixin(object):
         self.hire_point2 = hire_point2
 
 
-class HirePointTestCase(HirePointMixin, TestCase):
+class HirePointTestCase(HirePointMixin, BoatingTestCase):
     def test_opening_hours(self):
         # datetime.date(2016, 2, day) Monday is day one on February
         for day in range(MONDAY, SATURDAY):
@@ -121,12 +191,12 @@ class HirePointTestCase(HirePointMixin, TestCase):
             )
 
 
-class BookingTestCase(HirePointMixin, TestCase):
+class BookingMixin(HirePointMixin):
     boats_in_hire_point1 = None
     bookings_in_hire_point1 = None
 
     def setUp(self):
-        super(BookingTestCase, self).setUp()
+        super(BookingMixin, self).setUp()
 
         boats_in_hire_point1 = []
         for seats in [2, 4, 4, 6]:
@@ -151,6 +221,36 @@ class BookingTestCase(HirePointMixin, TestCase):
         bookings_in_hire_point1.append(booking2)
         self.bookings_in_hire_point1 = bookings_in_hire_point1
 
+
+class SharedConnectionMixin(object):
+    """
+    The test database only exists in the connection of the test, the threads started by the code
+    tested share it like LiveServerTestCase does
+    """
+
+    def share_connection(self, function):
+        """
+        :return: The function run in the connection of the test from any thread
+        """
+        shared_connection = connections[DEFAULT_DB_ALIAS]
+        shared_connection.allow_thread_sharing = True
+        self.addCleanup(setattr, shared_connection, 'allow_thread_sharing', False)
+
+        def function_in_shared_connection(*args):
+            connections[DEFAULT_DB_ALIAS] = shared_connection
+            return function(*args)
+        return function_in_shared_connection
+
+    def patch_in_shared_connection(self, module, name):
+        """
+        Replaces a function of a module, run by threads, with one sharing the connection until the test ends
+        """
+        function = getattr(module, name)
+        setattr(module, name, self.share_connection(function))
+        self.addCleanup(setattr, module, name, function)
+
+
+class BookingTestCase(BookingMixin, BoatingTestCase):
     def _check_boat(self, hire_point, people, start_time, end_time, assert_list):
         min_step = datetime.timedelta(minutes=15)
         time = start_time
@@ -227,3 +327,1525 @@ class BookingTestCase(HirePointMixin, TestCase):
                 raise RuntimeError('Cannot be any schedule available')
             else:
                 self.assertListEqual(boats[index], [self.boats_in_hire_point1[0], self.boats_in_hire_point1[1]])
+
+    def test_available_slots_match_is_available(self):
+        hire_point = self.hire_point1
+        place_booking(hire_point, 'Morning Party', datetime.datetime(2016, 2, 1, 9, 45, 0),
+                      datetime.timedelta(minutes=45), 4)
+        place_booking(hire_point, 'Evening Party', datetime.datetime(2016, 2, 1, 19, 0, 0),
+                      datetime.timedelta(minutes=60), 6)
+        date = datetime.date(2016, 2, 1)
+        for people in [1, 3, 5, 9, 16, 17]:
+            for minutes in [15, 30, 90, 180]:
+                duration = datetime.timedelta(minutes=minutes)
+                slots, boats = hire_point.get_available_slots(date, people, duration)
+
+                expected_slots, expected_boats = [], []
+                time = hire_point.get_start_time(date)
+                while time < hire_point.get_closing_time(date):
+                    boats_available = hire_point.is_available(people=people, start_time=time, duration=duration)
+                    if boats_available:
+                        expected_slots.append(time)
+                        expected_boats.append(list(boats_available))
+                    time += datetime.timedelta(minutes=15)
+
+                self.assertListEqual(slots, expected_slots)
+                self.assertListEqual(boats, expected_boats)
+
+    def test_available_slots_queries(self):
+        hire_point = self.hire_point1
+        date = datetime.date(2016, 2, 1)
+        duration = datetime.timedelta(minutes=30)
+        # hire points, opening times and boats are loaded once
+        with self.assertNumQueries(3 + 1):
+            hire_point.get_available_slots(date, 3, duration)
+        with self.assertNumQueries(1):
+            hire_point.get_available_slots(date, 3, duration)
+        for hour in range(12, 19):
+            place_booking(hire_point, 'Client', datetime.datetime(2016, 2, 1, hour, 0, 0), duration, 3)
+        with self.assertNumQueries(1):
+            hire_point.get_available_slots(date, 3, duration)
+
+    def test_occupancy(self):
+        hire_point = self.hire_point1
+        place_booking(hire_point, 'Morning Party', datetime.datetime(2016, 2, 1, 9, 45, 0),
+                      datetime.timedelta(minutes=45), 4)
+        date = datetime.date(2016, 2, 1)
+        occupancy = hire_point.get_day_occupancy(date)
+        self.assertTrue(occupancy.is_free(
+            self.boats_in_hire_point1[0], datetime.datetime(2016, 2, 1, 9, 45), datetime.datetime(2016, 2, 1, 10, 0)
+        ))
+        self.assertFalse(occupancy.is_free(
+            self.boats_in_hire_point1[0], datetime.datetime(2016, 2, 1, 10, 45), datetime.datetime(2016, 2, 1, 11, 0)
+        ))
+        self.assertTrue(occupancy.is_free(
+            self.boats_in_hire_point1[0], datetime.datetime(2016, 2, 1, 11, 0), datetime.datetime(2016, 2, 1, 12, 0)
+        ))
+        with self.assertRaises(ValueError):
+            occupancy.get_free_boats(datetime.datetime(2016, 1, 31, 23, 0), datetime.datetime(2016, 2, 1, 1, 0))
+
+        for people in [1, 3, 5, 9, 17]:
+            for minutes in [15, 30, 180]:
+                duration = datetime.timedelta(minutes=minutes)
+                with self.assertNumQueries(0):
+                    slots = hire_point.get_available_slots(date, people, duration, occupancy=occupancy)
+                self.assertEqual(slots, hire_point.get_available_slots(date, people, duration))
+
+
+class BookingDurationTestCase(BookingMixin, BoatingTestCase):
+    def test_max_duration(self):
+        start_time = datetime.datetime(2016, 2, 3, 10, 0)
+        booking = Booking(
+            name='Client', number_of_people=1, hire_point=self.hire_point1, start_time=start_time,
+            end_time=start_time + datetime.timedelta(minutes=MAX_DURATION)
+        )
+        booking.full_clean()
+        booking.end_time += datetime.timedelta(minutes=SLOT_TIME)
+        with self.assertRaisesMessage(ValidationError, TOO_LONG):
+            booking.full_clean()
+
+        User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.login(username='admin', password='password')
+        response = self.client.post(reverse('admin:boating_booking_add'), {
+            'name': 'Client', 'number_of_people': 1, 'hire_point': self.hire_point1.pk,
+            'boats': [self.boats_in_hire_point1[0].pk], 'start_time_0': '2016-02-03', 'start_time_1': '10:00:00',
+            'end_time_0': '2016-02-03', 'end_time_1': '14:00:00',
+        })
+        self.assertContains(response, TOO_LONG)
+        self.assertFalse(Booking.objects.filter(start_time=start_time).exists())
+
+
+class BoatSlotClaimTestCase(BookingMixin, BoatingTestCase):
+    def test_claims(self):
+        booking = self.bookings_in_hire_point1[0]
+        self.assertListEqual(
+            list(booking.claims.order_by('slot').values_list('slot', flat=True)),
+            [
+                datetime.datetime(2016, 2, 1, 10, 0, tzinfo=timezone.utc),
+                datetime.datetime(2016, 2, 1, 10, 15, tzinfo=timezone.utc),
+                datetime.datetime(2016, 2, 1, 10, 30, tzinfo=timezone.utc),
+                datetime.datetime(2016, 2, 1, 10, 45, tzinfo=timezone.utc),
+            ]
+        )
+        other_booking = Booking.objects.create(
+            name='Client3', number_of_people=1, hire_point=self.hire_point1,
+            start_time=datetime.datetime(2016, 2, 1, 10, 45, 0), end_time=datetime.datetime(2016, 2, 1, 11, 15, 0)
+        )
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                other_booking.boats.add(self.boats_in_hire_point1[0])
+
+        booking.end_time = datetime.datetime(2016, 2, 1, 10, 45, 0)
+        booking.save()
+        other_booking.boats.add(self.boats_in_hire_point1[0])
+        self.assertEqual(BoatSlotClaim.objects.filter(boat=self.boats_in_hire_point1[0]).count(), 3 + 2 + 4)
+
+        booking.boats.clear()
+        self.assertFalse(booking.claims.exists())
+        other_booking.delete()
+        self.assertEqual(BoatSlotClaim.objects.filter(boat=self.boats_in_hire_point1[0]).count(), 4)
+
+    def test_claim_migration(self):
+        migration = importlib.import_module('boating.migrations.0002_boat_slot_claim')
+        booking = self.bookings_in_hire_point1[0]
+        # off the slot grid, it shares the slot of 10:45 with the booking
+        other_booking = Booking.objects.create(
+            name='Client3', number_of_people=1, hire_point=self.hire_point1,
+            start_time=datetime.datetime(2016, 2, 1, 10, 50), end_time=datetime.datetime(2016, 2, 1, 11, 20)
+        )
+        Booking.boats.through.objects.create(booking=other_booking, boat=self.boats_in_hire_point1[0])
+        BoatSlotClaim.objects.all().delete()
+        records = []
+        handler = logging.Handler()
+        handler.emit = records.append
+        migration.logger.addHandler(handler)
+        self.addCleanup(migration.logger.removeHandler, handler)
+
+        migration.claim_booked_boats(django_apps, connections[DEFAULT_DB_ALIAS].schema_editor())
+        self.assertEqual(booking.claims.count(), 4)
+        self.assertEqual(other_booking.claims.count(), 2)
+        self.assertEqual(
+            [_record.getMessage() for _record in records],
+            ['Slot 2016-02-01 10:45:00 of boat %s not claimed for booking %s, it is claimed by booking %s' % (
+                self.boats_in_hire_point1[0].pk, other_booking.pk, booking.pk
+            )]
+        )
+
+    def test_concurrent_booking(self):
+        hire_point = self.hire_point1
+        start_time = datetime.datetime(2016, 2, 2, 12, 0, 0)
+        duration = datetime.timedelta(minutes=30)
+        get_occupancy = hire_point.get_occupancy
+
+        def get_outdated_occupancy(**kwargs):
+            occupancy = get_occupancy(**kwargs)
+            if not Booking.objects.filter(name='Faster client').exists():
+                # another request books the same boat after this one has checked the availability
+                booking = Booking.objects.create(
+                    name='Faster client', number_of_people=2, hire_point=hire_point,
+                    start_time=start_time, end_time=start_time + duration
+                )
+                booking.boats.add(self.boats_in_hire_point1[0])
+            return occupancy
+
+        hire_point.get_occupancy = get_outdated_occupancy
+        booking = place_booking(hire_point, 'Client', start_time, duration, 2)
+        self.assertSequenceEqual(booking.boats.all(), [self.boats_in_hire_point1[1]])
+
+
+class BoatOccupancyTestCase(BookingMixin, BoatingTestCase):
+    def test_occupancy(self):
+        booking = place_booking(self.hire_point1, 'Client', datetime.datetime(2016, 2, 1, 10, 0, 0),
+                                datetime.timedelta(minutes=60), 9)
+        self.assertEqual(
+            sorted(booking.occupancy.values_list('boat_id', 'hire_point_id', 'start_time', 'end_time')),
+            [
+                (_boat.pk, self.hire_point1.pk, datetime.datetime(2016, 2, 1, 10, 0, tzinfo=timezone.utc),
+                 datetime.datetime(2016, 2, 1, 11, 0, tzinfo=timezone.utc))
+                for _boat in self.boats_in_hire_point1[1:]
+            ]
+        )
+        booking.boats.remove(self.boats_in_hire_point1[3])
+        self.assertEqual(booking.occupancy.count(), 2)
+        booking.delete()
+        self.assertEqual(BoatOccupancy.objects.count(), 2)
+
+    def test_boat_bookings_cleared(self):
+        boat = self.boats_in_hire_point1[0]
+        boat.bookings.clear()
+        self.assertFalse(boat.claims.exists())
+        self.assertFalse(boat.occupancy.exists())
+        self.assertIn(boat, self.hire_point1.is_available(
+            datetime.datetime(2016, 2, 1, 10, 0, 0), 2, datetime.timedelta(minutes=30)
+        ))
+
+    def test_is_available_queries(self):
+        self.hire_point1.get_config()
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                self.hire_point1.is_available(datetime.datetime(2016, 2, 1, 10, 0, 0), 2,
+                                              datetime.timedelta(minutes=30)),
+                [self.boats_in_hire_point1[1]]
+            )
+
+
+class AvailabilityCacheTestCase(BookingMixin, BoatingTestCase):
+    def test_cached_slots(self):
+        hire_point = self.hire_point1
+        date = datetime.date(2016, 2, 2)
+        duration = datetime.timedelta(minutes=30)
+        slots = get_cached_slots(hire_point, date, 3, duration)
+        self.assertEqual(slots, get_slots(hire_point, date, 3, duration))
+        with self.assertNumQueries(0):
+            self.assertEqual(get_cached_slots(hire_point, date, 3, duration), slots)
+        self.assertEqual(availability_cache.get_stats(), {'hits': 1, 'misses': 1, 'hit_rate': 0.5})
+
+        # other dates are not affected
+        get_cached_slots(hire_point, datetime.date(2016, 2, 4), 3, duration)
+        place_booking(hire_point, 'Client', datetime.datetime(2016, 2, 2, 12, 0, 0), duration, 3)
+        run_commit_callbacks()
+        with self.assertNumQueries(0):
+            get_cached_slots(hire_point, datetime.date(2016, 2, 4), 3, duration)
+
+        slots = get_cached_slots(hire_point, date, 3, duration)
+        self.assertEqual(slots, get_slots(hire_point, date, 3, duration))
+
+        Boat.objects.create(hire_point=hire_point, seats=3)
+        self.assertEqual(get_cached_slots(hire_point, date, 3, duration), get_slots(hire_point, date, 3, duration))
+
+        booking = Booking.objects.get(name='Client')
+        booking.boats.clear()
+        run_commit_callbacks()
+        self.assertEqual(get_cached_slots(hire_point, date, 3, duration), get_slots(hire_point, date, 3, duration))
+        self.assertEqual(availability_cache.get_stats()['hits'], 2)
+
+    def test_timeout(self):
+        date = datetime.date(2016, 2, 2)
+        duration = datetime.timedelta(minutes=30)
+        with override_settings(BOATING_CACHE_TIMEOUT=0.1):
+            get_cached_slots(self.hire_point1, date, 3, duration)
+        time.sleep(0.2)
+        key = availability_cache.get_slots_key(self.hire_point1, date, 3, duration)
+        self.assertIsNone(availability_cache.get_slots(key))
+
+    def test_invalidated_on_commit(self):
+        date = datetime.date(2016, 2, 2)
+        version = availability_cache.get_version(self.hire_point1.pk, date)
+        place_booking(
+            self.hire_point1, 'Client', datetime.datetime(2016, 2, 2, 12, 0), datetime.timedelta(minutes=30), 3
+        )
+        # the slots read before the commit are still the ones of the previous version
+        self.assertEqual(availability_cache.get_version(self.hire_point1.pk, date), version)
+        run_commit_callbacks()
+        self.assertNotEqual(availability_cache.get_version(self.hire_point1.pk, date), version)
+
+    def test_booking_view(self):
+        url = generate_url(reverse('booking', args=[self.hire_point1.pk]), {
+            'date': '2016-02-02', 'duration': 30, 'name': 'Client', 'number_of_people': 3
+        })
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['slots'], get_slots(
+            self.hire_point1, datetime.date(2016, 2, 2), 3, datetime.timedelta(minutes=30)
+        ))
+        self.assertEqual(self.client.get(url).content, response.content)
+        self.assertEqual(availability_cache.get_stats()['hits'], 1)
+
+
+class CalendarTestCase(BookingMixin, BoatingTestCase):
+    def test_month_availability(self):
+        hire_point = self.hire_point1
+        duration = datetime.timedelta(minutes=60)
+        for hour in range(9, 19):
+            place_booking(hire_point, 'Client', datetime.datetime(2016, 2, 3, hour, 0, 0), duration, 16)
+        place_booking(hire_point, 'Client', datetime.datetime(2016, 2, 29, 18, 0, 0), duration, 16)
+
+        with self.assertNumQueries(1):
+            days = hire_point.get_month_availability(2016, 2, 5, duration)
+        self.assertEqual(len(days), 29)
+        for day in days:
+            slots = get_slots(hire_point, day['date'], 5, duration)
+            self.assertEqual(day['is_open'], bool(slots))
+            self.assertEqual(day['slots'], len([_slot for _slot in slots if _slot[2]]))
+        self.assertEqual(days[2]['slots'], 1)
+        self.assertEqual(days[28]['slots'], 41 - 7)
+
+    def test_calendar_view(self):
+        url = generate_url(reverse('calendar', args=[self.hire_point2.pk]), {
+            'month': '2016-02', 'duration': 30, 'number_of_people': 3
+        })
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        days = json.loads(response.content.decode('utf-8'))['days']
+        self.assertEqual(days[0], {'date': '2016-02-01', 'is_open': False, 'slots': 0})
+        self.assertEqual(days[5], {'date': '2016-02-06', 'is_open': True, 'slots': 0})
+
+        response = self.client.get(reverse('calendar', args=[self.hire_point2.pk]), {'month': 'February'})
+        self.assertEqual(response.status_code, 400)
+
+
+class DurationsTestCase(BookingMixin, BoatingTestCase):
+    def test_slots_by_duration(self):
+        hire_point = self.hire_point1
+        place_booking(hire_point, 'Morning Party', datetime.datetime(2016, 2, 1, 9, 45, 0),
+                      datetime.timedelta(minutes=45), 4)
+        place_booking(hire_point, 'Evening Party', datetime.datetime(2016, 2, 1, 17, 0, 0),
+                      datetime.timedelta(minutes=150), 14)
+        date = datetime.date(2016, 2, 1)
+        durations = [datetime.timedelta(minutes=_minutes) for _minutes in range(15, 181, 15)]
+        for people in [1, 5, 9, 16]:
+            with self.assertNumQueries(1):
+                slots_by_duration = get_slots_by_duration(hire_point, date, people, durations)
+            for duration in durations:
+                self.assertEqual(slots_by_duration[duration], get_slots(hire_point, date, people, duration))
+
+        self.assertEqual(
+            get_slots_by_duration(self.hire_point2, date, 1, durations),
+            dict((_duration, []) for _duration in durations)
+        )
+        with self.assertRaises(ValueError):
+            get_slots_by_duration(hire_point, date, 1, [datetime.timedelta(minutes=20)])
+
+    def test_durations_view(self):
+        response = self.client.get(reverse('durations', args=[self.hire_point1.pk]), {
+            'date': '2016-02-01', 'number_of_people': 5
+        })
+        self.assertEqual(response.status_code, 200)
+        durations = json.loads(response.content.decode('utf-8'))['durations']
+        self.assertEqual(len(durations), 12)
+        self.assertEqual(durations['180'][0], {
+            'id': '2016-02-01 09:00:00',
+            'name': '09:00 AM - 12:00 PM',
+            'is_available': True,
+            'boats': [{'id': self.boats_in_hire_point1[1].pk, 'seats': 4},
+                      {'id': self.boats_in_hire_point1[2].pk, 'seats': 4}],
+        })
+
+
+class NextAvailableSlotTestCase(BookingMixin, BoatingTestCase):
+    def test_next_available_slot(self):
+        hire_point = self.hire_point1
+        duration = datetime.timedelta(minutes=60)
+        for day in [3, 4]:
+            for hour in range(9, 20):
+                place_booking(hire_point, 'Client', datetime.datetime(2016, 2, day, hour, 0, 0), duration, 16)
+        place_booking(hire_point, 'Client', datetime.datetime(2016, 2, 5, 9, 0, 0), duration, 6)
+
+        self.assertEqual(
+            hire_point.get_next_available_slot(datetime.datetime(2016, 2, 1, 0, 0, 0), 16, duration),
+            (datetime.datetime(2016, 2, 1, 9, 0, 0), self.boats_in_hire_point1)
+        )
+        self.assertEqual(
+            hire_point.get_next_available_slot(datetime.datetime(2016, 2, 1, 19, 30, 0), 1, duration),
+            (datetime.datetime(2016, 2, 2, 9, 0, 0), [self.boats_in_hire_point1[0]])
+        )
+        # Wednesday and Thursday are full, Saturday and Sunday are closed
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                hire_point.get_next_available_slot(datetime.datetime(2016, 2, 3, 0, 0, 0), 16, duration),
+                (datetime.datetime(2016, 2, 5, 10, 0, 0), self.boats_in_hire_point1)
+            )
+        with self.assertNumQueries(3):
+            self.assertEqual(
+                hire_point.get_next_available_slot(datetime.datetime(2016, 2, 3, 0, 0, 0), 16, duration, batch_days=1),
+                (datetime.datetime(2016, 2, 5, 10, 0, 0), self.boats_in_hire_point1)
+            )
+        self.assertIsNone(
+            hire_point.get_next_available_slot(datetime.datetime(2016, 2, 3, 0, 0, 0), 16, duration, max_days=2)
+        )
+        self.assertIsNone(
+            hire_point.get_next_available_slot(datetime.datetime(2016, 2, 1, 0, 0, 0), 17, duration)
+        )
+        self.assertIsNone(
+            self.hire_point2.get_next_available_slot(datetime.datetime(2016, 2, 1, 0, 0, 0), 1, duration)
+        )
+
+    def test_next_available_view(self):
+        for hour in range(9, 20):
+            place_booking(self.hire_point1, 'Client', datetime.datetime(2016, 2, 3, hour, 0, 0),
+                          datetime.timedelta(minutes=60), 16)
+        parameters = {'date': '2016-02-03', 'duration': 60, 'name': 'Client', 'number_of_people': 5}
+        response = self.client.get(reverse('next_available', args=[self.hire_point1.pk]), parameters)
+        parameters['date'] = datetime.date(2016, 2, 4)
+        self.assertRedirects(response, generate_url(reverse('booking', args=[self.hire_point1.pk]), parameters))
+
+
+class SearchTestCase(SharedConnectionMixin, BookingMixin, BoatingTestCase):
+    def setUp(self):
+        super(SearchTestCase, self).setUp()
+        self.patch_in_shared_connection(views, '_get_slots_in_thread')
+
+        self.hire_point3 = HirePoint.objects.create(name='HirePoint 3', description='Every day')
+        for day in range(MONDAY, SUNDAY + 1):
+            OpeningTimes.objects.create(
+                hire_point=self.hire_point3, day=day, from_hour=datetime.time(hour=9), to_hour=datetime.time(hour=10)
+            )
+        Boat.objects.create(hire_point=self.hire_point3, seats=8)
+
+    def test_search(self):
+        date = datetime.date(2016, 2, 1)
+        duration = datetime.timedelta(minutes=30)
+        expected = [
+            (self.hire_point1, get_slots(self.hire_point1, date, 5, duration)),
+            (self.hire_point3, get_slots(self.hire_point3, date, 5, duration)),
+            (self.hire_point2, []),
+        ]
+        self.assertEqual(search_hire_points(date, 5, duration, workers=1), expected)
+        availability_cache.get_cache().clear()
+        self.assertEqual(search_hire_points(date, 5, duration, workers=3), expected)
+
+    def test_search_timeout(self):
+        get_slots = views.get_slots
+
+        def slow_get_slots(hire_point, **kwargs):
+            if hire_point == self.hire_point1:
+                time.sleep(0.5)
+            return get_slots(hire_point, **kwargs)
+
+        views.get_slots = slow_get_slots
+        try:
+            for workers in (1, 3):
+                availability_cache.get_cache().clear()
+                results = search_hire_points(datetime.date(2016, 2, 1), 5, datetime.timedelta(minutes=30),
+                                             workers=workers, timeout=0.3)
+                # every hire point has the whole timeout, the slow one does not take it from the others
+                self.assertEqual(results[-1], (self.hire_point1, None))
+                self.assertNotIn(None, [_slots for _hire_point, _slots in results[:-1]])
+                time.sleep(0.5)
+        finally:
+            views.get_slots = get_slots
+
+    def test_search_view(self):
+        response = self.client.post(reverse('home'), {
+            'date': '01/02/2016', 'duration': 30, 'name': 'Client', 'number_of_people': 5, 'hire_point': ''
+        })
+        parameters = {'date': datetime.date(2016, 2, 1), 'duration': 30, 'name': 'Client', 'number_of_people': 5}
+        self.assertRedirects(response, generate_url(reverse('search'), parameters))
+        response = self.client.get(response.url)
+        self.assertEqual(
+            [_result['hire_point'] for _result in response.context['results']],
+            [self.hire_point1, self.hire_point3, self.hire_point2]
+        )
+        self.assertEqual(response.context['results'][1]['url'], generate_url(
+            reverse('booking', args=[self.hire_point3.pk]), parameters
+        ))
+
+
+class AllocationTestCase(BookingMixin, BoatingTestCase):
+    def test_optimal(self):
+        boats = [Boat(id=_index, seats=_seats) for _index, _seats in enumerate([2, 2, 4, 4, 6, 8])]
+        self.assertEqual(allocation.optimal(boats, 5), [boats[4]])
+        self.assertEqual(allocation.optimal(boats, 7), [boats[5]])
+        self.assertEqual(allocation.optimal(boats, 10), [boats[2], boats[4]])
+        self.assertEqual(allocation.optimal(boats, 26), boats)
+        self.assertIsNone(allocation.optimal(boats, 27))
+        self.assertIsNone(allocation.optimal([], 1))
+        self.assertEqual(allocation.optimal(boats[2:], 5), [boats[4]])
+        self.assertEqual(allocation.optimal(boats[:4], 5), [boats[0], boats[2]])
+        self.assertEqual(allocation.greedy(boats[2:], 5), [boats[2], boats[3]])
+
+    @override_settings(BOATING_ALLOCATION_STRATEGY='boating.allocation.optimal')
+    def test_optimal_slots(self):
+        hire_point = self.hire_point1
+        date = datetime.date(2016, 2, 1)
+        slots, boats = hire_point.get_available_slots(date, 5, datetime.timedelta(minutes=30))
+        self.assertEqual(boats[slots.index(datetime.datetime(2016, 2, 1, 10, 0, 0))], [self.boats_in_hire_point1[3]])
+        self.assertEqual(
+            hire_point.is_available(datetime.datetime(2016, 2, 1, 10, 0, 0), 5, datetime.timedelta(minutes=30)),
+            [self.boats_in_hire_point1[3]]
+        )
+        booking = place_booking(hire_point, 'Client', datetime.datetime(2016, 2, 1, 10, 0, 0),
+                                datetime.timedelta(minutes=30), 5)
+        self.assertSequenceEqual(booking.boats.all(), [self.boats_in_hire_point1[3]])
+
+
+class ReferenceTestCase(BookingMixin, BoatingTestCase):
+    def test_reference(self):
+        hire_point = self.hire_point1
+        date = datetime.date(2016, 2, 1)
+        with self.assertNumQueries(3):
+            self.assertEqual(hire_point.get_boats(), self.boats_in_hire_point1)
+        with self.assertNumQueries(0):
+            self.assertEqual(hire_point.get_boats(), self.boats_in_hire_point1)
+            self.assertTrue(hire_point.is_open(datetime.datetime(2016, 2, 1, 12, 0, 0)))
+            self.assertEqual(hire_point.get_start_time(date), datetime.datetime(2016, 2, 1, 9, 0, 0))
+            form = HomeForm()
+            self.assertEqual(
+                form.fields['hire_point'].choices,
+                [('', 'Any hire point'), (self.hire_point1.pk, 'HirePoint 1'), (self.hire_point2.pk, 'HirePoint 2')]
+            )
+
+        boat = Boat.objects.create(hire_point=hire_point, seats=3)
+        self.assertEqual(hire_point.get_boats(), self.boats_in_hire_point1[:1] + [boat] + self.boats_in_hire_point1[1:])
+        OpeningTimes.objects.filter(hire_point=hire_point, day=MONDAY).get().delete()
+        self.assertFalse(hire_point.is_open(datetime.datetime(2016, 2, 1, 12, 0, 0)))
+
+        # other processes see the change through the version in the shared cache
+        reference._loaded['version'] = None
+        HirePoint.objects.filter(pk=hire_point.pk).update(name='Renamed')
+        self.assertEqual(reference.get_hire_point_config(hire_point.pk).hire_point.name, 'Renamed')
+
+    def test_shared_cache_check(self):
+        with override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': tempfile.gettempdir()
+        }}):
+            self.assertEqual(checks.check_shared_cache(None), [])
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            self.assertEqual([_warning.id for _warning in checks.check_shared_cache(None)], ['boating.W001'])
+
+    def test_forms(self):
+        form = HomeForm(data={
+            'date': '01/02/2016', 'duration': 30, 'name': 'Client', 'number_of_people': 5,
+            'hire_point': self.hire_point2.pk
+        })
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.cleaned_data['hire_point'], self.hire_point2)
+        form = HomeForm(data={
+            'date': '01/02/2016', 'duration': 30, 'name': 'Client', 'number_of_people': 5, 'hire_point': 100
+        })
+        self.assertFalse(form.is_valid())
+        self.assertIn('hire_point', form.errors)
+
+        url = reverse('booking', args=[self.hire_point1.pk])
+        response = self.client.get(url, {'date': '2016-02-01', 'duration': 30, 'name': 'Client', 'number_of_people': 5})
+        self.assertIn(
+            'name="hire_point" type="hidden" value="%s"' % self.hire_point1.pk, response.content.decode('utf-8')
+        )
+        response = self.client.post(url, {
+            'start_time': '2016-02-01 12:00:00', 'duration': 30, 'name': 'Client', 'number_of_people': 5,
+            'hire_point': self.hire_point1.pk
+        })
+        booking = Booking.objects.get(name='Client')
+        self.assertRedirects(response, reverse('booking_successful', args=[booking.pk]))
+
+
+class ExampleDataTestCase(BoatingTestCase):
+    def test_synthetic_data(self):
+        call_command('create_example_data', hire_points=2, boats_per_point=6, days=14, bookings_per_day=30,
+                     seed=1, batch_size=100, stdout=open(os.devnull, 'w'))
+        hire_points = HirePoint.objects.filter(name__startswith='Synthetic')
+        self.assertEqual(hire_points.count(), 2)
+        bookings = Booking.objects.all()
+        self.assertGreater(bookings.count(), 100)
+        through = Booking.boats.through.objects.all()
+        self.assertEqual(BoatOccupancy.objects.count(), through.count())
+        self.assertFalse(bookings.filter(boats=None).exists())
+        for booking in bookings.prefetch_related('boats')[:50]:
+            self.assertGreaterEqual(sum(_boat.seats for _boat in booking.boats.all()), booking.number_of_people)
+
+        # the generated bookings do not share boats, so new bookings see them as taken
+        hire_point = hire_points[0]
+        date = timezone.make_naive(bookings.filter(hire_point=hire_point).earliest('start_time').start_time).date()
+        slots = get_slots(hire_point, date, 1, datetime.timedelta(minutes=15))
+        occupancy = hire_point.get_day_occupancy(date)
+        for slot_id, _name, is_available, boats in slots:
+            start_time = datetime.datetime.strptime(slot_id, '%Y-%m-%d %H:%M:%S')
+            self.assertEqual(
+                is_available,
+                bool(occupancy.get_free_boats(start_time, start_time + datetime.timedelta(minutes=15)))
+            )
+        self.assertIn(False, [_slot[2] for _slot in slots])
+
+
+class BenchmarkTestCase(BookingMixin, BoatingTestCase):
+    def test_run_case(self):
+        case = {'boats': 4, 'bookings_per_day': 10, 'opening_hours': 8}
+        results = benchmark.run_case(case, days=1, repeat=2)
+        self.assertEqual(
+            [_result['operation'] for _result in results],
+            ['is_available', 'get_available_slots', 'get_slots', 'place_booking', 'BookingView GET',
+             'BookingView POST']
+        )
+        for result in results:
+            self.assertEqual(result['case'], case)
+            self.assertLessEqual(result['min_time_ms'], result['time_ms'])
+            self.assertGreater(result['queries'], 0)
+        # the bookings placed are removed after every run
+        self.assertFalse(Booking.objects.filter(name=benchmark.BOOKING_NAME).exists())
+
+    def test_post_booking(self):
+        client = Client()
+        # the hire point is closed, a failure is not measured as a booking
+        with self.assertRaisesMessage(RuntimeError, 'closed'):
+            benchmark.post_booking(client, self.hire_point1, datetime.datetime(2016, 2, 1, 19, 30))
+        benchmark.post_booking(client, self.hire_point1, datetime.datetime(2016, 2, 1, 12, 0))
+        self.assertTrue(Booking.objects.filter(name=benchmark.BOOKING_NAME).exists())
+
+    def test_compare(self):
+        case = {'boats': 4, 'bookings_per_day': 10, 'opening_hours': 8}
+        environment = {'memory': 'tracemalloc'}
+        baseline = {'environment': environment, 'results': [
+            {'case': case, 'operation': 'get_slots', 'time_ms': 10, 'min_time_ms': 10, 'queries': 1,
+             'peak_memory_kb': 100},
+        ]}
+        report = {'environment': environment, 'results': [
+            {'case': case, 'operation': 'get_slots', 'time_ms': 12, 'min_time_ms': 12, 'queries': 1,
+             'peak_memory_kb': 100},
+            {'case': case, 'operation': 'is_available', 'time_ms': 100, 'min_time_ms': 100, 'queries': 10,
+             'peak_memory_kb': 100},
+        ]}
+        self.assertEqual(benchmark.compare(report, baseline), [])
+
+        report['results'][0].update({'min_time_ms': 100, 'queries': 2, 'peak_memory_kb': 1000})
+        name = benchmark.get_case_name(case)
+        self.assertEqual(benchmark.compare(report, baseline), [
+            (name, 'get_slots', 'queries', 1, 2),
+            (name, 'get_slots', 'min_time_ms', 10, 100),
+            (name, 'get_slots', 'peak_memory_kb', 100, 1000),
+        ])
+        # memory measured in another way can not be compared
+        report['environment'] = {'memory': 'maxrss'}
+        self.assertEqual(len(benchmark.compare(report, baseline)), 2)
+
+
+class LoadTestTestCase(SharedConnectionMixin, BookingMixin, BoatingTestCase):
+    def test_unsuccessful_reason(self):
+        url = reverse('booking', args=[self.hire_point1.pk])
+        data = {'start_time': '2016-02-01 19:30:00', 'duration': 60, 'name': 'Client', 'number_of_people': 5,
+                'hire_point': self.hire_point1.pk}
+        response = self.client.post(url, data)
+        self.assertEqual(loadtest.get_outcome(response.status_code, response['Location']), 'closed')
+        data.update({'start_time': '2016-02-01 10:00:00', 'number_of_people': 20})
+        response = self.client.post(url, data)
+        self.assertEqual(loadtest.get_outcome(response.status_code, response['Location']), 'unavailable')
+        self.assertContains(self.client.get(response['Location']), views.FAILURE_MESSAGES['unavailable'])
+        data['duration'] = 7
+        response = self.client.post(url, data)
+        self.assertEqual(loadtest.get_outcome(response.status_code, response['Location']), 'invalid')
+
+    def test_run(self):
+        # the requests are sent from a single thread, they share the connection of the test
+        post_in_shared_connection = self.share_connection(loadtest.post_in_process)
+        start_time = datetime.datetime(2016, 2, 1, 10, 0)
+        duration = datetime.timedelta(minutes=60)
+        requests = loadtest.get_requests(self.hire_point1, start_time, duration, duration, 20, 6)
+        results, elapsed = loadtest.run(requests, post_in_shared_connection, 1)
+        summary = loadtest.summarize(results, elapsed)
+        self.assertEqual(summary['requests'], 20)
+        self.assertEqual(set(summary['outcomes']), {'booked', 'unavailable'})
+        self.assertEqual(
+            sorted(_booking_id for _latency, _outcome, _booking_id in results if _outcome == 'booked'),
+            sorted(Booking.objects.filter(name=loadtest.BOOKING_NAME).values_list('pk', flat=True))
+        )
+        self.assertEqual(summary['outcomes']['booked'], Booking.objects.filter(name=loadtest.BOOKING_NAME).count())
+        self.assertLessEqual(summary['p50_ms'], summary['p95_ms'])
+        self.assertLessEqual(summary['p95_ms'], summary['p99_ms'])
+        self.assertEqual(loadtest.find_double_bookings(self.hire_point1, start_time, start_time + duration * 2), [])
+
+        # the check looks at the bookings, a boat added without its claims is found
+        booking = Booking.objects.create(
+            name='Client3', number_of_people=1, hire_point=self.hire_point1,
+            start_time=datetime.datetime(2016, 2, 1, 10, 30), end_time=datetime.datetime(2016, 2, 1, 11, 30)
+        )
+        Booking.boats.through.objects.create(booking=booking, boat=self.boats_in_hire_point1[0])
+        self.assertEqual(
+            loadtest.find_double_bookings(self.hire_point1, start_time, start_time + duration * 2),
+            [(self.boats_in_hire_point1[0].pk, self.bookings_in_hire_point1[0].pk, booking.pk)]
+        )
+
+        # only the bookings of the run are deleted
+        other_booking = Booking.objects.create(
+            name=loadtest.BOOKING_NAME, number_of_people=1, hire_point=self.hire_point1,
+            start_time=datetime.datetime(2016, 2, 1, 12, 0), end_time=datetime.datetime(2016, 2, 1, 13, 0)
+        )
+        loadtest.delete_bookings(self.hire_point1, results)
+        self.assertEqual(list(Booking.objects.filter(name=loadtest.BOOKING_NAME)), [other_booking])
+
+
+class QueryBudgetTestCase(QueryBudgetMixin, BookingMixin, BoatingTestCase):
+    def setUp(self):
+        super(QueryBudgetTestCase, self).setUp()
+        for hour in range(12, 16):
+            booking = Booking.objects.create(
+                name='Client', number_of_people=4, hire_point=self.hire_point1,
+                start_time=datetime.datetime(2016, 2, 1, hour), end_time=datetime.datetime(2016, 2, 1, hour + 1)
+            )
+            booking.boats.add(*self.boats_in_hire_point1[:2])
+
+    def test_budgets(self):
+        self.assertQueryBudget(self.client.get(reverse('home')))
+        url = reverse('booking', args=[self.hire_point1.pk])
+        parameters = {'date': '2016-02-01', 'duration': 30, 'name': 'Client', 'number_of_people': 5}
+        self.assertQueryBudget(self.client.get(url, parameters))
+        self.assertQueryBudget(self.client.get(url, parameters))  # the slots are cached
+        response = self.client.post(url, {
+            'start_time': '2016-02-01 16:00:00', 'duration': 30, 'name': 'Client', 'number_of_people': 5,
+            'hire_point': self.hire_point1.pk
+        })
+        self.assertQueryBudget(response)
+        self.assertQueryBudget(self.client.get(response.url))
+
+    def test_duplicates(self):
+        self.assertEqual(
+            middleware.get_fingerprint('SELECT * FROM "boat" WHERE "id" IN (1, 2) AND "name" = \'it\'\'s\''),
+            'SELECT * FROM "boat" WHERE "id" IN (...) AND "name" = ?'
+        )
+        stats = middleware.get_query_stats([
+            {'sql': 'SELECT * FROM "boat" WHERE "id" = 1', 'time': '0.001'},
+            {'sql': 'SELECT * FROM "boat" WHERE "id" = 2', 'time': '0.002'},
+            {'sql': 'SELECT * FROM "booking"', 'time': '0.001'},
+        ])
+        self.assertEqual(stats, {
+            'count': 3, 'time_ms': 4.0, 'duplicates': {'SELECT * FROM "boat" WHERE "id" = ?': 2}
+        })
+
+    @override_settings(DEBUG=True)
+    def test_headers(self):
+        response = self.client.get(reverse('booking_successful', args=[self.bookings_in_hire_point1[0].pk]))
+        self.assertEqual(response['X-Query-Count'], '2')
+        self.assertEqual(response['X-Query-Duplicates'], '0')
+        self.assertEqual(response['X-Query-Budget'], '2')
+
+    def test_log(self):
+        records = []
+        handler = logging.Handler()
+        handler.emit = records.append
+        middleware.logger.addHandler(handler)
+        self.addCleanup(middleware.logger.removeHandler, handler)
+        self.addCleanup(setattr, middleware.logger, 'level', middleware.logger.level)
+        middleware.logger.setLevel(logging.INFO)
+
+        response = self.client.get(reverse('booking_successful', args=[self.bookings_in_hire_point1[0].pk]))
+        self.assertFalse(response.has_header('X-Query-Count'))
+        self.assertEqual(records[-1].levelno, logging.INFO)
+        line = json.loads(records[-1].getMessage())
+        self.assertEqual(
+            (line['view'], line['count'], line['budget'], line['status']), ('booking_successful', 2, 2, 200)
+        )
+
+        with override_settings(BOATING_QUERY_BUDGETS={'booking_successful': 1}):
+            self.client.get(reverse('booking_successful', args=[self.bookings_in_hire_point1[0].pk]))
+        self.assertEqual(records[-1].levelno, logging.WARNING)
+
+
+class ConditionalGetTestCase(BookingMixin, BoatingTestCase):
+    def _get(self, etag=None, **parameters):
+        url = reverse('booking', args=[self.hire_point1.pk])
+        data = {'date': '2016-02-01', 'duration': 30, 'name': 'Client', 'number_of_people': 5}
+        data.update(parameters)
+        if etag is None:
+            return self.client.get(url, data)
+        return self.client.get(url, data, HTTP_IF_NONE_MATCH=etag)
+
+    def setUp(self):
+        super(ConditionalGetTestCase, self).setUp()
+        self._get()  # sets the CSRF cookie, part of the ETag
+
+    def test_not_modified(self):
+        etag = self._get()['ETag']
+        with self.assertNumQueries(0):
+            response = self._get(etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self._get(etag, number_of_people=4).status_code, 200)
+        self.assertEqual(self._get(etag, date='2016-02-03').status_code, 200)
+
+        # a booking on another day keeps the page
+        booking = Booking.objects.create(
+            name='Client3', number_of_people=1, hire_point=self.hire_point1,
+            start_time=datetime.datetime(2016, 2, 8, 10, 0), end_time=datetime.datetime(2016, 2, 8, 11, 0)
+        )
+        booking.boats.add(self.boats_in_hire_point1[1])
+        self.assertEqual(self._get(etag).status_code, 304)
+
+    def test_modified(self):
+        def change_opening_times():
+            opening_times = OpeningTimes.objects.get(hire_point=self.hire_point1, day=MONDAY)
+            opening_times.to_hour = datetime.time(hour=18)
+            opening_times.save()
+
+        changes = [
+            lambda: self.bookings_in_hire_point1[0].boats.add(self.boats_in_hire_point1[1]),
+            lambda: Boat.objects.create(hire_point=self.hire_point1, seats=2),
+            change_opening_times,
+            lambda: HirePoint.objects.get(pk=self.hire_point1.pk).save(),
+        ]
+        for change in changes:
+            etag = self._get()['ETag']
+            change()
+            run_commit_callbacks()
+            response = self._get(etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response['ETag'], etag)
+
+
+@override_settings(BOATING_BOOKING_WRITER=True)
+class BookingWriterTestCase(SharedConnectionMixin, BookingMixin, BoatingTestCase):
+    def setUp(self):
+        super(BookingWriterTestCase, self).setUp()
+        # the writers use the connection of the test while the requests wait
+        self.patch_in_shared_connection(writer, '_write_batch')
+        self.addCleanup(writer.stop_writers)
+
+    def test_place_booking(self):
+        start_time = datetime.datetime(2016, 2, 1, 12, 0)
+        duration = datetime.timedelta(minutes=60)
+
+        def place(number):
+            try:
+                return place_booking(self.hire_point1, 'Client %s' % number, start_time, duration, 4)
+            except OperationalError as error:
+                return str(error)
+
+        pool = ThreadPool(6)
+        try:
+            results = pool.map(place, range(6))
+        finally:
+            pool.close()
+            pool.join()
+        bookings = [_result for _result in results if isinstance(_result, Booking)]
+        self.assertEqual(len(bookings), 3)
+        self.assertEqual(results.count(views.NO_BOATS_AVAILABLE), 3)
+        self.assertEqual(Booking.objects.filter(name__startswith='Client ').count(), 3)
+        self.assertEqual(loadtest.find_double_bookings(self.hire_point1, start_time, start_time + duration), [])
+
+        response = self.client.post(reverse('booking', args=[self.hire_point1.pk]), {
+            'start_time': '2016-02-01 14:00:00', 'duration': 60, 'name': 'Client', 'number_of_people': 2,
+            'hire_point': self.hire_point1.pk
+        })
+        self.assertEqual(loadtest.get_outcome(response.status_code, response['Location']), 'booked')
+
+    def test_backpressure(self):
+        blocking_writer = writer.BookingWriter(self.hire_point1.pk, queue_size=1)
+        writer._writers[self.hire_point1.pk] = blocking_writer
+        release = threading.Event()
+        started = threading.Event()
+
+        def block():
+            started.set()
+            release.wait()
+
+        pool = ThreadPool(2)
+        try:
+            blocked = pool.apply_async(writer.run, (self.hire_point1.pk, block))
+            started.wait()
+            queued = []
+            with override_settings(BOATING_WRITER_TIMEOUT=0.1):
+                with self.assertRaisesMessage(OperationalError, writer.NOT_WRITTEN_IN_TIME):
+                    writer.run(self.hire_point1.pk, queued.append, 'run')
+            # the job cancelled is still in the queue
+            with self.assertRaisesMessage(OperationalError, writer.QUEUE_FULL):
+                writer.run(self.hire_point1.pk, queued.append, 'rejected')
+            release.set()
+            blocked.get()
+        finally:
+            release.set()
+            pool.close()
+            pool.join()
+        writer.run(self.hire_point1.pk, queued.append, 'written')
+        self.assertEqual(queued, ['written'])
+
+
+class ArchiveTestCase(BookingMixin, BoatingTestCase):
+    def test_archive(self):
+        booking1, booking2 = self.bookings_in_hire_point1
+        booking2.boats.add(self.boats_in_hire_point1[1])
+        self.assertEqual(ArchivedBooking.archive(datetime.datetime(2016, 2, 2)), 1)
+        self.assertEqual(ArchivedBooking.archive(datetime.datetime(2016, 2, 2)), 0)
+
+        self.assertFalse(Booking.objects.filter(pk=booking1.pk).exists())
+        self.assertFalse(BoatSlotClaim.objects.filter(booking_id=booking1.pk).exists())
+        self.assertFalse(BoatOccupancy.objects.filter(booking_id=booking1.pk).exists())
+        archived_booking = ArchivedBooking.objects.get(pk=booking1.pk)
+        self.assertEqual(
+            (archived_booking.name, archived_booking.start_time, list(archived_booking.boats.all())),
+            (booking1.name, timezone.make_aware(booking1.start_time), [self.boats_in_hire_point1[0]])
+        )
+
+        start_time = datetime.datetime(2016, 2, 1)
+        end_time = datetime.datetime(2016, 2, 3)
+        self.assertEqual(list(Booking.get_bookings_between(self.hire_point1, start_time, end_time)), [booking2])
+        self.assertEqual(
+            Booking.get_bookings_between(self.hire_point1, start_time, end_time, include_archived=True),
+            [archived_booking, booking2]
+        )
+        # the archived booking does not take the boat any more
+        self.assertTrue(self.hire_point1.is_available(datetime.datetime(2016, 2, 1, 10, 0), 16,
+                                                      datetime.timedelta(minutes=60)))
+
+    def test_command(self):
+        for day in range(3, 8):
+            booking = Booking.objects.create(
+                name='Client', number_of_people=1, hire_point=self.hire_point1,
+                start_time=datetime.datetime(2016, 2, day, 10, 0), end_time=datetime.datetime(2016, 2, day, 11, 0)
+            )
+            booking.boats.add(self.boats_in_hire_point1[0])
+        future = Booking.objects.create(
+            name='Client', number_of_people=1, hire_point=self.hire_point1,
+            start_time=timezone.now() + datetime.timedelta(days=1),
+            end_time=timezone.now() + datetime.timedelta(days=1, hours=1)
+        )
+        devnull = open(os.devnull, 'w')
+        with override_settings(BOATING_ARCHIVE_DAYS=365 * 50):
+            call_command('archive_bookings', stdout=devnull)
+        self.assertFalse(ArchivedBooking.objects.exists())
+        call_command('archive_bookings', batch_size=2, max_batches=2, stdout=devnull)
+        self.assertEqual(ArchivedBooking.objects.count(), 4)
+        call_command('archive_bookings', batch_size=2, stdout=devnull)  # continues with the rest
+        self.assertEqual(ArchivedBooking.objects.count(), 7)
+        self.assertEqual(list(Booking.objects.all()), [future])
+        self.assertEqual(ArchivedBooking.boats.through.objects.count(), 7)
+
+    def _count_archive_queries(self, before):
+        with CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]) as queries:
+            ArchivedBooking.archive(before)
+        return len(queries)
+
+    def test_archive_queries(self):
+        queries = self._count_archive_queries(datetime.datetime(2016, 2, 3))
+        for day in range(3, 7):
+            booking = Booking.objects.create(
+                hire_point=self.hire_point1, name='Client', number_of_people=1,
+                start_time=datetime.datetime(2016, 2, day, 10, 0), end_time=datetime.datetime(2016, 2, day, 11, 0)
+            )
+            booking.boats.add(self.boats_in_hire_point1[0])
+        # the changes are written at once for the whole batch
+        self.assertEqual(self._count_archive_queries(datetime.datetime(2016, 2, 7)), queries)
+        self.assertEqual(BookingChange.objects.filter(action=ARCHIVED).count(), 6)
+
+
+class ExportTestCase(BookingMixin, BoatingTestCase):
+    def setUp(self):
+        super(ExportTestCase, self).setUp()
+        booking = Booking.objects.create(
+            name=u'Zo\xeb, Smith; and a long name that does not fit in one line of the calendar', number_of_people=3,
+            hire_point=self.hire_point1,
+            start_time=datetime.datetime(2016, 2, 1, 12, 0), end_time=datetime.datetime(2016, 2, 1, 13, 0)
+        )
+        booking.boats.add(*self.boats_in_hire_point1[:2])
+        self.bookings_in_hire_point1.append(booking)
+        User.objects.create_user('staff', password='1234', is_staff=True)
+        self.url = reverse('export', args=[self.hire_point1.pk])
+
+    def _get_content(self, response):
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def test_iter_bookings(self):
+        expected = [
+            (self.bookings_in_hire_point1[0], [self.boats_in_hire_point1[0].pk]),
+            (self.bookings_in_hire_point1[2], [self.boats_in_hire_point1[0].pk, self.boats_in_hire_point1[1].pk]),
+            (self.bookings_in_hire_point1[1], [self.boats_in_hire_point1[0].pk]),
+        ]
+        start = datetime.date(2016, 2, 1)
+        end = datetime.date(2016, 2, 2)
+        with self.assertNumQueries(7):  # the boats of every chunk and the last chunk, empty
+            bookings = [
+                (_booking, [_boat_id for _boat_id, _seats in _boats])
+                for _booking, _boats in export.iter_bookings(self.hire_point1, start, end, chunk_size=1)
+            ]
+        self.assertEqual(bookings, expected)
+
+        ArchivedBooking.archive(datetime.datetime(2016, 2, 1, 12, 0))
+        bookings = list(export.iter_bookings(self.hire_point1, start, end, include_archived=True, chunk_size=2))
+        self.assertEqual([_booking.pk for _booking, _boats in bookings], [_booking.pk for _booking, _boats in expected])
+        self.assertIsInstance(bookings[0][0], ArchivedBooking)
+        self.assertEqual([_booking.pk for _booking, _boats in export.iter_bookings(self.hire_point1, start, start)],
+                         [self.bookings_in_hire_point1[2].pk])
+
+    def test_export_view(self):
+        parameters = {'start': '2016-02-01', 'end': '2016-02-01'}
+        response = self.client.get(self.url, parameters)
+        self.assertEqual(response.status_code, 302)  # to the admin login
+
+        self.client.login(username='staff', password='1234')
+        response = self.client.get(self.url, parameters)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        rows = self._get_content(response).splitlines()
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0], ','.join(export.CSV_HEADER))
+        self.assertIn(u'"Zo\xeb, Smith; and a long name', rows[2])
+        self.assertIn('%s:2 %s:4' % (self.boats_in_hire_point1[0].pk, self.boats_in_hire_point1[1].pk), rows[2])
+
+        parameters['format'] = 'jsonl'
+        lines = self._get_content(self.client.get(self.url, parameters)).splitlines()
+        self.assertEqual(json.loads(lines[0])['start_time'], '2016-02-01T10:00:00+00:00')
+        self.assertEqual(len(json.loads(lines[1])['boats']), 2)
+
+        parameters['format'] = 'ics'
+        content = self._get_content(self.client.get(self.url, parameters))
+        self.assertEqual(content.count('BEGIN:VEVENT'), 2)
+        self.assertIn('DTSTART:20160201T120000Z', content)
+        self.assertIn(u'SUMMARY:Zo\xeb\\, Smith\\; and', content)
+        for line in content.split('\r\n'):
+            self.assertLessEqual(len(line.encode('utf-8')), 75)
+
+        parameters['end'] = '2016-01-01'
+        self.assertEqual(self.client.get(self.url, parameters).status_code, 400)
+
+    def test_command(self):
+        descriptor, path = tempfile.mkstemp(suffix='.jsonl')
+        os.close(descriptor)
+        self.addCleanup(os.remove, path)
+        call_command(
+            'export_bookings', str(self.hire_point1.pk), '2016-02-01', '2016-02-02', format='jsonl', output=path
+        )
+        with open(path) as output:
+            self.assertEqual([json.loads(_line)['id'] for _line in output], [
+                self.bookings_in_hire_point1[0].pk, self.bookings_in_hire_point1[2].pk,
+                self.bookings_in_hire_point1[1].pk
+            ])
+
+
+class ChangeFeedTestCase(BookingMixin, BoatingTestCase):
+    def _read_all(self, cursor=None, **kwargs):
+        changes = []
+        while True:
+            page = feed.get_changes(cursor, **kwargs)
+            changes.extend(page['changes'])
+            cursor = page['cursor']
+            if not page['has_more']:
+                return changes, cursor
+
+    def test_get_changes(self):
+        booking1, booking2 = self.bookings_in_hire_point1
+        changes, cursor = self._read_all(limit=1)
+        self.assertEqual([(_change['booking_id'], _change['action']) for _change in changes],
+                         [(booking1.pk, CREATED), (booking2.pk, CREATED)])
+        self.assertEqual(changes[0]['booking']['boats'], [{'id': self.boats_in_hire_point1[0].pk, 'seats': 2}])
+
+        # nothing new, the cursor stays
+        self.assertEqual(feed.get_changes(cursor), {'changes': [], 'cursor': cursor, 'has_more': False})
+
+        booking2.number_of_people = 2
+        booking2.save()
+        ArchivedBooking.archive(datetime.datetime(2016, 2, 2))
+        booking1_id, booking2_id = booking1.pk, booking2.pk
+        booking2.delete()
+        changes, cursor = self._read_all(cursor)
+        self.assertEqual([(_change['booking_id'], _change['action'], _change['booking']) for _change in changes],
+                         [(booking2_id, UPDATED, None), (booking1_id, ARCHIVED, None), (booking2_id, DELETED, None)])
+
+        # resumed from the middle of a page
+        changes, cursor = self._read_all(changes[0]['cursor'])
+        self.assertEqual([_change['action'] for _change in changes], [ARCHIVED, DELETED])
+        self.assertEqual(self._read_all(hire_point_id=self.hire_point2.pk), ([], feed.get_cursor(0)))
+
+    def test_delay(self):
+        BookingChange.objects.update(changed_at=timezone.now() - datetime.timedelta(seconds=10))
+        Booking.objects.create(
+            name='Client', number_of_people=1, hire_point=self.hire_point1,
+            start_time=datetime.datetime(2016, 2, 3, 10, 0), end_time=datetime.datetime(2016, 2, 3, 11, 0)
+        )
+        self.assertEqual(len(feed.get_changes(delay=5)['changes']), 2)
+        self.assertEqual(len(feed.get_changes(delay=0)['changes']), 3)
+        with override_settings(BOATING_CHANGES_DELAY=5):
+            self.assertEqual(len(feed.get_changes()['changes']), 2)
+
+    def test_invalid_cursor(self):
+        for cursor in ['not a cursor', 'LTE', '!']:
+            with self.assertRaises(ValueError):
+                feed.parse_cursor(cursor)
+        self.assertEqual(feed.parse_cursor(feed.get_cursor(42)), 42)
+
+    def test_changes_view(self):
+        url = reverse('changes')
+        self.assertEqual(self.client.get(url).status_code, 302)  # to the admin login
+
+        User.objects.create_user('staff', password='1234', is_staff=True)
+        self.client.login(username='staff', password='1234')
+        page = json.loads(self.client.get(url, {'limit': 1}).content.decode('utf-8'))
+        self.assertTrue(page['has_more'])
+        self.assertEqual(page['changes'][0]['booking']['start_time'], '2016-02-01T10:00:00+00:00')
+        page = json.loads(self.client.get(url, {'cursor': page['cursor']}).content.decode('utf-8'))
+        self.assertEqual(
+            ([_change['booking_id'] for _change in page['changes']], page['has_more']),
+            ([self.bookings_in_hire_point1[1].pk], False)
+        )
+        self.assertEqual(self.client.get(url, {'cursor': 'not a cursor'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'limit': feed.MAX_PAGE_SIZE + 1}).status_code, 400)
+
+
+class AnalyticsTestCase(BookingMixin, BoatingTestCase):
+    def setUp(self):
+        super(AnalyticsTestCase, self).setUp()
+        booking = Booking.objects.create(
+            name='Group', number_of_people=10, hire_point=self.hire_point1,
+            start_time=datetime.datetime(2016, 2, 3, 12, 0), end_time=datetime.datetime(2016, 2, 3, 13, 0)
+        )
+        booking.boats.add(*self.boats_in_hire_point1)
+        self.start = datetime.date(2016, 2, 1)  # Monday
+        self.end = datetime.date(2016, 2, 7)
+
+    def test_grids(self):
+        config = reference.get_hire_point_config(self.hire_point1.pk)
+        open_grid = analytics.get_open_grid(config, self.start, 7)
+        self.assertEqual(open_grid.shape, (7, analytics.SLOTS_PER_DAY))
+        self.assertEqual(list(open_grid.sum(axis=1)), [44] * 5 + [0] * 2)
+
+        busy, people_slots = analytics.get_busy_grid(config, self.start, 7)
+        self.assertEqual(busy.shape, (4, 7, analytics.SLOTS_PER_DAY))
+        self.assertEqual(list(busy.sum(axis=(1, 2))), [12, 4, 4, 4])
+        self.assertTrue(busy[0, 0, 40:44].all())  # 10:00 to 11:00
+        self.assertFalse(busy[0, 0, 44])
+        self.assertEqual(sorted(people_slots.values()), [4, 4, 40])
+        busy_by_chunks, people_slots_by_chunks = analytics.get_busy_grid(config, self.start, 7, chunk_size=1)
+        self.assertTrue((busy_by_chunks == busy).all())
+        self.assertEqual(people_slots_by_chunks, people_slots)
+
+        with timezone.override(timezone.get_fixed_timezone(60)):
+            booking = Booking.objects.create(
+                name='Client', number_of_people=1, hire_point=self.hire_point1,
+                start_time=timezone.make_aware(datetime.datetime(2016, 2, 4, 10, 0)),
+                end_time=timezone.make_aware(datetime.datetime(2016, 2, 4, 11, 0))
+            )
+            booking.boats.add(self.boats_in_hire_point1[1])
+            busy, people_slots = analytics.get_busy_grid(config, self.start, 7)
+        self.assertEqual(list(busy[1, 3].nonzero()[0]), [40, 41, 42, 43])  # in local time
+
+    def test_utilization(self):
+        report = analytics.get_hire_point_utilization(
+            reference.get_hire_point_config(self.hire_point1.pk), self.start, self.end
+        )
+        self.assertEqual(
+            (report['bookings'], report['open_hours'], report['busy_hours'], report['utilization']),
+            (3, 220.0, 6.0, 0.0273)
+        )
+        self.assertEqual(report['peak_hours'], [12, 10])
+        self.assertEqual((report['hourly_utilization'][8], report['hourly_utilization'][9]), (None, 0.0))
+        self.assertEqual(report['sold_out_hours'], 1.0)
+        self.assertEqual(
+            (report['people_hours'], report['seat_hours'], report['seat_waste_hours'], report['seat_utilization']),
+            (12.0, 20.0, 8.0, 0.6)
+        )
+        self.assertEqual([(_boat['busy_hours'], _boat['utilization']) for _boat in report['boats']],
+                         [(3.0, 0.0545), (1.0, 0.0182), (1.0, 0.0182), (1.0, 0.0182)])
+
+        ArchivedBooking.archive(datetime.datetime(2016, 2, 2))
+        self.assertEqual(analytics.get_utilization(self.start, self.start, [self.hire_point1.pk])[0]['bookings'], 0)
+        report = analytics.get_utilization(self.start, self.start, [self.hire_point1.pk], include_archived=True)[0]
+        self.assertEqual((report['bookings'], report['busy_hours']), (1, 1.0))
+
+    def test_command(self):
+        descriptor, path = tempfile.mkstemp(suffix='.json')
+        os.close(descriptor)
+        self.addCleanup(os.remove, path)
+        call_command('utilization', '2016-02-01', '2016-02-07', output=path)
+        with open(path) as output:
+            report = json.load(output)
+        self.assertEqual([(_hire_point['name'], _hire_point['bookings']) for _hire_point in report],
+                         [('HirePoint 1', 3), ('HirePoint 2', 0)])
+
+    def test_admin_report(self):
+        User.objects.create_superuser('admin', 'admin@example.com', '1234')
+        self.client.login(username='admin', password='1234')
+        response = self.client.post(reverse('admin:boating_hirepoint_changelist'), {
+            'action': 'utilization_report', '_selected_action': [self.hire_point1.pk]
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('hire_point=%s' % self.hire_point1.pk, response['Location'])
+
+        url = reverse('admin:boating_hirepoint_utilization')
+        response = self.client.get(url, {'start': '2016-02-01', 'end': '2016-02-07', 'hire_point': self.hire_point1.pk})
+        self.assertEqual([_hire_point['name'] for _hire_point in response.context['report']], ['HirePoint 1'])
+        self.assertContains(response, 'Hours sold out')
+        self.assertIsNone(self.client.get(url).context['report'])
+
+
+class SeriesTestCase(QueryBudgetMixin, BookingMixin, BoatingTestCase):
+    def setUp(self):
+        super(SeriesTestCase, self).setUp()
+        booking = Booking.objects.create(
+            name='Client3', number_of_people=2, hire_point=self.hire_point1,
+            start_time=datetime.datetime(2016, 2, 8, 10, 30), end_time=datetime.datetime(2016, 2, 8, 11, 30)
+        )
+        booking.boats.add(*self.boats_in_hire_point1[1:])
+        self.duration = datetime.timedelta(minutes=60)
+
+    def test_place_series(self):
+        date = datetime.date(2016, 2, 15)
+        slots = get_cached_slots(hire_point=self.hire_point1, date=date, number_of_people=12, duration=self.duration)
+        self.assertTrue(slots[4][2])  # 10:00 is available
+
+        with self.assertNumQueries(10):
+            series, occurrences = place_series(
+                self.hire_point1, 'School', datetime.datetime(2016, 2, 1, 10, 0), self.duration, 12, 4
+            )
+        self.assertEqual([(_start_time.day, _error) for _start_time, _booking, _error in occurrences],
+                         [(1, None), (8, views.NO_BOATS_AVAILABLE), (15, None), (22, None)])
+        bookings = list(series.bookings.order_by('start_time'))
+        self.assertEqual(bookings, [_booking for _start_time, _booking, _error in occurrences if _booking])
+        for booking in bookings:
+            boats = list(booking.boats.all())
+            self.assertGreaterEqual(sum(_boat.seats for _boat in boats), 12)
+            self.assertEqual(booking.claims.count(), 4 * len(boats))
+            self.assertEqual(booking.occupancy.count(), len(boats))
+        self.assertEqual(
+            BookingChange.objects.filter(booking_id__in=[_booking.pk for _booking in bookings]).count(), 3
+        )
+
+        # the cached slots are invalidated once the series is committed
+        run_commit_callbacks()
+        slots = get_cached_slots(hire_point=self.hire_point1, date=date, number_of_people=12, duration=self.duration)
+        self.assertFalse(slots[4][2])
+        self.assertFalse(self.hire_point1.is_available(datetime.datetime(2016, 2, 22, 10, 0), 3, self.duration))
+
+    def test_closed(self):
+        series, occurrences = place_series(
+            self.hire_point1, 'School', datetime.datetime(2016, 2, 5, 19, 30), self.duration, 2, 3, every=2
+        )
+        self.assertIsNone(series)
+        self.assertEqual([(_start_time.day, _booking, _error) for _start_time, _booking, _error in occurrences],
+                         [(5, None, views.HIRE_POINT_CLOSED), (19, None, views.HIRE_POINT_CLOSED),
+                          (4, None, views.HIRE_POINT_CLOSED)])
+        self.assertFalse(BookingSeries.objects.exists())
+
+    def test_series_view(self):
+        url = reverse('series', args=[self.hire_point1.pk])
+        data = {'name': 'Club', 'start_time': '2016-02-01 10:00:00', 'duration': 60, 'number_of_people': 12,
+                'occurrences': 20}
+        response = self.client.post(url, data)
+        self.assertEqual(response.status_code, 201)
+        self.assertQueryBudget(response)
+        content = json.loads(response.content.decode('utf-8'))
+        self.assertEqual(BookingSeries.objects.get().pk, content['series'])
+        self.assertEqual(len(content['occurrences']), 20)
+        self.assertEqual(content['occurrences'][1], {'start_time': '2016-02-08 10:00:00', 'booking': None,
+                                                     'reason': 'unavailable'})
+        self.assertEqual(Booking.objects.filter(series_id=content['series']).count(), 19)
+
+        response = self.client.post(url, data)  # every week is taken now
+        self.assertEqual((response.status_code, json.loads(response.content.decode('utf-8'))['series']), (409, None))
+        data['occurrences'] = 100
+        self.assertEqual(self.client.post(url, data).status_code, 400)
+
+
+class ReallocationTestCase(BookingMixin, BoatingTestCase):
+    def setUp(self):
+        super(ReallocationTestCase, self).setUp()
+        today = timezone.localtime(timezone.now()).date()
+        self.start_time = datetime.datetime.combine(
+            today + datetime.timedelta(days=7 - today.weekday()), datetime.time(10, 0)
+        )  # next Monday
+        self.duration = datetime.timedelta(minutes=60)
+        # the 6 seats boat for 3 people and a 4 seats boat for 2 leave 6 seats free
+        self.booking1 = self._create_booking(3, self.boats_in_hire_point1[3], self.start_time)
+        self.booking2 = self._create_booking(
+            2, self.boats_in_hire_point1[1], self.start_time + datetime.timedelta(minutes=15)
+        )
+
+    def _create_booking(self, people, boat, start_time):
+        booking = Booking.objects.create(
+            name='Client', number_of_people=people, hire_point=self.hire_point1,
+            start_time=start_time, end_time=start_time + self.duration
+        )
+        booking.boats.add(boat)
+        return booking
+
+    def test_selections(self):
+        boats = [Boat(id=_index, seats=_seats) for _index, _seats in enumerate([2, 4, 4, 6])]
+        self.assertEqual(reallocation.get_selections(boats, 8),
+                         [[boats[3], boats[0]], [boats[1], boats[2]], [boats[3], boats[1]], [boats[3], boats[2]]])
+        self.assertEqual(reallocation.get_selections(boats, 8, limit=1), [[boats[3], boats[0]]])
+        self.assertEqual(reallocation.get_selections(boats, 17), [])
+
+    def test_place_booking(self):
+        self.assertFalse(self.hire_point1.is_available(self.start_time, 8, self.duration))
+        booking = place_booking(self.hire_point1, 'Party', self.start_time, self.duration, 8)
+
+        bookings = [booking, Booking.objects.get(pk=self.booking1.pk), Booking.objects.get(pk=self.booking2.pk)]
+        boats = [list(_booking.boats.all()) for _booking in bookings]
+        for _booking, _boats in zip(bookings, boats):
+            self.assertGreaterEqual(sum(_boat.seats for _boat in _boats), _booking.number_of_people)
+            self.assertEqual(_booking.claims.count(), 4 * len(_boats))
+            self.assertEqual(_booking.occupancy.count(), len(_boats))
+        all_boats = [_boat.pk for _boats in boats for _boat in _boats]
+        self.assertEqual(len(all_boats), len(set(all_boats)))
+        self.assertEqual(
+            set(BookingChange.objects.filter(action=UPDATED).values_list('booking_id', flat=True)),
+            set([self.booking1.pk, self.booking2.pk])
+        )
+
+        with self.assertRaisesMessage(OperationalError, views.NO_BOATS_AVAILABLE):
+            place_booking(self.hire_point1, 'Party', self.start_time, self.duration, 1)
+
+    def test_too_many_people(self):
+        # 6 + 4 seats are the most the boats left by the other bookings can give
+        with self.assertRaisesMessage(OperationalError, views.NO_BOATS_AVAILABLE):
+            place_booking(self.hire_point1, 'Party', self.start_time, self.duration, 11)
+        self.assertSequenceEqual(self.booking1.boats.all(), [self.boats_in_hire_point1[3]])
+        self.assertFalse(BookingChange.objects.filter(action=UPDATED).exists())
+
+    def test_started_bookings(self):
+        now = self.start_time + datetime.timedelta(minutes=5)
+        plan = reallocation.find_plan(self.hire_point1, self.start_time, self.duration, 8, now=now)
+        self.assertEqual(list(plan.moves), [self.booking2.pk])
+        self.assertEqual(plan.moves[self.booking2.pk], [self.boats_in_hire_point1[0]])
+        self.assertEqual(sorted(_boat.pk for _boat in plan.boats),
+                         [self.boats_in_hire_point1[1].pk, self.boats_in_hire_point1[2].pk])
+
+        self.assertIsNone(reallocation.find_plan(self.hire_point1, self.start_time, self.duration, 9, now=now))
+
+    def test_budget(self):
+        self.assertIsNotNone(reallocation.find_plan(self.hire_point1, self.start_time, self.duration, 8))
+        with override_settings(BOATING_REALLOCATION_TIMEOUT=0):
+            self.assertIsNone(reallocation.find_plan(self.hire_point1, self.start_time, self.duration, 8))
+        with override_settings(BOATING_REALLOCATION_MAX_BOOKINGS=1):
+            self.assertIsNone(reallocation.find_plan(self.hire_point1, self.start_time, self.duration, 8))
+
+
+class ExtraDatabaseMixin(object):
+    """
+    Adds a SQLite database in a temporary file, migrated, that is not rolled back after every test
+    """
+    database_alias = None
+
+    @classmethod
+    def setUpClass(cls):
+        super(ExtraDatabaseMixin, cls).setUpClass()
+        database_file, cls.database_name = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(database_file)
+        connections.databases[cls.database_alias] = {
+            'ENGINE': 'django.db.backends.sqlite3', 'NAME': cls.database_name
+        }
+        call_command('migrate', database=cls.database_alias, verbosity=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        connections[cls.database_alias].close()
+        del connections[cls.database_alias]
+        del connections.databases[cls.database_alias]
+        os.remove(cls.database_name)
+        super(ExtraDatabaseMixin, cls).tearDownClass()
+
+
+@override_settings(BOATING_READ_REPLICA='replica')
+class ReplicaTestCase(ExtraDatabaseMixin, BookingMixin, BoatingTestCase):
+    # a second database that never receives the rows of the default one, what is read from it shows
+    database_alias = 'replica'
+
+    def test_router(self):
+        self.assertEqual(Booking.objects.count(), 2)
+        with routers.use_replica():
+            self.assertEqual(Booking.objects.count(), 0)
+            with routers.use_replica(False):
+                self.assertEqual(Booking.objects.count(), 2)
+            with override_settings(BOATING_READ_REPLICA=None):
+                self.assertEqual(Booking.objects.count(), 2)
+            # the hire points are loaded from the default database
+            self.assertEqual(reference.get_hire_point_config(self.hire_point1.pk).hire_point, self.hire_point1)
+
+    def test_booking_page(self):
+        url = reverse('booking', args=[self.hire_point1.pk])
+        parameters = {'date': '2016-02-01', 'duration': 30, 'name': 'Client', 'number_of_people': 1}
+        response = self.client.get(url, parameters)
+        self.assertEqual(list(response.context['bookings']), [])
+
+        response = self.client.post(url, {
+            'start_time': '2016-02-01 12:00:00', 'duration': 30, 'name': 'Client', 'number_of_people': 5,
+            'hire_point': self.hire_point1.pk
+        })
+        booking = Booking.objects.get(name='Client')
+        self.assertRedirects(response, reverse('booking_successful', args=[booking.pk]))
+        self.assertIn(routers.PIN_COOKIE, response.cookies)
+        # the pinned client reads from the default database
+        response = self.client.get(url, parameters)
+        self.assertIn(booking, response.context['bookings'])
+        self.assertEqual(self.client.get(reverse('booking_successful', args=[booking.pk])).status_code, 200)
+
+        # other clients read from the replica, that does not have the booking
+        self.client.cookies.clear()
+        self.assertEqual(self.client.get(reverse('booking_successful', args=[booking.pk])).status_code, 404)
+        self.client.cookies[routers.PIN_COOKIE] = '%d' % (time.time() - 1)
+        self.assertEqual(self.client.get(reverse('booking_successful', args=[booking.pk])).status_code, 404)
+
+    def test_booking_etag(self):
+        url = reverse('booking', args=[self.hire_point1.pk])
+        parameters = {'date': '2016-02-01', 'duration': 30, 'name': 'Client', 'number_of_people': 1}
+        # the replica may be behind the versions of the primary
+        self.assertFalse(self.client.get(url, parameters).has_header('ETag'))
+        self.client.cookies[routers.PIN_COOKIE] = '%d' % (time.time() + 60)
+        self.assertTrue(self.client.get(url, parameters).has_header('ETag'))
+
+    def test_cached_slots(self):
+        date = datetime.date(2016, 2, 1)
+        duration = datetime.timedelta(minutes=30)
+        with override_settings(BOATING_REPLICA_PIN=0.1):
+            get_cached_slots(self.hire_point1, date, 1, duration)
+            with routers.use_replica():
+                get_cached_slots(self.hire_point1, date, 5, duration)
+        time.sleep(0.2)
+        # the slots read from the replica expire as soon as the pins do
+        self.assertIsNotNone(
+            availability_cache.get_slots(availability_cache.get_slots_key(self.hire_point1, date, 1, duration))
+        )
+        self.assertIsNone(
+            availability_cache.get_slots(availability_cache.get_slots_key(self.hire_point1, date, 5, duration))
+        )
+
+
+@override_settings(BOATING_SHARD_MAP={100: 'shard1'})
+class ShardingTestCase(ExtraDatabaseMixin, HirePointMixin, BoatingTestCase):
+    database_alias = 'shard1'
+
+    def setUp(self):
+        super(ShardingTestCase, self).setUp()
+        availability_cache.get_cache().clear()
+        self.hire_point = HirePoint.objects.create(pk=100, name='HirePoint 100', description='Every day')
+        self.addCleanup(sharding.delete_hire_point, self.hire_point, 'shard1')
+        for day in range(MONDAY, SUNDAY + 1):
+            self.hire_point.opening_times.create(day=day, from_hour=datetime.time(9), to_hour=datetime.time(20))
+        self.boats = [self.hire_point.boats.create(seats=_seats) for _seats in [2, 4]]
+        self.start_time = datetime.datetime(2016, 2, 1, 10, 0)
+        self.duration = datetime.timedelta(minutes=60)
+
+    def _place_booking(self, people=4):
+        hire_point = reference.get_hire_point_config(self.hire_point.pk).hire_point
+        return place_booking(hire_point, 'Client', self.start_time, self.duration, people)
+
+    def test_routing(self):
+        self.assertTrue(HirePoint.objects.using('shard1').filter(pk=self.hire_point.pk).exists())
+        self.assertFalse(Boat.objects.filter(hire_point_id=self.hire_point.pk).exists())
+        self.assertEqual(Boat.objects.using('shard1').filter(hire_point_id=self.hire_point.pk).count(), 2)
+        self.assertEqual(reference.get_hire_point_config(self.hire_point.pk).boats, self.boats)
+
+        slots = get_slots(self.hire_point, self.start_time.date(), 4, self.duration)
+        self.assertTrue(slots[4][2])  # 10:00
+        booking = self._place_booking()
+        self.assertEqual(booking._state.db, 'shard1')
+        self.assertFalse(Booking.objects.filter(hire_point_id=self.hire_point.pk).exists())
+        self.assertSequenceEqual(booking.boats.all(), [self.boats[1]])
+        self.assertEqual(BoatSlotClaim.objects.using('shard1').filter(booking_id=booking.pk).count(), 4)
+        self.assertEqual(BookingChange.objects.using('shard1').get().booking_id, booking.pk)
+        slots = get_slots(self.hire_point, self.start_time.date(), 4, self.duration)
+        self.assertFalse(slots[4][2])
+        self.assertEqual(feed.get_changes(hire_point_id=self.hire_point.pk)['changes'][0]['booking']['id'], booking.pk)
+
+        # the hire point takes with it its rows in the shard
+        HirePoint.objects.get(pk=self.hire_point.pk).delete()
+        self.assertFalse(HirePoint.objects.using('shard1').exists())
+        self.assertFalse(Booking.objects.using('shard1').exists())
+
+    def test_booking_view(self):
+        url = reverse('booking', args=[self.hire_point.pk])
+        response = self.client.post(url, {
+            'start_time': '2016-02-01 10:00:00', 'duration': 60, 'name': 'Client', 'number_of_people': 5,
+            'hire_point': self.hire_point.pk
+        })
+        booking = Booking.objects.using('shard1').get(name='Client')
+        success_url = '%s?hire_point=%s' % (reverse('booking_successful', args=[booking.pk]), self.hire_point.pk)
+        self.assertRedirects(response, success_url)
+        self.assertSequenceEqual(booking.boats.all(), self.boats)
+
+        response = self.client.get(url, {'date': '2016-02-01', 'duration': 60, 'name': 'Client', 'number_of_people': 1})
+        self.assertEqual(list(response.context['bookings']), [booking])
+
+    def test_admin(self):
+        booking = self._place_booking()
+        User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.login(username='admin', password='password')
+
+        response = self.client.get(reverse('admin:boating_hirepoint_change', args=[self.hire_point.pk]))
+        self.assertContains(response, 'name="boats-TOTAL_FORMS" type="hidden" value="2"')
+        response = self.client.get(reverse('admin:boating_booking_changelist'), {'hire_point__id__exact': 100})
+        self.assertEqual(list(response.context['cl'].result_list), [booking])
+        response = self.client.get(reverse('admin:boating_booking_changelist'))
+        self.assertEqual(list(response.context['cl'].result_list), [])
+
+        # the booking is opened from the changelist filtered by its hire point, the id alone may be another one
+        url = reverse('admin:boating_booking_change', args=[booking.pk])
+        response = self.client.get(url, {'_changelist_filters': 'hire_point__id__exact=100'})
+        self.assertEqual(response.context['original'], booking)
+        self.assertRedirects(self.client.get(url), reverse('admin:boating_booking_changelist'))
+        self.assertRedirects(
+            self.client.get(reverse('admin:boating_booking_delete', args=[booking.pk])),
+            reverse('admin:boating_booking_changelist')
+        )
+
+        response = self.client.post(reverse('admin:boating_hirepoint_change', args=[self.hire_point.pk]), {
+            'name': 'HirePoint 100', 'description': 'Every day',
+            'boats-TOTAL_FORMS': 3, 'boats-INITIAL_FORMS': 2,
+            'boats-0-id': self.boats[0].pk, 'boats-0-hire_point': 100, 'boats-0-seats': 2,
+            'boats-1-id': self.boats[1].pk, 'boats-1-hire_point': 100, 'boats-1-seats': 4,
+            'boats-2-hire_point': 100, 'boats-2-seats': 6,
+            'opening_times-TOTAL_FORMS': 0, 'opening_times-INITIAL_FORMS': 0,
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(
+            sorted(Boat.objects.using('shard1').filter(hire_point_id=100).values_list('seats', flat=True)), [2, 4, 6]
+        )
+
+    def test_writer(self):
+        self.addCleanup(writer.stop_writers)
+
+        def in_transaction():
+            return connections['shard1'].in_atomic_block, connections[DEFAULT_DB_ALIAS].in_atomic_block
+
+        # the batches of the hire point are written in its shard
+        self.assertEqual(writer.run(self.hire_point.pk, in_transaction), (True, False))
+
+    def test_migrate_shard(self):
+        booking = self._place_booking()
+        self.start_time = datetime.datetime(2015, 2, 2, 10, 0)
+        self._place_booking(6)
+        self.assertEqual(ArchivedBooking.archive(datetime.datetime(2016, 1, 1), using='shard1'), 1)
+
+        output = six.StringIO()
+        call_command('migrate_shard', str(self.hire_point.pk), 'default', stdout=output)
+        self.assertIn('Copied 2 boats, 7 opening times, 0 series, 1 bookings and 1 archived bookings',
+                      output.getvalue())
+        # the hire point is still read from its shard
+        with self.assertRaisesMessage(CommandError, 'BOATING_SHARD_MAP must give default'):
+            call_command('migrate_shard', str(self.hire_point.pk), 'default', source='shard1', delete=True)
+        self.assertTrue(Boat.objects.using('shard1').exists())
+        with override_settings(BOATING_SHARD_MAP={}):
+            with self.assertRaisesMessage(CommandError, '--delete needs the --source'):
+                call_command('migrate_shard', str(self.hire_point.pk), 'default', delete=True)
+            call_command('migrate_shard', str(self.hire_point.pk), 'default', source='shard1', delete=True,
+                         stdout=output)
+        self.assertFalse(Boat.objects.using('shard1').exists())
+        self.assertFalse(BookingChange.objects.using('shard1').exists())
+        self.assertFalse(HirePoint.objects.using('shard1').exists())
+
+        with override_settings(BOATING_SHARD_MAP={}):
+            copy = Booking.objects.get(hire_point=self.hire_point)
+            self.assertEqual((to_naive(copy.start_time), copy.number_of_people), (booking.start_time, 4))
+            self.assertEqual([_boat.seats for _boat in copy.boats.all()], [4])
+            self.assertEqual(copy.claims.count(), 4)
+            archived = ArchivedBooking.objects.get(hire_point=self.hire_point)
+            self.assertEqual([_boat.seats for _boat in archived.boats.all()], [2, 4])
+            self.assertEqual(
+                list(BookingChange.objects.filter(hire_point_id=self.hire_point.pk).values_list('action', flat=True)),
+                [CREATED, CREATED, ARCHIVED]
+            )
+            self.start_time = datetime.datetime(2016, 2, 1, 10, 0)
+            with self.assertRaisesMessage(OperationalError, views.NO_BOATS_AVAILABLE):
+                self._place_booking(6)
@@ -16,12 +16,22 @@ Including another URLconf
 from django.conf.urls import url
 from django.contrib import admin
 
-from boating.views import HomeView, BookingView, BookingSuccessfulView, BookingUnsuccessfulView
+from boating.views import (
+    HomeView, BookingView, BookingSuccessfulView, BookingUnsuccessfulView, CalendarView, ChangesView, DurationsView,
+    ExportView, NextAvailableView, SearchView, SeriesView
+)
 
 urlpatterns = [
     url(r'^admin/', admin.site.urls),
     url(r'^$', HomeView.as_view(),  name='home'),
+    url(r'^search/$', SearchView.as_view(),  name='search'),
     url(r'^hire_point/(?P<pk>\d+)/$', BookingView.as_view(),  name='booking'),
+    url(r'^hire_point/(?P<pk>\d+)/next/$', NextAvailableView.as_view(),  name='next_available'),
+    url(r'^hire_point/(?P<pk>\d+)/calendar/$', CalendarView.as_view(),  name='calendar'),
+    url(r'^hire_point/(?P<pk>\d+)/durations/$', DurationsView.as_view(),  name='durations'),
+    url(r'^hire_point/(?P<pk>\d+)/series/$', SeriesView.as_view(),  name='series'),
+    url(r'^hire_point/(?P<pk>\d+)/export/$', ExportView.as_view(),  name='export'),
+    url(r'^changes/$', ChangesView.as_view(),  name='changes'),
     url(r'^booking/(?P<pk>\d+)/$', BookingSuccessfulView.as_view(),  name='booking_successful'),
     url(r'^booking/fail/$', BookingUnsuccessfulView.as_view(),  name='booking_unsuccessful'),
 ]
@@ -1,22 +1,75 @@
+import copy
 import datetime
+import functools
+import hashlib
 
+from multiprocessing import TimeoutError
+from multiprocessing.pool import ThreadPool
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
 from django.core.urlresolvers import reverse
-from django.db import transaction
-from django.db.utils import DatabaseError, OperationalError
-from django.http import HttpResponseRedirect
-from django.shortcuts import get_object_or_404
-from django.views.generic import FormView
+from django.db import DEFAULT_DB_ALIAS, connection, transaction
+from django.db.utils import DatabaseError, IntegrityError, OperationalError
+from django.http import Http404, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import etag
+from django.views.generic import FormView, View
 from django.views.generic.base import TemplateView
 from django.views.generic.detail import DetailView
 
-from boating.forms import BookingForm, HomeForm
-from boating.models import Booking, HirePoint, SLOT_TIME
+from boating import cache as availability_cache, export, feed, reallocation, reference, routers, writer
+from boating.availability import to_naive
+from boating.forms import (
+    DURATION_CHOICES, BookingForm, CalendarForm, ChangesForm, DurationsForm, ExportForm, HomeForm, SeriesForm
+)
+from boating.models import Booking, MAX_DURATION, SLOT_TIME
 from boating.utils import generate_url
 
+BOOKING_ATTEMPTS = 3
+HIRE_POINT_CLOSED = 'The hire_point is close'
+NO_BOATS_AVAILABLE = 'No boats available'
+TOO_MANY_ATTEMPTS = 'Too many concurrent bookings'
+# reason given to the unsuccessful booking page, any other database error is reported as 'database'
+FAILURE_REASONS = {
+    HIRE_POINT_CLOSED: 'closed',
+    NO_BOATS_AVAILABLE: 'unavailable',
+    TOO_MANY_ATTEMPTS: 'contention',
+    writer.QUEUE_FULL: 'busy',
+    writer.NOT_WRITTEN_IN_TIME: 'timeout',
+}
+# what the unsuccessful booking page shows for every reason
+FAILURE_MESSAGES = {
+    'closed': 'The hire point is closed at that time.',
+    'unavailable': 'There are not boats enough for your party at that time.',
+    'contention': 'Too many bookings are being made right now, please try again.',
+    'busy': 'Too many bookings are being made right now, please try again.',
+    'timeout': 'Too many bookings are being made right now, please try again.',
+    'database': 'The booking could not be saved, please try again.',
+    'invalid': 'The booking details are not valid.',
+}
 
-def place_booking(hire_point, name, start_time, duration, number_of_people):
+_search_pools = {}
+_search_pools_lock = threading.Lock()
+
+
+def get_hire_point_or_404(pk):
+    """
+    Gets the hire point from the configuration kept in memory
+    """
+    config = reference.get_hire_point_config(pk)
+    if config is None:
+        raise Http404('No hire point found')
+    return copy.copy(config.hire_point)
+
+
+def _place_booking(hire_point, name, start_time, duration, number_of_people):
     """
-    This code runs in an atomic transaction to avoid concurrency issues during the booking process
+    The boats are claimed slot by slot in a table with a unique constraint, if another booking claims
+    any of them first the database rejects the claims and the next best boats are tried.
+    When no boats are free the boats of the overlapping bookings are reallocated if that makes room
     :param hire_point:
     :param name:
     :param start_time:
@@ -25,41 +78,120 @@ def place_booking(hire_point, name, start_time, duration, number_of_people):
     :return: booking object
     :raises: DatabaseError if something is not correct
     """
+    start_time = to_naive(start_time)
     end_time = start_time + duration
-    with transaction.atomic():
-        if not hire_point.is_open(time=start_time) or not hire_point.is_open(time=end_time):
-            raise OperationalError('The hire_point is close')
-        boats = hire_point.is_available(start_time=start_time, people=number_of_people, duration=duration)
-        if not boats:
-            raise OperationalError('No boats available')
-        booking = Booking.objects.create(
-            name=name, hire_point=hire_point, number_of_people=number_of_people,
-            start_time=start_time, end_time=end_time
+    if not hire_point.is_open(time=start_time) or not hire_point.is_open(time=end_time):
+        raise OperationalError(HIRE_POINT_CLOSED)
+    for _attempt in range(BOOKING_ATTEMPTS):
+        occupancy = hire_point.get_occupancy(start_time=start_time, end_time=end_time)
+        boats = hire_point.is_available(
+            start_time=start_time, people=number_of_people, duration=duration, occupancy=occupancy
         )
-        booking.boats.add(*boats)
-        return booking
+        plan = None
+        if not boats:
+            plan = reallocation.find_plan(hire_point, start_time, duration, number_of_people)
+            if plan is None:
+                raise OperationalError(NO_BOATS_AVAILABLE)
+            boats = plan.boats
+        try:
+            with transaction.atomic(using=routers.get_shard(hire_point.pk)):
+                if plan is not None:
+                    reallocation.apply_plan(plan)
+                booking = hire_point.bookings.create(
+                    name=name, number_of_people=number_of_people,
+                    start_time=start_time, end_time=end_time
+                )
+                booking.boats.add(*boats)
+            return booking
+        except IntegrityError:
+            continue  # the boats have been claimed by another booking meanwhile
+    raise OperationalError(TOO_MANY_ATTEMPTS)
 
 
-def get_slots(hire_point, date, number_of_people, duration):
+def place_booking(hire_point, name, start_time, duration, number_of_people):
     """
-    Generate a list of all the possible schedules available in a hire_point
+    Same as _place_booking, with BOATING_BOOKING_WRITER it is run by the single writer of the hire point
+    """
+    if getattr(settings, 'BOATING_BOOKING_WRITER', False):
+        return writer.run(hire_point.pk, _place_booking, hire_point, name, start_time, duration, number_of_people)
+    return _place_booking(hire_point, name, start_time, duration, number_of_people)
+
+
+def _place_series(hire_point, name, start_time, duration, number_of_people, occurrences, every):
+    """
+    Books the same period every some weeks. The bookings of all the occurrences are loaded with one query,
+    the boats are selected in memory and every booking is written in one transaction with bulk inserts,
+    the occurrences that cannot be booked are skipped
     :param hire_point:
-    :param date:
-    :param number_of_people:
+    :param name:
+    :param start_time: start of the first booking
     :param duration:
-    :return: A list of tuples, the first element represents the slot id,
-    the second element is its verbose name, the third element tell us if the slot is available
-    and the last element a selection of boats that the user will use
+    :param number_of_people:
+    :param occurrences: number of bookings
+    :param every: weeks between bookings
+    :return: The series, None if no occurrence could be booked, and a list of (start time, booking or None,
+    error message or None) tuples, one per occurrence
+    :raises: DatabaseError if something is not correct
     """
-    available_slots, available_boats = hire_point.get_available_slots(
-        date=date,
-        people=number_of_people,
-        duration=duration
-    )
+    start_time = to_naive(start_time)
+    start_times = [start_time + datetime.timedelta(weeks=every * _index) for _index in range(occurrences)]
+    periods = [(_start_time, _start_time + duration) for _start_time in start_times]
+    for _attempt in range(BOOKING_ATTEMPTS):
+        occupancy = hire_point.get_periods_occupancy(periods)
+        allocations = []
+        errors = {}
+        for occurrence_start in start_times:
+            occurrence_end = occurrence_start + duration
+            if not hire_point.is_open(time=occurrence_start) or not hire_point.is_open(time=occurrence_end):
+                errors[occurrence_start] = HIRE_POINT_CLOSED
+                continue
+            boats = hire_point.is_available(
+                start_time=occurrence_start, people=number_of_people, duration=duration, occupancy=occupancy
+            )
+            if not boats:
+                errors[occurrence_start] = NO_BOATS_AVAILABLE
+                continue
+            occupancy.add(boats, occurrence_start, occurrence_end)
+            allocations.append((occurrence_start, boats))
+        if not allocations:
+            return None, [(_start_time, None, errors[_start_time]) for _start_time in start_times]
+
+        try:
+            with transaction.atomic(using=routers.get_shard(hire_point.pk)):
+                series = hire_point.series.create(
+                    name=name, number_of_people=number_of_people, start_time=start_time,
+                    duration=int(duration.total_seconds()) // 60, occurrences=occurrences, every=every
+                )
+                bookings = series.create_bookings(allocations)
+        except IntegrityError:
+            continue  # some boats have been claimed by another booking meanwhile
+        for booking in bookings:
+            # the writer commits the series with the rest of its batch
+            transaction.on_commit(functools.partial(
+                availability_cache.invalidate_booking, hire_point_id=booking.hire_point_id,
+                start_time=booking.start_time, end_time=booking.end_time, max_duration=MAX_DURATION
+            ), using=routers.get_shard(hire_point.pk))
+        bookings = dict((to_naive(_booking.start_time), _booking) for _booking in bookings)
+        return series, [
+            (_start_time, bookings.get(_start_time), errors.get(_start_time)) for _start_time in start_times
+        ]
+    raise OperationalError(TOO_MANY_ATTEMPTS)
+
+
+def place_series(hire_point, name, start_time, duration, number_of_people, occurrences, every=1):
+    """
+    Same as _place_series, with BOATING_BOOKING_WRITER it is run by the single writer of the hire point
+    """
+    if getattr(settings, 'BOATING_BOOKING_WRITER', False):
+        return writer.run(
+            hire_point.pk, _place_series, hire_point, name, start_time, duration, number_of_people, occurrences, every
+        )
+    return _place_series(hire_point, name, start_time, duration, number_of_people, occurrences, every)
+
+
+def _build_slots(start_time, closing_time, duration, available_slots, available_boats):
     available_slots = [_date.strftime('%Y-%m-%d %H:%M:%S') for _date in available_slots]
     slots = []
-    start_time = hire_point.get_start_time(date)
-    closing_time = hire_point.get_closing_time(date)
     if start_time and closing_time:
         from_hour = start_time
         while from_hour + duration <= closing_time:
@@ -82,6 +214,172 @@ def get_slots(hire_point, date, number_of_people, duration):
     return slots
 
 
+def get_slots(hire_point, date, number_of_people, duration):
+    """
+    Generate a list of all the possible schedules available in a hire_point
+    :param hire_point:
+    :param date:
+    :param number_of_people:
+    :param duration:
+    :return: A list of tuples, the first element represents the slot id,
+    the second element is its verbose name, the third element tell us if the slot is available
+    and the last element a selection of boats that the user will use
+    """
+    available_slots, available_boats = hire_point.get_available_slots(
+        date=date,
+        people=number_of_people,
+        duration=duration
+    )
+    return _build_slots(
+        hire_point.get_start_time(date), hire_point.get_closing_time(date), duration, available_slots, available_boats
+    )
+
+
+def get_slots_by_duration(hire_point, date, number_of_people, durations):
+    """
+    Same as get_slots for several durations at once
+    :return: A dictionary with the durations as keys and the slots as values
+    """
+    start_time = hire_point.get_start_time(date)
+    closing_time = hire_point.get_closing_time(date)
+    availability = hire_point.get_available_slots_by_duration(
+        date=date, people=number_of_people, durations=durations
+    )
+    return dict(
+        (_duration, _build_slots(start_time, closing_time, _duration, _available_slots, _available_boats))
+        for _duration, (_available_slots, _available_boats) in availability.items()
+    )
+
+
+def get_cached_slots(hire_point, date, number_of_people, duration):
+    """
+    Same as get_slots but the result is kept in the cache until a change affects that date.
+    The slots read from the replica are kept only while a client is pinned to the primary after booking,
+    a replica behind the primary would leave them outdated under the current version
+    """
+    key = availability_cache.get_slots_key(hire_point, date, number_of_people, duration)
+    slots = availability_cache.get_slots(key)
+    if slots is None:
+        slots = get_slots(
+            hire_point=hire_point, date=date, number_of_people=number_of_people, duration=duration
+        )
+        if routers.is_replica_used():
+            availability_cache.set_slots(key, slots, routers.get_pin_seconds())
+        else:
+            availability_cache.set_slots(key, slots)
+    return slots
+
+
+def _get_slots_in_thread(hire_point, date, number_of_people, duration, replica=False):
+    try:
+        with routers.use_replica(replica):
+            return get_cached_slots(hire_point, date, number_of_people, duration)
+    finally:
+        connection.close()  # every thread opens its own connection
+
+
+def _get_search_pool(workers):
+    """
+    The pool of threads of the searches, it is created once for every size and shared by the requests
+    """
+    with _search_pools_lock:
+        if workers not in _search_pools:
+            _search_pools[workers] = ThreadPool(processes=workers)
+        return _search_pools[workers]
+
+
+class _SearchTask(object):
+    """
+    Evaluation of a hire point in a thread of the pool, skipped if the search gave up before a thread took it
+    """
+
+    def __init__(self, *args):
+        self.args = args
+        self.started = None
+        self.cancelled = False
+
+    def __call__(self):
+        if self.cancelled:
+            return None
+        self.started = time.time()
+        return _get_slots_in_thread(*self.args)
+
+
+def _get_task_result(task, async_result, timeout, deadline):
+    """
+    Waits for a hire point up to timeout seconds since a thread took it and never after the deadline
+    :return: The slots of the hire point or None if it did not finish in time
+    """
+    while True:
+        started = task.started
+        end = min((started if started is not None else time.time()) + timeout, deadline)
+        try:
+            return async_result.get(max(end - time.time(), 0))
+        except TimeoutError:
+            started = task.started
+            if time.time() >= deadline or started is not None and time.time() >= started + timeout:
+                return None
+
+
+def search_hire_points(date, number_of_people, duration, workers=None, timeout=None):
+    """
+    Evaluates the availability of every hire point in the pool of threads of the searches
+    :param date:
+    :param number_of_people:
+    :param duration:
+    :param workers: threads of the pool, BOATING_SEARCH_WORKERS by default
+    :param timeout: seconds a hire point has to finish once a thread takes it, BOATING_SEARCH_TIMEOUT by default.
+    The hire points not taken in the time the pool would need if all of them timed out are skipped
+    :return: A list of tuples with the hire point and its slots, None if it did not finish in time,
+    with the hire points having more slots available first
+    """
+    workers = max(workers or getattr(settings, 'BOATING_SEARCH_WORKERS', 4), 1)
+    timeout = timeout if timeout is not None else getattr(settings, 'BOATING_SEARCH_TIMEOUT', 5)
+    hire_points = [copy.copy(_config.hire_point) for _config in reference.get_hire_points().values()]
+    pool = _get_search_pool(workers)
+    replica = routers.is_replica_used()  # the threads read from the same database
+    tasks = [
+        (_hire_point, _SearchTask(_hire_point, date, number_of_people, duration, replica))
+        for _hire_point in hire_points
+    ]
+    async_results = [(_hire_point, _task, pool.apply_async(_task)) for _hire_point, _task in tasks]
+    deadline = time.time() + timeout * -(-len(hire_points) // workers)
+    results = []
+    try:
+        for hire_point, task, async_result in async_results:
+            results.append((hire_point, _get_task_result(task, async_result, timeout, deadline)))
+    finally:
+        # the hire points still queued are not evaluated, the running ones finish on their own
+        for hire_point, task in tasks:
+            task.cancelled = True
+
+    def _rank(result):
+        hire_point, slots = result
+        available = len([_slot for _slot in slots if _slot[2]]) if slots is not None else -1
+        return -available, hire_point.name
+    return sorted(results, key=_rank)
+
+
+def get_booking_etag(request, pk):
+    """
+    ETag of the booking page. It changes with the availability of the day, the configuration of the
+    hire points, the query parameters and the CSRF cookie whose token is in the form.
+    There is none for the pages read from the replica, the versions are the ones of the primary
+    """
+    if routers.is_replica_used():
+        return None
+    try:
+        date = datetime.datetime.strptime(request.GET.get('date', ''), '%Y-%m-%d').date()
+    except ValueError:
+        return None
+    value = '%s:%s:%s:%s:%s' % (
+        pk, availability_cache.get_version(pk, date), reference.get_version(), sorted(request.GET.lists()),
+        request.COOKIES.get(settings.CSRF_COOKIE_NAME, '')
+    )
+    return hashlib.md5(value.encode('utf-8')).hexdigest()
+
+
+@method_decorator(routers.read_from_replica, name='get')
 class HomeView(FormView):
     form_class = HomeForm
     template_name = 'hire_point/home.html'
@@ -102,10 +400,51 @@ class HomeView(FormView):
             'name': name,
             'number_of_people': number_of_people,
         }
-        url = generate_url(self.get_success_url(hire_point), parameters)
+        if hire_point is None:
+            url = generate_url(reverse('search'), parameters)
+        else:
+            url = generate_url(self.get_success_url(hire_point), parameters)
         return HttpResponseRedirect(url)
 
 
+@method_decorator(routers.read_from_replica, name='get')
+class SearchView(TemplateView):
+    """
+    Availability in every hire point
+    """
+    template_name = 'hire_point/search_results.html'
+
+    def get_context_data(self, **kwargs):
+        context = super(SearchView, self).get_context_data(**kwargs)
+        date = datetime.datetime.strptime(self.request.GET.get('date'), '%Y-%m-%d').date()
+        duration = self.request.GET.get('duration')
+        name = self.request.GET.get('name')
+        number_of_people = int(self.request.GET.get('number_of_people'))
+
+        results = []
+        for hire_point, slots in search_hire_points(
+            date=date, number_of_people=number_of_people, duration=datetime.timedelta(minutes=int(duration))
+        ):
+            parameters = {
+                'date': date,
+                'duration': duration,
+                'name': name,
+                'number_of_people': number_of_people,
+            }
+            results.append({
+                'hire_point': hire_point,
+                'url': generate_url(reverse('booking', args=[hire_point.pk]), parameters),
+                'timed_out': slots is None,
+                'available_slots': [_slot for _slot in slots or [] if _slot[2]],
+            })
+
+        context.update({
+            'today': date,
+            'results': results,
+        })
+        return context
+
+
 class BookingView(FormView):
     form_class = BookingForm
     template_name = 'hire_point/available_slots.html'
@@ -117,14 +456,18 @@ class BookingView(FormView):
     name = None
 
     def dispatch(self, request, *args, **kwargs):
-        self.hire_point = get_object_or_404(HirePoint, pk=kwargs['pk'])
+        self.hire_point = get_hire_point_or_404(kwargs['pk'])
         return super(BookingView, self).dispatch(request, *args, **kwargs)
 
     def get_success_url(self, booking):
-        return reverse('booking_successful', args=[booking.id])
+        url = reverse('booking_successful', args=[booking.id])
+        if routers.get_shard(booking.hire_point_id) != DEFAULT_DB_ALIAS:
+            # the ids of the bookings are only unique inside every shard
+            url = generate_url(url, {'hire_point': booking.hire_point_id})
+        return url
 
-    def get_unsuccess_url(self):
-        return reverse('booking_unsuccessful')
+    def get_unsuccess_url(self, reason):
+        return generate_url(reverse('booking_unsuccessful'), {'reason': reason})
 
     def get_initial(self):
         initial = super(BookingView, self).get_initial()
@@ -140,7 +483,7 @@ class BookingView(FormView):
         context = super(BookingView, self).get_context_data(**kwargs)
         duration = datetime.timedelta(minutes=int(self.duration))
 
-        slots = get_slots(
+        slots = get_cached_slots(
             hire_point=self.hire_point, date=self.date, number_of_people=self.number_of_people, duration=duration
         )
 
@@ -154,21 +497,26 @@ class BookingView(FormView):
         next_url = generate_url(url, parameters)
         parameters['date'] = self.date + datetime.timedelta(days=-1)
         previous_url = generate_url(url, parameters)
+        parameters['date'] = self.date + datetime.timedelta(days=1)
+        next_available_url = generate_url(reverse('next_available', args=[self.hire_point.pk]), parameters)
 
         context.update({
             'today': self.date,
             'next_url': next_url,
             'previous_url': previous_url,
+            'next_available_url': next_available_url,
             'slots': slots,
-            'boats': self.hire_point.boats.all(),
+            'boats': self.hire_point.get_boats(),
             'bookings': Booking.get_bookings_between(
                 hire_point=self.hire_point,
                 start_time=datetime.datetime.combine(self.date, datetime.time.min),
                 end_time=datetime.datetime.combine(self.date, datetime.time.max) + datetime.timedelta(days=1)
-            ).order_by('start_time'),
+            ).order_by('start_time').prefetch_related('boats'),
         })
         return context
 
+    @method_decorator(routers.read_from_replica)
+    @method_decorator(etag(get_booking_etag))
     def get(self, request, *args, **kwargs):
         self.date = datetime.datetime.strptime(request.GET.get('date'), '%Y-%m-%d').date()
         self.duration = request.GET.get('duration')
@@ -185,18 +533,207 @@ class BookingView(FormView):
 
         try:
             booking = place_booking(hire_point, name, start_time, duration, number_of_people)
-            return HttpResponseRedirect(self.get_success_url(booking))
-        except DatabaseError:
-            return HttpResponseRedirect(self.get_unsuccess_url())
+            return routers.pin_to_primary(HttpResponseRedirect(self.get_success_url(booking)))
+        except DatabaseError as error:
+            return HttpResponseRedirect(self.get_unsuccess_url(FAILURE_REASONS.get(str(error), 'database')))
 
     def form_invalid(self, form):
-        return HttpResponseRedirect(self.get_unsuccess_url())
+        return HttpResponseRedirect(self.get_unsuccess_url('invalid'))
+
 
+@method_decorator(routers.read_from_replica, name='get')
+class NextAvailableView(View):
+    """
+    Redirects to the booking page of the first day with a slot available
+    """
+
+    def get(self, request, *args, **kwargs):
+        hire_point = get_hire_point_or_404(kwargs['pk'])
+        date = datetime.datetime.strptime(request.GET.get('date'), '%Y-%m-%d').date()
+        duration = request.GET.get('duration')
+        number_of_people = int(request.GET.get('number_of_people'))
+
+        next_slot = hire_point.get_next_available_slot(
+            start_time=datetime.datetime.combine(date, datetime.time.min),
+            people=number_of_people,
+            duration=datetime.timedelta(minutes=int(duration)),
+        )
+        if next_slot is None:
+            return HttpResponseRedirect(reverse('booking_unsuccessful'))
+
+        slot, _boats = next_slot
+        parameters = {
+            'date': slot.date(),
+            'duration': duration,
+            'name': request.GET.get('name'),
+            'number_of_people': number_of_people,
+        }
+        return HttpResponseRedirect(generate_url(reverse('booking', args=[hire_point.pk]), parameters))
+
+
+@method_decorator(routers.read_from_replica, name='get')
+class CalendarView(View):
+    """
+    Bookable slots of every day in a month
+    """
+
+    def get(self, request, *args, **kwargs):
+        hire_point = get_hire_point_or_404(kwargs['pk'])
+        form = CalendarForm(request.GET)
+        if not form.is_valid():
+            return JsonResponse({'errors': form.errors}, status=400)
 
+        month = form.cleaned_data['month']
+        days = hire_point.get_month_availability(
+            year=month.year,
+            month=month.month,
+            people=form.cleaned_data['number_of_people'],
+            duration=form.cleaned_data['duration'],
+        )
+        return JsonResponse({
+            'hire_point': hire_point.pk,
+            'month': month.strftime('%Y-%m'),
+            'days': [
+                {'date': _day['date'].strftime('%Y-%m-%d'), 'is_open': _day['is_open'], 'slots': _day['slots']}
+                for _day in days
+            ],
+        })
+
+
+@method_decorator(routers.read_from_replica, name='get')
+class DurationsView(View):
+    """
+    Slots of a day for every duration, so the page can switch between them without new requests
+    """
+
+    def get(self, request, *args, **kwargs):
+        hire_point = get_hire_point_or_404(kwargs['pk'])
+        form = DurationsForm(request.GET)
+        if not form.is_valid():
+            return JsonResponse({'errors': form.errors}, status=400)
+
+        durations = [datetime.timedelta(minutes=int(_value)) for _value, _name in DURATION_CHOICES]
+        slots_by_duration = get_slots_by_duration(
+            hire_point=hire_point,
+            date=form.cleaned_data['date'],
+            number_of_people=form.cleaned_data['number_of_people'],
+            durations=durations,
+        )
+        return JsonResponse({
+            'hire_point': hire_point.pk,
+            'date': form.cleaned_data['date'].strftime('%Y-%m-%d'),
+            'durations': dict(
+                (int(_duration.total_seconds() // 60), [
+                    {
+                        'id': _slot_id,
+                        'name': _verbose_name,
+                        'is_available': _is_available,
+                        'boats': [{'id': _boat.pk, 'seats': _boat.seats} for _boat in _boats],
+                    }
+                    for _slot_id, _verbose_name, _is_available, _boats in _slots
+                ])
+                for _duration, _slots in slots_by_duration.items()
+            ),
+        })
+
+
+class SeriesView(View):
+    """
+    Books the same period every some weeks and tells which bookings could be made
+    """
+
+    def post(self, request, *args, **kwargs):
+        hire_point = get_hire_point_or_404(kwargs['pk'])
+        form = SeriesForm(request.POST)
+        if not form.is_valid():
+            return JsonResponse({'errors': form.errors}, status=400)
+
+        try:
+            series, occurrences = place_series(
+                hire_point, form.cleaned_data['name'], form.cleaned_data['start_time'], form.cleaned_data['duration'],
+                form.cleaned_data['number_of_people'], form.cleaned_data['occurrences'], form.cleaned_data['every']
+            )
+        except DatabaseError as error:
+            return JsonResponse({'reason': FAILURE_REASONS.get(str(error), 'database')}, status=409)
+        response = JsonResponse({
+            'series': series.pk if series else None,
+            'occurrences': [
+                {
+                    'start_time': _start_time.strftime('%Y-%m-%d %H:%M:%S'),
+                    'booking': _booking.pk if _booking else None,
+                    'reason': FAILURE_REASONS[_error] if _error else None,
+                }
+                for _start_time, _booking, _error in occurrences
+            ],
+        }, status=201 if series else 409)
+        return routers.pin_to_primary(response) if series else response
+
+
+class ExportView(View):
+    """
+    Streams the bookings of a hire point between two dates, only for the staff
+    """
+
+    @method_decorator(staff_member_required)
+    def dispatch(self, request, *args, **kwargs):
+        return super(ExportView, self).dispatch(request, *args, **kwargs)
+
+    def get(self, request, *args, **kwargs):
+        hire_point = get_hire_point_or_404(kwargs['pk'])
+        form = ExportForm(request.GET)
+        if not form.is_valid():
+            return JsonResponse({'errors': form.errors}, status=400)
+
+        export_format = form.cleaned_data['format']
+        bookings = export.iter_bookings(
+            hire_point, form.cleaned_data['start'], form.cleaned_data['end'],
+            include_archived=form.cleaned_data['include_archived']
+        )
+        response = StreamingHttpResponse(
+            export.export(bookings, export_format), content_type=export.FORMATS[export_format]
+        )
+        response['Content-Disposition'] = 'attachment; filename="bookings-%s-%s-%s.%s"' % (
+            hire_point.pk, form.cleaned_data['start'].isoformat(), form.cleaned_data['end'].isoformat(), export_format
+        )
+        return response
+
+
+class ChangesView(View):
+    """
+    A page of the bookings change feed as JSON, only for the staff
+    """
+
+    @method_decorator(staff_member_required)
+    def dispatch(self, request, *args, **kwargs):
+        return super(ChangesView, self).dispatch(request, *args, **kwargs)
+
+    def get(self, request, *args, **kwargs):
+        form = ChangesForm(request.GET)
+        if not form.is_valid():
+            return JsonResponse({'errors': form.errors}, status=400)
+        return JsonResponse(feed.get_changes(
+            cursor=form.cleaned_data['cursor'], hire_point_id=form.cleaned_data['hire_point'],
+            limit=form.cleaned_data['limit']
+        ))
+
+
+@method_decorator(routers.read_from_replica, name='get')
 class BookingSuccessfulView(DetailView):
     model = Booking
     template_name = 'hire_point/booking_successful.html'
 
+    def get_queryset(self):
+        queryset = super(BookingSuccessfulView, self).get_queryset()
+        shard = routers.get_shard(self.request.GET.get('hire_point'))
+        if shard != DEFAULT_DB_ALIAS:
+            queryset = queryset.using(shard)
+        return queryset
+
 
 class BookingUnsuccessfulView(TemplateView):
     template_name = 'hire_point/booking_unsuccessful.html'
+
+    def get_context_data(self, **kwargs):
+        context = super(BookingUnsuccessfulView, self).get_context_data(**kwargs)
+        context['message'] = FAILURE_MESSAGES.get(self.request.GET.get('reason'))
+        return context
@@ -0,0 +1,154 @@
+"""
+Single writer of the bookings of every hire point.
+
+With BOATING_BOOKING_WRITER the bookings are not written by the requests themselves but queued and written
+by one thread per hire point, several in the same transaction. The requests wait for their outcome, so
+instead of competing for the database write lock they are served in order, and when the queue is full
+they are rejected at once.
+"""
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.utils import OperationalError
+from django.utils.six.moves.queue import Full, Queue
+
+from boating import routers
+
+QUEUE_FULL = 'Too many bookings waiting'
+NOT_WRITTEN_IN_TIME = 'The booking has not been written in time'
+
+_lock = threading.Lock()
+_writers = {}
+
+
+class Job(object):
+    """
+    A function waiting to be run by a writer and its outcome
+    """
+
+    def __init__(self, function, args):
+        self.function = function
+        self.args = args
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+        self._lock = threading.Lock()
+        self._state = 'waiting'
+
+    def start(self):
+        """
+        :return: False if the job has been cancelled
+        """
+        with self._lock:
+            if self._state == 'cancelled':
+                return False
+            self._state = 'started'
+            return True
+
+    def cancel(self):
+        """
+        :return: False if the job has already been started
+        """
+        with self._lock:
+            if self._state == 'started':
+                return False
+            self._state = 'cancelled'
+            return True
+
+
+class BookingWriter(object):
+    """
+    Thread that runs the jobs of a hire point in batches, each batch in one transaction
+    and each job in a savepoint, so a failed booking does not undo the others
+    """
+
+    def __init__(self, hire_point_id=None, queue_size=None, batch_size=None):
+        """
+        :param hire_point_id: the transactions are opened in its shard
+        :param queue_size: jobs waiting, BOATING_WRITER_QUEUE_SIZE by default
+        :param batch_size: jobs run in the same transaction, BOATING_WRITER_BATCH_SIZE by default
+        """
+        self.database = routers.get_shard(hire_point_id)
+        self.queue = Queue(queue_size or getattr(settings, 'BOATING_WRITER_QUEUE_SIZE', 100))
+        self.batch_size = batch_size or getattr(settings, 'BOATING_WRITER_BATCH_SIZE', 20)
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _get_batch(self):
+        jobs = [self.queue.get()]
+        while len(jobs) < self.batch_size and not self.queue.empty():
+            jobs.append(self.queue.get())
+        return jobs
+
+    def _run(self):
+        while True:
+            jobs = self._get_batch()
+            if None in jobs:
+                _write_batch([_job for _job in jobs if _job is not None], self.database)
+                return
+            _write_batch(jobs, self.database)
+
+    def stop(self):
+        self.queue.put(None)
+        self.thread.join()
+
+
+def _write_batch(jobs, using):
+    jobs = [_job for _job in jobs if _job.start()]
+    try:
+        with transaction.atomic(using=using):
+            for job in jobs:
+                try:
+                    with transaction.atomic(using=using):
+                        job.result = job.function(*job.args)
+                except Exception as error:
+                    job.error = error
+    except Exception as error:  # the batch could not be committed
+        for job in jobs:
+            job.result = None
+            job.error = job.error or error
+    finally:
+        close_old_connections()
+        for job in jobs:
+            job.done.set()
+
+
+def get_writer(hire_point_id):
+    with _lock:
+        if hire_point_id not in _writers:
+            _writers[hire_point_id] = BookingWriter(hire_point_id)
+        return _writers[hire_point_id]
+
+
+def stop_writers():
+    """
+    Waits until every queued job is done and stops the writers
+    """
+    with _lock:
+        writers = list(_writers.values())
+        _writers.clear()
+    for writer in writers:
+        writer.stop()
+
+
+def run(hire_point_id, function, *args):
+    """
+    Runs a function in the writer of a hire point and waits for it
+    :return: What the function returns
+    :raises: What the function raises, or OperationalError if the queue is full or the job
+    has not been started within BOATING_WRITER_TIMEOUT seconds
+    """
+    job = Job(function, args)
+    try:
+        get_writer(hire_point_id).queue.put_nowait(job)
+    except Full:
+        raise OperationalError(QUEUE_FULL)
+    if not job.done.wait(getattr(settings, 'BOATING_WRITER_TIMEOUT', 10)):
+        if job.cancel():
+            raise OperationalError(NOT_WRITTEN_IN_TIME)
+        job.done.wait()  # it is being written, it will not take long
+    if job.error is not None:
+        raise job.error
+    return job.result